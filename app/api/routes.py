@@ -1,41 +1,76 @@
 """FastAPI route handlers for NeuraBuddy API."""
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from typing import Optional, List
+from datetime import datetime
+from functools import partial
+import asyncio
 import logging
+import time
 
 from app.models.schemas import (
     IngestionRequest, IngestionResponse,
     QueryRequest, QueryResponse,
-    TeachingRequest, TeachingResponse,
-    QuizStartRequest, QuizStartResponse,
+    BatchQueryRequest, BatchQueryItemResult,
+    TeachingRequest, TeachingResponse, TeachingTurn,
+    QuizStartRequest, QuizStartResponse, QuizQuestionsResponse,
     QuizAnswerRequest, QuizAnswerResponse,
     ProgressResponse, UserProgress, DifficultyLevel, SystemType,
-    FlashCardRequest, FlashCardResponse,
+    FlashCardRequest, FlashCardResponse, FlashCardDeckResponse,
     FlashCardAnswerRequest, FlashCardAnswerResponse,
     FlashCardSessionComplete, FlashCardAnalysisResponse,
+    FlashCardBatchEvaluateRequest, FlashCardBatchEvaluateResponse,
     ClinicalCaseRequest, ClinicalCaseResponse,
     ClinicalSessionStartRequest, ClinicalSessionStartResponse,
-    ClinicalSessionInteractionRequest, ClinicalSessionInteractionResponse,
+    ClinicalSessionInteractionRequest, ClinicalSessionInteractionResponse, ClinicalSessionMessage,
     StudyNotesRequest, StudyNotesResponse
 )
 from app.ingestion.document_loader import DocumentLoader
 from app.chunking.semantic_chunker import SemanticChunker
+from app.ingestion.chunk_summaries import ChunkSummarizer
 from app.rag.vector_store import VectorStore
 from app.rag.retrieval_chain import RetrievalChain
 from app.teaching.socratic_tutor import SocraticTutor
 from app.quiz.quiz_engine import QuizEngine
 from app.study.study_engine import StudyEngine
+from app.study.artifact_cache import ArtifactCache
 from app.core.config import settings
+from app.core.deadline import Deadline
+from app.core.request_keys import request_key
+from app.core.prefetch import SpeculativePrefetcher
+from app.core.single_flight import SingleFlight
+from app.core.token_stream import ThreadpoolDeltaStream
+from app.progress.event_log import LearningEventLog, QUIZ_ANSWER
 
 logger = logging.getLogger(__name__)
 
 # Initialize components (singleton pattern)
 vector_store = VectorStore()
+learning_log = LearningEventLog()
 retrieval_chain = RetrievalChain(vector_store)
-socratic_tutor = SocraticTutor(vector_store)
-quiz_engine = QuizEngine(vector_store)
-study_engine = StudyEngine(vector_store)
+prefetcher = SpeculativePrefetcher()
+chunk_summarizer = ChunkSummarizer(vector_store) if settings.chunk_summaries_enabled else None
+socratic_tutor = SocraticTutor(vector_store, prefetcher=prefetcher, summaries=chunk_summarizer)
+quiz_engine = QuizEngine(vector_store, event_log=learning_log)
+study_engine = StudyEngine(vector_store, event_log=learning_log, prefetcher=prefetcher, summaries=chunk_summarizer)
+
+# Coalesce identical concurrent requests (e.g. a whole lecture hall asking the same topic)
+query_flight = SingleFlight("query")
+flash_card_flight = SingleFlight("flash_cards")
+quiz_flight = SingleFlight("quiz_start")
+
+# Generated flash cards, notes and cases per request (several variants per key, rotated)
+artifact_cache = ArtifactCache() if settings.artifact_cache_enabled else None
+
+
+def _cached_artifact(key, generate):
+    """Serve a generated artifact from the artifact cache when it is enabled."""
+    if artifact_cache is None:
+        return generate()
+    return artifact_cache.get(key, generate)
 
 router = APIRouter()
 
@@ -141,12 +176,21 @@ async def query(request: QueryRequest):
     Query the RAG system for neuroanatomy information.
     """
     try:
-        result = retrieval_chain.process_query(
+        # Callers only share a computation run under the same time budget
+        key = request_key(
+            request.query, request.difficulty_level, request.system_filter,
+            request.clinical_only, request.use_mmr, request.timeout_seconds, vector_store.generation
+        )
+        result = await query_flight.run(
+            key,
+            retrieval_chain.process_query,
             query=request.query,
             user_id=request.user_id,
             difficulty_level=request.difficulty_level,
             system_filter=request.system_filter,
-            clinical_only=request.clinical_only
+            clinical_only=request.clinical_only,
+            use_mmr=request.use_mmr,
+            deadline=Deadline(request.timeout_seconds)
         )
         
         return QueryResponse(**result)
@@ -155,6 +199,82 @@ async def query(request: QueryRequest):
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
 
+@router.post("/query/batch")
+async def query_batch(request: BatchQueryRequest):
+    """
+    Answer many queries in one call (e.g. pre-checking a question bank).
+    
+    All queries are embedded in one request and retrieved with one vector
+    call per filter combination; answers are generated concurrently and
+    streamed back as newline-delimited JSON (one BatchQueryItemResult per
+    line) in completion order.
+    """
+    items = request.queries
+    if len(items) > settings.batch_query_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many queries: {len(items)} (max {settings.batch_query_max_items})"
+        )
+    concurrency = min(request.max_concurrency or settings.batch_query_concurrency, settings.batch_query_concurrency)
+    
+    params = [
+        {
+            "query": item.query,
+            "difficulty_level": item.difficulty_level,
+            "system_filter": item.system_filter,
+            "clinical_only": item.clinical_only,
+            "use_mmr": item.use_mmr
+        }
+        for item in items
+    ]
+    try:
+        prefetched = await run_in_threadpool(retrieval_chain.retrieve_batch, params)
+    except Exception as e:
+        logger.error(f"Error in batch retrieval: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error in batch retrieval: {str(e)}")
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def answer(index: int) -> BatchQueryItemResult:
+        queued_at = time.perf_counter()
+        async with semaphore:
+            started_at = time.perf_counter()
+            try:
+                result = await run_in_threadpool(
+                    retrieval_chain.process_query,
+                    user_id=items[index].user_id,
+                    deadline=Deadline(items[index].timeout_seconds),
+                    **params[index],
+                    **prefetched[index]
+                )
+                response, error = QueryResponse(**result), None
+            except Exception as e:
+                logger.error(f"Error processing batch query {index}: {str(e)}")
+                response, error = None, str(e)
+            finished_at = time.perf_counter()
+        return BatchQueryItemResult(
+            index=index,
+            query=items[index].query,
+            result=response,
+            error=error,
+            queued_ms=(started_at - queued_at) * 1000,
+            elapsed_ms=(finished_at - started_at) * 1000
+        )
+    
+    async def stream():
+        tasks = [asyncio.ensure_future(answer(i)) for i in range(len(items))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                yield item.model_dump_json() + "\n"
+        finally:
+            # Client went away - stop queued generations
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @router.post("/query/with-files", response_model=QueryResponse)
 async def query_with_files(
     query: str = Form(...),
@@ -217,13 +337,20 @@ async def query_with_files(
 async def teach(request: TeachingRequest):
     """
     Start or continue a Socratic teaching session.
+    
+    The response carries a session_id; send it back with the student's
+    latest answer in student_response instead of resending previous_responses.
     """
     try:
-        result = socratic_tutor.teach(
+        result = await run_in_threadpool(
+            socratic_tutor.teach_in_session,
             topic=request.topic,
             user_id=request.user_id,
             difficulty_level=request.difficulty_level,
-            previous_responses=request.previous_responses or []
+            session_id=request.session_id,
+            student_response=request.student_response,
+            previous_responses=request.previous_responses or [],
+            follow_next_step=request.follow_next_step
         )
         
         return TeachingResponse(**result)
@@ -232,18 +359,116 @@ async def teach(request: TeachingRequest):
         raise HTTPException(status_code=500, detail=f"Error in teaching: {str(e)}")
 
 
+async def _stream_turn(websocket: WebSocket, fn, *args, **kwargs):
+    """Run one streamed turn: forward deltas to the socket and return the final result."""
+    with prefetcher.foreground():
+        stream = ThreadpoolDeltaStream(fn, *args, **kwargs)
+        async for field, text in stream:
+            await websocket.send_json({"type": "delta", "field": field, "text": text})
+        return await stream.result()
+
+
+@router.websocket("/teach/ws")
+async def teach_ws(websocket: WebSocket):
+    """
+    Socratic tutoring over one WebSocket connection.
+    
+    The first message is a TeachingRequest (with session_id to resume a
+    session) and each later one a TeachingTurn with the student's answer.
+    Answers and retrieved context are kept in the tutoring session on the
+    server; a turn with follow_next_step moves the session on to the
+    next_step its last response announced. Every tutor turn is streamed as
+    {"type": "delta", "field", "text"} events, then {"type": "response",
+    "data": TeachingResponse}; failures are sent as {"type": "error", "detail"}.
+    """
+    await websocket.accept()
+    try:
+        try:
+            request = TeachingRequest(**await websocket.receive_json())
+        except (ValidationError, ValueError, TypeError) as e:
+            await websocket.send_json({"type": "error", "detail": f"Invalid start message: {e}"})
+            await websocket.close(code=1008)
+            return
+        
+        session_id = request.session_id
+        topic = request.topic
+        student_response = request.student_response
+        follow_next_step = request.follow_next_step
+        while True:
+            try:
+                result = await _stream_turn(
+                    websocket,
+                    socratic_tutor.teach_in_session,
+                    topic=topic,
+                    user_id=request.user_id,
+                    difficulty_level=request.difficulty_level,
+                    session_id=session_id,
+                    student_response=student_response,
+                    previous_responses=request.previous_responses or [],
+                    follow_next_step=follow_next_step
+                )
+                session_id = result["session_id"]
+                topic = result["topic"]
+                await websocket.send_json({"type": "response", "data": TeachingResponse(**result).model_dump(mode="json")})
+            except Exception as e:
+                logger.error(f"Error in teaching: {str(e)}")
+                await websocket.send_json({"type": "error", "detail": f"Error in teaching: {str(e)}"})
+            
+            # Wait for the student's next answer
+            while True:
+                try:
+                    turn = TeachingTurn(**await websocket.receive_json())
+                    break
+                except (ValidationError, ValueError, TypeError) as e:
+                    await websocket.send_json({"type": "error", "detail": f"Invalid message: {e}"})
+            student_response = turn.message
+            follow_next_step = turn.follow_next_step
+    except WebSocketDisconnect:
+        pass
+
+
 @router.post("/quiz/start", response_model=QuizStartResponse)
 async def start_quiz(request: QuizStartRequest):
     """
     Start a new quiz session.
     """
     try:
-        result = quiz_engine.generate_quiz(
+        # Share question generation across users with the same time budget; each user still gets their own quiz
+        key = request_key(
+            request.topic, request.difficulty_level, request.system_filter,
+            request.num_questions, request.timeout_seconds, vector_store.generation
+        )
+        deadline = Deadline(request.timeout_seconds)
+        
+        if request.progressive:
+            result = await run_in_threadpool(
+                quiz_engine.start_progressive_quiz,
+                user_id=request.user_id,
+                topic=request.topic,
+                difficulty_level=request.difficulty_level,
+                system_filter=request.system_filter,
+                num_questions=request.num_questions,
+                deadline=deadline
+            )
+            return QuizStartResponse(**result)
+        
+        def build_questions():
+            questions = quiz_engine.build_questions(
+                topic=request.topic,
+                difficulty_level=request.difficulty_level,
+                system_filter=request.system_filter,
+                num_questions=request.num_questions,
+                deadline=deadline
+            )
+            return questions, deadline.skipped_stages
+        
+        questions, skipped_stages = await quiz_flight.run(key, build_questions)
+        result = quiz_engine.create_quiz(
             user_id=request.user_id,
             topic=request.topic,
             difficulty_level=request.difficulty_level,
-            system_filter=request.system_filter,
-            num_questions=request.num_questions
+            questions=questions,
+            skipped_stages=skipped_stages
         )
         
         return QuizStartResponse(**result)
@@ -252,13 +477,29 @@ async def start_quiz(request: QuizStartRequest):
         raise HTTPException(status_code=500, detail=f"Error starting quiz: {str(e)}")
 
 
+@router.get("/quiz/{quiz_id}/questions", response_model=QuizQuestionsResponse)
+async def get_quiz_questions(quiz_id: str, user_id: str, after: int = 0):
+    """
+    Poll a progressive quiz for questions delivered after position `after`.
+    """
+    try:
+        result = await run_in_threadpool(quiz_engine.get_quiz_questions, quiz_id=quiz_id, user_id=user_id, after=after)
+        return QuizQuestionsResponse(**result)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting quiz questions: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting quiz questions: {str(e)}")
+
+
 @router.post("/quiz/answer", response_model=QuizAnswerResponse)
 async def submit_answer(request: QuizAnswerRequest):
     """
     Submit an answer to a quiz question.
     """
     try:
-        result = quiz_engine.evaluate_answer(
+        result = await run_in_threadpool(
+            quiz_engine.evaluate_answer,
             quiz_id=request.quiz_id,
             question_id=request.question_id,
             answer=request.answer,
@@ -279,10 +520,10 @@ async def get_feedback(quiz_id: str, question_id: str, user_id: str):
     Get feedback for a specific quiz question.
     """
     try:
-        if quiz_id not in quiz_engine.active_quizzes:
+        quiz = await run_in_threadpool(quiz_engine.quiz_store.get, quiz_id)
+        if quiz is None:
             raise HTTPException(status_code=404, detail="Quiz not found")
         
-        quiz = quiz_engine.active_quizzes[quiz_id]
         if quiz["user_id"] != user_id:
             raise HTTPException(status_code=403, detail="Access denied")
         
@@ -302,52 +543,40 @@ async def get_progress(user_id: str):
     """
     Get user learning progress.
     
-    Note: This is a simplified implementation. In production, use a database.
+    Reads the user's per-topic aggregates from the learning event log, so
+    the cost depends on the topics the user has studied, not on history size.
     """
     try:
-        # Simplified progress tracking (in production, use a database)
-        from datetime import datetime
-        
-        # Get quiz data for this user
-        user_quizzes = [
-            q for q in quiz_engine.active_quizzes.values()
-            if q["user_id"] == user_id
-        ]
+        # Running per-topic aggregates from the learning event log
+        aggregates = await run_in_threadpool(learning_log.get_topic_aggregates, user_id)
         
-        # Calculate progress
-        topics_studied = list(set(q["topic"] for q in user_quizzes))
+        topics_studied = sorted(set(a["topic"] for a in aggregates))
         quiz_scores = {}
         difficulty_progression = {}
+        mastery = {}
         
-        for quiz in user_quizzes:
-            topic = quiz["topic"]
-            if topic not in quiz_scores:
-                quiz_scores[topic] = []
-            
-            # Calculate average score for this quiz
-            if quiz["answers"]:
-                correct = sum(1 for a in quiz["answers"].values() if a["is_correct"])
-                total = len(quiz["questions"])
-                if total > 0:
-                    quiz_scores[topic].append(correct / total)
-            
-            difficulty_progression[topic] = quiz["difficulty_level"]
+        for a in aggregates:
+            topic = a["topic"]
+            if a["kind"] == QUIZ_ANSWER and a["events"] > 0:
+                quiz_scores[topic] = a["score"] / a["events"]
+            if a["difficulty_level"]:
+                difficulty_progression[topic] = DifficultyLevel(a["difficulty_level"])
+            score, max_score = mastery.get(topic, (0.0, 0.0))
+            mastery[topic] = (score + a["score"], max_score + a["max_score"])
         
-        # Average scores per topic
-        avg_scores = {
-            topic: sum(scores) / len(scores) if scores else 0.0
-            for topic, scores in quiz_scores.items()
-        }
+        # Overall mastery across quizzes, flash cards and clinical sessions
+        mastery = {topic: score / max_score for topic, (score, max_score) in mastery.items() if max_score > 0}
+        last_active = max((a["last_active"] for a in aggregates), default=None)
         
         progress = UserProgress(
             user_id=user_id,
             topics_studied=topics_studied,
-            quiz_scores=avg_scores,
-            difficulty_progression={k: v for k, v in difficulty_progression.items()},
+            quiz_scores=quiz_scores,
+            difficulty_progression=difficulty_progression,
             misconceptions_identified=[],  # TODO: Implement misconception tracking
-            strengths=[],  # TODO: Implement strength analysis
-            areas_for_improvement=[],  # TODO: Implement improvement analysis
-            last_active=datetime.now()
+            strengths=[topic for topic, pct in mastery.items() if pct >= 0.8],
+            areas_for_improvement=[topic for topic, pct in mastery.items() if pct < 0.6],
+            last_active=datetime.fromtimestamp(last_active) if last_active else datetime.now()
         )
         
         return ProgressResponse(progress=progress)
@@ -360,12 +589,28 @@ async def get_progress(user_id: str):
 async def generate_flash_cards(request: FlashCardRequest):
     """Generate flash cards from the knowledge base."""
     try:
-        result = study_engine.generate_flash_cards(
-            topic=request.topic,
-            num_cards=request.num_cards,
-            difficulty_level=request.difficulty_level,
-            system_filter=request.system_filter
+        key = request_key(
+            request.topic, request.num_cards, request.difficulty_level,
+            request.system_filter, vector_store.generation
         )
+        result = await flash_card_flight.run(
+            key,
+            _cached_artifact,
+            ("flash_cards",) + key,
+            partial(
+                study_engine.generate_flash_cards,
+                topic=request.topic,
+                num_cards=request.num_cards,
+                difficulty_level=request.difficulty_level,
+                system_filter=request.system_filter
+            )
+        )
+        if request.user_id:
+            # Keep the cards for spaced-repetition review; card_id links later evaluations
+            cards = await run_in_threadpool(
+                study_engine.deck.add_cards, request.user_id, result["topic"], result["flash_cards"]
+            )
+            result = {**result, "flash_cards": cards}
         return FlashCardResponse(**result)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -378,26 +623,92 @@ async def generate_flash_cards(request: FlashCardRequest):
 async def evaluate_flash_card_answer(request: FlashCardAnswerRequest):
     """Evaluate user's answer to a flash card question."""
     try:
-        result = study_engine.evaluate_flash_card_answer(
+        result = await run_in_threadpool(
+            study_engine.evaluate_flash_card_answer,
             user_answer=request.user_answer,
             correct_answer=request.correct_answer,
             question=request.question
         )
+        if request.user_id and request.card_id:
+            card = await run_in_threadpool(
+                study_engine.deck.review, request.user_id, request.card_id, result["score"]
+            )
+            if card:
+                result["next_review_at"] = datetime.fromtimestamp(card["due_at"])
         return FlashCardAnswerResponse(**result)
     except Exception as e:
         logger.error(f"Error evaluating flash card answer: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/study/flash-cards/evaluate-batch", response_model=FlashCardBatchEvaluateResponse)
+async def evaluate_flash_card_answers(request: FlashCardBatchEvaluateRequest):
+    """Evaluate a whole flash card session in one request, optionally with its analysis."""
+    try:
+        answers = [
+            {"user_answer": a.user_answer, "correct_answer": a.correct_answer, "question": a.question}
+            for a in request.answers
+        ]
+        results, graded_locally = await run_in_threadpool(study_engine.evaluate_flash_card_answers, answers)
+        
+        for a, result in zip(request.answers, results):
+            user_id = a.user_id or request.user_id
+            if user_id and a.card_id:
+                card = await run_in_threadpool(study_engine.deck.review, user_id, a.card_id, result["score"])
+                if card:
+                    result["next_review_at"] = datetime.fromtimestamp(card["due_at"])
+        
+        total_score = sum(r["score"] for r in results)
+        analysis = None
+        if request.analyze:
+            card_results = [
+                {**answer, "score": result["score"], "feedback": result["feedback"]}
+                for answer, result in zip(answers, results)
+            ]
+            analysis = await run_in_threadpool(
+                study_engine.analyze_flash_card_session,
+                topic=request.topic or "neuroanatomy",
+                total_score=total_score,
+                max_score=float(len(results)),
+                card_results=card_results,
+                user_id=request.user_id
+            )
+        
+        return FlashCardBatchEvaluateResponse(
+            results=[FlashCardAnswerResponse(**r) for r in results],
+            total_score=total_score,
+            max_score=float(len(results)),
+            graded_locally=graded_locally,
+            analysis=FlashCardAnalysisResponse(**analysis) if analysis else None
+        )
+    except Exception as e:
+        logger.error(f"Error evaluating flash card session: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/study/deck/due", response_model=FlashCardDeckResponse)
+async def get_due_flash_cards(user_id: str, limit: int = 20, topic: Optional[str] = None):
+    """Saved flash cards due for spaced-repetition review (no generation needed)."""
+    try:
+        cards = await run_in_threadpool(study_engine.deck.get_due_cards, user_id, limit, topic)
+        deck_size = await run_in_threadpool(study_engine.deck.deck_size, user_id)
+        return FlashCardDeckResponse(user_id=user_id, flash_cards=cards, deck_size=deck_size)
+    except Exception as e:
+        logger.error(f"Error getting due flash cards: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/study/flash-cards/analyze", response_model=FlashCardAnalysisResponse)
 async def analyze_flash_card_session(request: FlashCardSessionComplete):
     """Analyze completed flash card session and provide recommendations."""
     try:
-        result = study_engine.analyze_flash_card_session(
+        result = await run_in_threadpool(
+            study_engine.analyze_flash_card_session,
             topic=request.topic,
             total_score=request.total_score,
             max_score=request.max_score,
-            card_results=request.card_results
+            card_results=request.card_results,
+            user_id=request.user_id
         )
         return FlashCardAnalysisResponse(**result)
     except Exception as e:
@@ -409,11 +720,21 @@ async def analyze_flash_card_session(request: FlashCardSessionComplete):
 async def generate_clinical_case(request: ClinicalCaseRequest):
     """Generate a clinical case vignette (legacy endpoint)."""
     try:
-        result = study_engine.generate_clinical_case(
+        generate = partial(
+            study_engine.generate_clinical_case,
             topic=request.topic,
             difficulty_level=request.difficulty_level,
             system_filter=request.system_filter
         )
+        if request.topic is None:
+            # Topic-less cases come from the clinical case pool
+            result = await run_in_threadpool(generate)
+        else:
+            key = request_key(
+                "clinical_case", request.topic, request.difficulty_level,
+                request.system_filter, vector_store.generation
+            )
+            result = await run_in_threadpool(_cached_artifact, key, generate)
         return ClinicalCaseResponse(**result)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -426,10 +747,12 @@ async def generate_clinical_case(request: ClinicalCaseRequest):
 async def start_clinical_session(request: ClinicalSessionStartRequest):
     """Start an interactive clinical case simulation."""
     try:
-        result = study_engine.start_clinical_session(
+        result = await run_in_threadpool(
+            study_engine.start_clinical_session,
             topic=request.topic,
             difficulty_level=request.difficulty_level,
-            system_filter=request.system_filter
+            system_filter=request.system_filter,
+            user_id=request.user_id
         )
         return ClinicalSessionStartResponse(**result)
     except Exception as e:
@@ -441,7 +764,8 @@ async def start_clinical_session(request: ClinicalSessionStartRequest):
 async def interact_clinical_session(request: ClinicalSessionInteractionRequest):
     """Handle interaction in clinical session."""
     try:
-        result = study_engine.interact_clinical_session(
+        result = await run_in_threadpool(
+            study_engine.interact_clinical_session,
             session_id=request.session_id,
             user_message=request.user_message,
             request_hint=request.request_hint
@@ -454,15 +778,70 @@ async def interact_clinical_session(request: ClinicalSessionInteractionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.websocket("/study/clinical-session/{session_id}/ws")
+async def clinical_session_ws(websocket: WebSocket, session_id: str):
+    """
+    Interact with a clinical session (started via /study/clinical-session/start) over one WebSocket.
+    
+    Each message is a ClinicalSessionMessage. The reply is streamed as
+    {"type": "delta", "field": "ai_response" | "hint_given", "text"} events,
+    then {"type": "response", "data": ClinicalSessionInteractionResponse}.
+    Unknown or expired sessions close the connection with code 4404.
+    """
+    await websocket.accept()
+    if study_engine.clinical_sessions.get(session_id) is None:
+        await websocket.send_json({"type": "error", "detail": "Session not found"})
+        await websocket.close(code=4404)
+        return
+    try:
+        while True:
+            try:
+                message = ClinicalSessionMessage(**await websocket.receive_json())
+            except (ValidationError, ValueError, TypeError) as e:
+                await websocket.send_json({"type": "error", "detail": f"Invalid message: {e}"})
+                continue
+            try:
+                result = await _stream_turn(
+                    websocket,
+                    study_engine.interact_clinical_session,
+                    session_id=session_id,
+                    user_message=message.user_message,
+                    request_hint=message.request_hint
+                )
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                await websocket.close(code=4404)
+                return
+            except Exception as e:
+                logger.error(f"Error in clinical session interaction: {str(e)}")
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            await websocket.send_json({
+                "type": "response",
+                "data": ClinicalSessionInteractionResponse(**result).model_dump(mode="json")
+            })
+    except WebSocketDisconnect:
+        pass
+
+
 @router.post("/study/notes", response_model=StudyNotesResponse)
 async def generate_study_notes(request: StudyNotesRequest):
     """Generate study notes from the knowledge base."""
     try:
-        result = study_engine.generate_study_notes(
-            topic=request.topic,
-            difficulty_level=request.difficulty_level,
-            system_filter=request.system_filter,
-            include_summary=request.include_summary
+        key = request_key(
+            "study_notes", request.topic, request.difficulty_level,
+            request.system_filter, request.include_summary, vector_store.generation
+        )
+        result = await run_in_threadpool(
+            _cached_artifact,
+            key,
+            partial(
+                study_engine.generate_study_notes,
+                topic=request.topic,
+                difficulty_level=request.difficulty_level,
+                system_filter=request.system_filter,
+                include_summary=request.include_summary
+            )
         )
         return StudyNotesResponse(**result)
     except ValueError as e:
@@ -478,6 +857,25 @@ async def health_check():
     stats = vector_store.get_collection_stats()
     return {
         "status": "healthy",
-        "vector_store": stats
+        "vector_store": stats,
+        "coalescing": [
+            flight.get_stats()
+            for flight in (query_flight, flash_card_flight, quiz_flight)
+        ],
+        "negative_cache": retrieval_chain.negative_cache.get_stats(),
+        "question_bank": quiz_engine.question_bank.get_stats() if quiz_engine.question_bank else None,
+        "quiz_store": quiz_engine.quiz_store.get_stats(),
+        "learning_events": learning_log.get_stats(),
+        "flash_card_grading": study_engine.grader.get_stats(),
+        "clinical_sessions": study_engine.clinical_sessions.get_stats(),
+        "chunk_cache": study_engine.chunk_cache.get_stats(),
+        "clinical_case_pool": study_engine.case_pool.get_stats() if study_engine.case_pool else None,
+        "tutor_sessions": socratic_tutor.get_stats(),
+        "embedding_cache": vector_store.embedding_cache.get_stats(),
+        "retrieval_cache": vector_store.retrieval_cache.get_stats(),
+        "prefetch": prefetcher.get_stats(),
+        "chunk_summaries": chunk_summarizer.get_stats() if chunk_summarizer else None,
+        "study_notes_partials": study_engine.partial_notes.get_stats() if study_engine.partial_notes else None,
+        "artifact_cache": artifact_cache.get_stats() if artifact_cache else None
     }
 
@@ -15,6 +15,9 @@ class Settings(BaseSettings):
     # ChromaDB Configuration
     chroma_persist_dir: str = "./chroma_db"
     chroma_collection_name: str = "neurabuddy_knowledge_base"
+    kb_generation_path: Optional[str] = None  # Shared write counter; defaults to generation.db in chroma_persist_dir
+    kb_generation_poll_seconds: float = 1.0  # How often writes by other processes are picked up; 0 = never
+    kb_announce_on_startup: bool = True  # Let the question bank, chunk summaries and case pool catch up on chunks added offline
     
     # Server Configuration
     host: str = "0.0.0.0"
@@ -29,6 +32,124 @@ class Settings(BaseSettings):
     retrieval_top_k: int = 5  # Number of chunks to retrieve
     min_retrieval_score: float = 0.7  # Minimum similarity score
     
+    # Diversification (maximal marginal relevance)
+    mmr_lambda: float = 0.7  # 1.0 = pure relevance, 0.0 = pure diversity
+    mmr_fetch_multiplier: int = 4  # Candidate pool size relative to top_k
+    rag_use_mmr: bool = False  # Diversify /query retrieval
+    quiz_use_mmr: bool = True  # Quizzes need distinct chunks per question
+    study_use_mmr: bool = False  # Diversify flash cards, notes and cases
+    
+    # Negative-result cache (queries that retrieved nothing)
+    negative_cache_ttl_seconds: float = 120.0
+    negative_cache_max_entries: int = 2048
+    
+    # Query embedding and search result caches (results are keyed on the knowledge base generation)
+    embedding_cache_ttl_seconds: float = 86400.0
+    embedding_cache_max_entries: int = 4096
+    retrieval_cache_ttl_seconds: float = 600.0
+    retrieval_cache_max_entries: int = 1024
+    
+    # Speculative prefetch of likely next topics (never runs alongside foreground requests)
+    prefetch_enabled: bool = True
+    prefetch_max_pending: int = 4
+    prefetch_max_jobs_per_minute: int = 30
+    prefetch_max_generations_per_minute: int = 4  # Speculative LLM calls; 0 = retrieval only
+    prefetch_max_wait_seconds: float = 10.0  # Jobs still blocked by foreground work after this are dropped
+    tutor_response_cache_ttl_seconds: float = 3600.0  # Opening tutor turns per topic
+    tutor_response_cache_max_entries: int = 512
+    
+    # Request deadlines (seconds of budget left required for optional stages)
+    request_deadline_seconds: float = 30.0  # Default time budget per request
+    deadline_intent_min_seconds: float = 10.0  # Intent classification
+    deadline_fallback_min_seconds: float = 6.0  # Low-threshold retry and broad fallback searches
+    deadline_extra_sources_min_seconds: float = 5.0  # Below this, context is trimmed to the top sources
+    deadline_min_sources: int = 2
+    
+    # Quiz generation
+    quiz_generation_concurrency: int = 5  # Questions generated in parallel
+    quiz_question_timeout_seconds: float = 20.0
+    quiz_feedback_concurrency: int = 4  # Background LLM feedback for locally graded answers
+    
+    # Quiz storage ("memory" per process, or "sqlite" shared by all workers on the host)
+    quiz_store_backend: str = "memory"
+    quiz_store_path: str = "./data/quiz_store.db"
+    quiz_ttl_seconds: float = 86400.0  # Quizzes expire a day after their last activity
+    quiz_store_max_entries: int = 10000  # In-memory backend only
+    
+    # Learning history (quiz answers, flash-card sessions, clinical outcomes)
+    learning_events_path: str = "./data/learning_events.db"
+    
+    # Spaced-repetition flash card decks
+    flash_card_deck_path: str = "./data/flash_card_decks.db"
+    
+    # Clinical sessions (SQLite persistence when a path is set)
+    clinical_session_ttl_seconds: float = 7200.0
+    clinical_session_max_sessions: int = 1000
+    clinical_session_store_path: Optional[str] = None
+    chunk_cache_ttl_seconds: float = 3600.0  # Chunk text rehydrated for sessions by ID
+    chunk_cache_max_entries: int = 2048
+    
+    # Clinical prompt budget (recent turns verbatim, older turns summarized)
+    clinical_history_window_messages: int = 8  # Messages sent verbatim each turn
+    clinical_history_fold_batch: int = 4  # Overflowing messages folded into the summary at once
+    clinical_history_fold_concurrency: int = 2  # Background summary updates across all sessions
+    clinical_history_summary_max_chars: int = 1200
+    clinical_history_message_max_chars: int = 600
+    clinical_gathered_max_items: int = 10  # Most recent student questions kept as "information gathered"
+    clinical_context_max_chars: int = 4000  # Retrieved context sent per turn
+    
+    # Pre-generated openings for clinical sessions/cases requested without a topic
+    clinical_case_pool_enabled: bool = True
+    clinical_case_pool_size: int = 3  # Ready entries kept per (kind, system, difficulty)
+    clinical_case_pool_build_concurrency: int = 1
+    clinical_case_pool_prefill: bool = True  # Fill session openings for every difficulty at startup
+    clinical_case_pool_sample_factor: int = 3  # Candidates retrieved per chunk used, for variety
+    
+    # Socratic tutoring sessions
+    tutor_session_ttl_seconds: float = 7200.0
+    tutor_session_max_sessions: int = 1000
+    tutor_session_store_path: Optional[str] = None  # SQLite file shared by workers; defaults to clinical_session_store_path
+    tutor_topic_drift_similarity: float = 0.8  # Below this, a changed topic re-retrieves context
+    
+    # Local flash card grading (ambiguous answers still go to the LLM)
+    flash_card_local_grading: bool = True
+    flash_card_accept_similarity: float = 0.92  # Embedding similarity treated as clearly correct
+    flash_card_reject_similarity: float = 0.25  # ...and as clearly unrelated
+    
+    # Question bank (pre-generated quiz questions)
+    question_bank_enabled: bool = True
+    question_bank_path: str = "./data/question_bank.db"
+    question_bank_prebuild: bool = True  # Generate questions for new chunks in the background
+    question_bank_build_concurrency: int = 1
+    prebuild_claim_seconds: float = 900.0  # A worker's claim on prebuilding a chunk's questions or summary
+    
+    # Per-chunk summaries written at ingestion ("summary" prompts send them instead of raw chunk text)
+    chunk_summaries_enabled: bool = True
+    chunk_summaries_path: str = "./data/chunk_summaries.db"
+    chunk_summaries_concurrency: int = 2
+    chunk_summary_max_words: int = 80
+    chunk_summary_max_key_terms: int = 8
+    study_prompt_context: str = "summary"  # "summary" or "raw" for flash cards, notes, cases and the tutor
+    
+    # Study notes ("map_reduce" merges cached per-chunk partial notes, "single" sends all chunks in one prompt)
+    study_notes_mode: str = "map_reduce"
+    study_notes_partials_path: str = "./data/study_notes_partials.db"
+    study_notes_map_concurrency: int = 5  # Partial notes generated in parallel
+    study_notes_map_timeout_seconds: float = 30.0  # Slower partials are cached for later requests
+    study_notes_partial_max_words: int = 150
+    
+    # Generated artifact cache (flash cards, study notes and topic cases per request and knowledge base generation)
+    artifact_cache_enabled: bool = True
+    artifact_cache_variants: int = 3  # Variants kept per request, served round-robin
+    artifact_cache_ttl_seconds: float = 86400.0
+    artifact_cache_max_keys: int = 1000
+    artifact_cache_max_mb: float = 64.0  # Measured on the JSON form of cached results
+    artifact_cache_refill_concurrency: int = 1
+    
+    # Batch query endpoint
+    batch_query_max_items: int = 500
+    batch_query_concurrency: int = 8  # Concurrent answer generations per batch
+    
     # Optional: PostgreSQL with pgvector
     database_url: Optional[str] = None
     
@@ -0,0 +1,47 @@
+"""Per-request time budgets shared by every stage of a pipeline."""
+
+import math
+import time
+from typing import List, Optional
+
+from app.core.config import settings
+
+
+class Deadline:
+    """
+    Tracks how much of a request's time budget is left.
+    
+    Stages ask allows() before doing optional work; when the budget is too
+    tight the stage is recorded in skipped_stages so the response can say
+    what was left out.
+    """
+    
+    def __init__(self, budget_seconds: Optional[float] = None):
+        self.budget_seconds = budget_seconds if budget_seconds is not None else settings.request_deadline_seconds
+        self.expires_at = time.monotonic() + self.budget_seconds if self.budget_seconds else math.inf
+        self.skipped_stages: List[str] = []
+    
+    def remaining(self) -> float:
+        """Seconds left in the budget (inf when unbounded)."""
+        return self.expires_at - time.monotonic()
+    
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+    
+    def allows(self, stage: str, min_seconds: float) -> bool:
+        """Return True if at least min_seconds remain, otherwise record stage as skipped."""
+        if self.remaining() >= min_seconds:
+            return True
+        self.skip(stage)
+        return False
+    
+    def skip(self, stage: str) -> None:
+        if stage not in self.skipped_stages:
+            self.skipped_stages.append(stage)
+    
+    def timeout(self, floor: float = 1.0) -> Optional[float]:
+        """Per-call timeout for a downstream request, or None when unbounded."""
+        remaining = self.remaining()
+        if math.isinf(remaining):
+            return None
+        return max(remaining, floor)
@@ -0,0 +1,122 @@
+"""Budgeted background prefetching that yields to foreground requests."""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativePrefetcher:
+    """
+    Runs speculative work (warming caches for what a user is likely to ask next) under a budget.
+
+    - One background worker, and at most `max_pending` queued jobs; extra
+      submissions are dropped, as are duplicates of a queued key.
+    - At most `max_jobs_per_minute` jobs and `max_generations_per_minute`
+      speculative LLM generations (jobs ask via `allow_generation`).
+    - Jobs start only while no foreground work is in flight. Foreground
+      request handling is wrapped in `foreground()`; a job that cannot start
+      within `max_wait_seconds` is dropped.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        max_pending: Optional[int] = None,
+        max_jobs_per_minute: Optional[int] = None,
+        max_generations_per_minute: Optional[int] = None,
+        max_wait_seconds: Optional[float] = None
+    ):
+        self.enabled = settings.prefetch_enabled if enabled is None else enabled
+        self.max_pending = max_pending or settings.prefetch_max_pending
+        self.max_jobs_per_minute = max_jobs_per_minute or settings.prefetch_max_jobs_per_minute
+        self.max_generations_per_minute = (
+            settings.prefetch_max_generations_per_minute if max_generations_per_minute is None
+            else max_generations_per_minute
+        )
+        self.max_wait_seconds = max_wait_seconds or settings.prefetch_max_wait_seconds
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)  # Notified when the last foreground request ends
+        self._pending: set = set()
+        self._job_times: deque = deque()
+        self._generation_times: deque = deque()
+        self._foreground = 0
+        self.stats = {"submitted": 0, "completed": 0, "dropped": 0, "skipped_busy": 0, "failed": 0, "generations": 0}
+
+    @contextmanager
+    def foreground(self):
+        """Mark foreground work in flight; speculative jobs wait until none is."""
+        with self._lock:
+            self._foreground += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._foreground -= 1
+                if not self._foreground:
+                    self._idle.notify_all()
+
+    def submit(self, key: Hashable, job: Callable[[], Any]) -> bool:
+        """Queue a speculative job unless it is a duplicate or over budget; returns whether it was queued."""
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self._trim(self._job_times, now)
+            if (
+                key in self._pending
+                or len(self._pending) >= self.max_pending
+                or len(self._job_times) >= self.max_jobs_per_minute
+            ):
+                self.stats["dropped"] += 1
+                return False
+            self._pending.add(key)
+            self._job_times.append(now)
+            self.stats["submitted"] += 1
+        self.executor.submit(self._run, key, job)
+        return True
+
+    def allow_generation(self) -> bool:
+        """Take one unit of the speculative LLM budget, if any is left and nothing is in the foreground."""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(self._generation_times, now)
+            if self._foreground or len(self._generation_times) >= self.max_generations_per_minute:
+                return False
+            self._generation_times.append(now)
+            self.stats["generations"] += 1
+            return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "pending": len(self._pending), "foreground": self._foreground, "enabled": self.enabled}
+
+    def _run(self, key: Hashable, job: Callable[[], Any]) -> None:
+        try:
+            with self._lock:
+                if not self._idle.wait_for(lambda: not self._foreground, timeout=self.max_wait_seconds):
+                    self.stats["skipped_busy"] += 1
+                    return
+            job()
+            with self._lock:
+                self.stats["completed"] += 1
+        except Exception as e:
+            logger.warning(f"Prefetch job {key} failed: {e}")
+            with self._lock:
+                self.stats["failed"] += 1
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    @staticmethod
+    def _trim(times: deque, now: float) -> None:
+        while times and now - times[0] > 60.0:
+            times.popleft()
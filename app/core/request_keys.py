@@ -0,0 +1,39 @@
+"""Helpers for building cache and coalescing keys from request parameters."""
+
+import hashlib
+from enum import Enum
+from typing import Any, Tuple
+
+
+def normalize_text(text: Any) -> str:
+    """Lowercase and collapse whitespace so trivially different inputs share a key."""
+    if text is None:
+        return ""
+    return " ".join(str(text).lower().split()).rstrip("?.!")
+
+
+def request_key(*parts: Any) -> Tuple:
+    """
+    Build a hashable key from request parameters.
+    
+    Strings are normalized, enums reduced to their values and dicts/lists
+    converted to sorted tuples.
+    """
+    return tuple(_normalize_part(p) for p in parts)
+
+
+def _normalize_part(part: Any) -> Any:
+    if isinstance(part, Enum):
+        return part.value
+    if isinstance(part, str):
+        return normalize_text(part)
+    if isinstance(part, dict):
+        return tuple(sorted((k, _normalize_part(v)) for k, v in part.items()))
+    if isinstance(part, (list, tuple)):
+        return tuple(_normalize_part(p) for p in part)
+    return part
+
+
+def content_hash(text: str) -> str:
+    """Short stable hash of chunk content, used to version derived artifacts."""
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,59 @@
+"""Single-flight coalescing of identical in-flight requests."""
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Hashable
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Shares one in-flight computation between concurrent identical requests.
+    
+    The first caller for a key starts the work in the threadpool; callers that
+    arrive while it is still running await the same task and receive the same
+    result (or exception). The key is dropped as soon as the work finishes, so
+    nothing is cached beyond the in-flight window.
+    """
+    
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+    
+    async def run(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) once per key across concurrent callers."""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(run_in_threadpool(fn, *args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t, k=key: self._finish(k, t))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"Coalesced {self.name} request onto in-flight computation")
+        
+        # Shield so one disconnecting client does not cancel the shared work
+        return await asyncio.shield(task)
+    
+    def _finish(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Return coalescing metrics for this endpoint."""
+        total = self.executed + self.coalesced
+        return {
+            "name": self.name,
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "coalesce_rate": self.coalesced / total if total else 0.0
+        }
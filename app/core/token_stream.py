@@ -0,0 +1,152 @@
+"""Token streaming helpers: readable text out of streamed JSON, and threadpool-to-async bridging."""
+
+import asyncio
+import json
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+DeltaCallback = Callable[[str, str], None]  # (field, text)
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JsonFieldStreamer:
+    """
+    Pulls the text of selected string fields out of a JSON object while it is still being generated.
+
+    Feed it raw model tokens; `emit(field, text)` is called with the decoded text of each watched
+    field as soon as it arrives, so a client can show the reply before the JSON is complete. Other
+    keys and values are skipped, including strings that merely look like a watched key.
+    """
+
+    def __init__(self, fields: Iterable[str], emit: DeltaCallback):
+        self.fields = set(fields)
+        self.emit = emit
+        self._buffer = ""
+        self._pos = 0
+        self._field: Optional[str] = None  # Watched field whose value is being read
+
+    def feed(self, text: str) -> None:
+        self._buffer += text
+        while self._step():
+            pass
+
+    def _step(self) -> bool:
+        """Consume as much of the buffer as can be decided; returns False when more input is needed."""
+        if self._field is not None:
+            return self._read_field()
+        start = self._buffer.find('"', self._pos)
+        if start < 0:
+            self._pos = len(self._buffer)
+            return False
+        end = self._string_end(start)
+        if end is None:
+            self._pos = start
+            return False
+        # A key is a string followed by ':'; a watched key's string value is streamed
+        after = self._skip_space(end + 1)
+        if after >= len(self._buffer):
+            self._pos = start
+            return False
+        if self._buffer[after] != ":":
+            self._pos = end + 1
+            return True
+        value = self._skip_space(after + 1)
+        if value >= len(self._buffer):
+            self._pos = start
+            return False
+        key = self._buffer[start + 1:end]
+        if self._buffer[value] == '"' and key in self.fields:
+            self._field = key
+            self._pos = value + 1
+        else:
+            self._pos = after + 1
+        return True
+
+    def _read_field(self) -> bool:
+        out = []
+        i = self._pos
+        done = False
+        while i < len(self._buffer):
+            char = self._buffer[i]
+            if char == '"':
+                done = True
+                i += 1
+                break
+            if char == "\\":
+                if i + 1 >= len(self._buffer):
+                    break
+                escape = self._buffer[i + 1]
+                if escape == "u":
+                    if i + 6 > len(self._buffer):
+                        break
+                    try:
+                        out.append(json.loads(f'"{self._buffer[i:i + 6]}"'))
+                    except ValueError:
+                        pass
+                    i += 6
+                    continue
+                out.append(_ESCAPES.get(escape, escape))
+                i += 2
+                continue
+            out.append(char)
+            i += 1
+        self._pos = i
+        if out:
+            self.emit(self._field, "".join(out))
+        if done:
+            self._field = None
+        return done
+
+    def _string_end(self, start: int) -> Optional[int]:
+        """Index of the closing quote of the string opening at `start`, or None if not received yet."""
+        i = start + 1
+        while i < len(self._buffer):
+            if self._buffer[i] == "\\":
+                i += 2
+                continue
+            if self._buffer[i] == '"':
+                return i
+            i += 1
+        return None
+
+    def _skip_space(self, i: int) -> int:
+        while i < len(self._buffer) and self._buffer[i].isspace():
+            i += 1
+        return i
+
+
+class ThreadpoolDeltaStream:
+    """
+    Runs a blocking function that reports deltas through an `on_delta` keyword argument and
+    exposes those deltas to async code as they happen.
+
+        stream = ThreadpoolDeltaStream(engine.method, arg, key=value)
+        async for field, text in stream:
+            ...
+        result = await stream.result()
+    """
+
+    def __init__(self, fn: Callable[..., Any], *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+        def on_delta(field: str, text: str) -> None:
+            loop.call_soon_threadsafe(self._queue.put_nowait, (field, text))
+
+        self._task = asyncio.ensure_future(run_in_threadpool(fn, *args, on_delta=on_delta, **kwargs))
+        # Queued after every delta the function reported, so iteration ends once they are drained
+        self._task.add_done_callback(lambda _: self._queue.put_nowait(None))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Tuple[str, str]:
+        item = await self._queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    async def result(self) -> Any:
+        return await self._task
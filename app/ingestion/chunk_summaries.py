@@ -0,0 +1,248 @@
+"""Per-chunk summaries and key terms, generated once at ingestion and reused in prompts."""
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from langchain_openai import ChatOpenAI
+from langchain.prompts import ChatPromptTemplate
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.core.request_keys import content_hash
+from app.models.schemas import ChunkSummary
+from app.rag.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# Bump when the summary prompt changes so older summaries are regenerated
+SUMMARY_VERSION = 1
+
+
+class ChunkSummaryStore:
+    """
+    SQLite-backed summaries keyed by a hash of the chunk content.
+
+    A summary belongs to the exact text it was written from: edited or
+    re-ingested content hashes differently and gets its own row, and rows
+    written with an older SUMMARY_VERSION are ignored.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.chunk_summaries_path
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_summaries (
+                    chunk_hash TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    summary TEXT NOT NULL,
+                    key_terms TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS build_claims (
+                    claim_key TEXT PRIMARY KEY,
+                    claimed_at REAL NOT NULL
+                )
+            """)
+
+    def add(self, chunk_hash: str, summary: ChunkSummary) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunk_summaries VALUES (?, ?, ?, ?, ?)",
+                (chunk_hash, SUMMARY_VERSION, summary.summary, json.dumps(summary.key_terms), time.time())
+            )
+
+    def get_many(self, chunk_hashes: List[str]) -> Dict[str, ChunkSummary]:
+        """Current-version summaries for the given content hashes."""
+        if not chunk_hashes:
+            return {}
+        unique = sorted(set(chunk_hashes))
+        placeholders = ",".join("?" * len(unique))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_hash, summary, key_terms FROM chunk_summaries "
+                f"WHERE version = ? AND chunk_hash IN ({placeholders})",
+                [SUMMARY_VERSION] + unique
+            ).fetchall()
+        return {
+            chunk_hash: ChunkSummary(summary=summary, key_terms=json.loads(key_terms))
+            for chunk_hash, summary, key_terms in rows
+        }
+
+    def claim(self, claim_key: str) -> bool:
+        """
+        Claim the right to build a summary for a key, shared by every process using this database.
+
+        Returns False while another claim on the key is younger than prebuild_claim_seconds, so
+        workers hearing about the same chunks do not all generate for them; an older claim (the
+        build finished or its worker died) can be taken over.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO build_claims VALUES (?, ?) ON CONFLICT(claim_key) DO UPDATE "
+                "SET claimed_at = excluded.claimed_at WHERE build_claims.claimed_at < ?",
+                (claim_key, now, now - settings.prebuild_claim_seconds)
+            )
+        return cursor.rowcount == 1
+
+    def count(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM chunk_summaries WHERE version = ?", (SUMMARY_VERSION,)
+            ).fetchone()
+        return count
+
+
+class ChunkSummarizer:
+    """
+    Writes a compact summary and key-term list for every ingested chunk.
+
+    New chunks are summarized in the background as they are added to the
+    vector store. Prompt builders call `context_for` to send summaries
+    instead of raw chunk text; chunks without a summary yet (e.g. ingested
+    before this stage existed) are sent raw and queued for summarizing, so
+    the knowledge base backfills itself as it is used.
+    """
+
+    def __init__(self, vector_store: VectorStore, store: Optional[ChunkSummaryStore] = None):
+        self.vector_store = vector_store
+        self.store = store or ChunkSummaryStore()
+        self.llm = ChatOpenAI(
+            model=settings.openai_model,
+            temperature=0.0,
+            openai_api_key=settings.openai_api_key
+        )
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", """You condense neuroanatomy source text for later use in teaching prompts.
+Write a dense summary of at most {max_words} words that keeps every structure, pathway, blood supply,
+lesion deficit and clinical correlation in the text. Then list up to {max_terms} key terms
+(anatomical names, eponyms, syndromes) exactly as they appear.
+
+Reply with JSON only:
+{{"summary": "...", "key_terms": ["...", "..."]}}"""),
+            ("human", "{content}")
+        ])
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.chunk_summaries_concurrency,
+            thread_name_prefix="chunk-summaries"
+        )
+        self._lock = threading.Lock()
+        self._queued: set = set()  # Content hashes queued or being summarized
+        self.generated = 0
+        self.failed = 0
+        self.summary_hits = 0
+        self.raw_fallbacks = 0
+        self.vector_store.add_change_listener(self._on_chunks_changed)
+
+    def context_for(self, chunks: List[Dict[str, Any]], separator: str = "\n\n") -> str:
+        """Prompt context for chunks: summaries where available, raw text otherwise."""
+        summaries = self.lookup(chunks)
+        parts = []
+        for chunk in chunks:
+            summary = summaries.get(chunk["chunk_id"])
+            parts.append(self.render(chunk, summary) if summary else chunk["content"])
+        return separator.join(parts)
+
+    def lookup(self, chunks: List[Dict[str, Any]]) -> Dict[str, ChunkSummary]:
+        """Summaries by chunk ID; chunks without one are queued for summarizing."""
+        hashes = {chunk["chunk_id"]: content_hash(chunk["content"]) for chunk in chunks}
+        stored = self.store.get_many(list(hashes.values()))
+        found = {chunk_id: stored[h] for chunk_id, h in hashes.items() if h in stored}
+        missing = [chunk for chunk in chunks if chunk["chunk_id"] not in found]
+        with self._lock:
+            self.summary_hits += len(found)
+            self.raw_fallbacks += len(missing)
+        if missing:
+            self.schedule(missing)
+        return found
+
+    @staticmethod
+    def render(chunk: Dict[str, Any], summary: ChunkSummary) -> str:
+        structure = chunk.get("metadata", {}).get("structure_name")
+        lines = [f"Structure: {structure}"] if structure else []
+        lines.append(summary.summary)
+        if summary.key_terms:
+            lines.append(f"Key terms: {', '.join(summary.key_terms)}")
+        return "\n".join(lines)
+
+    def schedule(self, chunks: List[Dict[str, Any]]) -> None:
+        """Summarize chunks in the background, once per distinct content."""
+        for chunk in chunks:
+            chunk_hash = content_hash(chunk["content"])
+            with self._lock:
+                if chunk_hash in self._queued:
+                    continue
+                self._queued.add(chunk_hash)
+            self.executor.submit(self._summarize_and_store, chunk_hash, chunk["content"])
+
+    def summarize(self, content: str) -> Optional[ChunkSummary]:
+        """Generate the summary for one chunk's text, or None if the output does not validate."""
+        chain = self.prompt | self.llm.bind(response_format={"type": "json_object"})
+        raw = chain.invoke({
+            "content": content,
+            "max_words": settings.chunk_summary_max_words,
+            "max_terms": settings.chunk_summary_max_key_terms
+        }).content
+        match = re.search(r'\{[\s\S]*\}', raw)
+        try:
+            summary = ChunkSummary.model_validate_json(match.group() if match else raw)
+        except ValidationError as e:
+            logger.warning(f"Chunk summary failed validation: {e}")
+            return None
+        summary.key_terms = summary.key_terms[:settings.chunk_summary_max_key_terms]
+        return summary
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            used = self.summary_hits + self.raw_fallbacks
+            return {
+                "summaries": self.store.count(),
+                "queued": len(self._queued),
+                "generated": self.generated,
+                "failed": self.failed,
+                "summary_hits": self.summary_hits,
+                "raw_fallbacks": self.raw_fallbacks,
+                "summary_rate": self.summary_hits / used if used else 0.0
+            }
+
+    def _summarize_and_store(self, chunk_hash: str, content: str) -> None:
+        try:
+            if self.store.get_many([chunk_hash]) or not self.store.claim(chunk_hash):
+                return
+            summary = self.summarize(content)
+            if summary is None:
+                with self._lock:
+                    self.failed += 1
+                return
+            self.store.add(chunk_hash, summary)
+            with self._lock:
+                self.generated += 1
+        except Exception as e:
+            logger.error(f"Error summarizing chunk {chunk_hash}: {e}")
+            with self._lock:
+                self.failed += 1
+        finally:
+            with self._lock:
+                self._queued.discard(chunk_hash)
+
+    def _on_chunks_changed(self, added_ids: List[str], removed_ids: List[str]) -> None:
+        """Summarize newly ingested chunks; summaries of removed text are simply no longer looked up."""
+        if not added_ids:
+            return
+        try:
+            self.schedule(self.vector_store.get_chunks(added_ids))
+        except Exception as e:
+            logger.error(f"Chunk summaries failed to load new chunks: {e}")
@@ -1,6 +1,6 @@
 """Pydantic models for API requests and responses."""
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 from enum import Enum
@@ -63,6 +63,8 @@ class QueryRequest(BaseModel):
     difficulty_level: Optional[DifficultyLevel] = None
     system_filter: Optional[SystemType] = None
     clinical_only: bool = False
+    use_mmr: Optional[bool] = Field(default=None, description="Diversify sources with maximal marginal relevance")
+    timeout_seconds: Optional[float] = Field(default=None, gt=0, description="Time budget for this request (defaults to server setting)")
 
 
 class QueryResponse(BaseModel):
@@ -71,6 +73,23 @@ class QueryResponse(BaseModel):
     sources: List[Dict[str, Any]] = Field(..., description="Retrieved chunks with metadata")
     confidence: float = Field(..., ge=0.0, le=1.0, description="Retrieval confidence score")
     intent: QueryIntent
+    skipped_stages: List[str] = Field(default=[], description="Optional pipeline stages skipped to meet the deadline")
+
+
+class BatchQueryRequest(BaseModel):
+    """Request model for answering many queries in one call."""
+    queries: List[QueryRequest] = Field(..., min_length=1, description="Queries to answer")
+    max_concurrency: Optional[int] = Field(default=None, ge=1, description="Concurrent answer generations (capped by server setting)")
+
+
+class BatchQueryItemResult(BaseModel):
+    """One streamed result of a batch query (NDJSON line)."""
+    index: int = Field(..., description="Position of the query in the request")
+    query: str
+    result: Optional[QueryResponse] = None
+    error: Optional[str] = None
+    queued_ms: float = Field(..., description="Time spent waiting for a generation slot")
+    elapsed_ms: float = Field(..., description="Time spent answering this query")
 
 
 # ============ Teaching Models ============
@@ -81,6 +100,21 @@ class TeachingRequest(BaseModel):
     user_id: str
     difficulty_level: DifficultyLevel = DifficultyLevel.UNDERGRAD
     previous_responses: Optional[List[str]] = Field(default=[], description="User's previous answers")
+    session_id: Optional[str] = Field(default=None, description="Continue a tutoring session; answers and context are kept server-side")
+    student_response: Optional[str] = Field(default=None, description="The student's latest answer (with session_id)")
+    follow_next_step: bool = Field(default=False, description="Move the session on to the next_step of its last turn instead of topic")
+
+
+class TeachingTurn(BaseModel):
+    """Student answer (or a request to move on to the announced next step) sent on a tutoring WebSocket."""
+    message: Optional[str] = Field(default=None, min_length=1)
+    follow_next_step: bool = False
+
+    @model_validator(mode="after")
+    def _message_or_follow(self):
+        if self.message is None and not self.follow_next_step:
+            raise ValueError("message is required unless follow_next_step is set")
+        return self
 
 
 class TeachingResponse(BaseModel):
@@ -91,6 +125,8 @@ class TeachingResponse(BaseModel):
     is_complete: bool = False
     next_step: Optional[str] = None
     concepts_covered: List[str] = []
+    session_id: Optional[str] = None
+    topic: Optional[str] = None
 
 
 # ============ Quiz Models ============
@@ -109,6 +145,8 @@ class QuizStartRequest(BaseModel):
     difficulty_level: DifficultyLevel = DifficultyLevel.UNDERGRAD
     system_filter: Optional[SystemType] = None
     num_questions: int = Field(default=5, ge=1, le=20)
+    timeout_seconds: Optional[float] = Field(default=None, gt=0, description="Time budget for this request (defaults to server setting)")
+    progressive: bool = Field(default=False, description="Return as soon as the first question is ready; poll for the rest")
 
 
 class QuizQuestion(BaseModel):
@@ -122,6 +160,7 @@ class QuizQuestion(BaseModel):
     difficulty: DifficultyLevel
     learning_objective: str
     source_chunk_id: str
+    explanation: Optional[str] = None  # Why the answer is correct; used for feedback
 
 
 class QuizStartResponse(BaseModel):
@@ -130,6 +169,16 @@ class QuizStartResponse(BaseModel):
     questions: List[QuizQuestion]
     topic: str
     difficulty_level: DifficultyLevel
+    skipped_stages: List[str] = Field(default=[], description="Stages skipped to meet the deadline (e.g. remaining questions)")
+    pending_questions: int = Field(default=0, description="Questions still being generated (progressive quizzes)")
+
+
+class QuizQuestionsResponse(BaseModel):
+    """Response model for polling a progressive quiz."""
+    quiz_id: str
+    questions: List[QuizQuestion]
+    pending_questions: int
+    is_complete: bool
 
 
 class QuizAnswerRequest(BaseModel):
@@ -148,6 +197,7 @@ class QuizFeedback(BaseModel):
     correct_answer: str
     related_anatomy: str
     next_question_id: Optional[str] = None
+    feedback_pending: bool = Field(default=False, description="Detailed feedback is still being generated; fetch it from /quiz/feedback")
 
 
 class QuizAnswerResponse(BaseModel):
@@ -185,6 +235,7 @@ class FlashCardRequest(BaseModel):
     num_cards: int = 10
     difficulty_level: DifficultyLevel = DifficultyLevel.UNDERGRAD
     system_filter: Optional[SystemType] = None
+    user_id: Optional[str] = Field(default=None, description="Save the generated cards to this user's review deck")
 
 
 class FlashCardResponse(BaseModel):
@@ -198,6 +249,8 @@ class FlashCardAnswerRequest(BaseModel):
     user_answer: str
     correct_answer: str
     question: str
+    user_id: Optional[str] = None
+    card_id: Optional[str] = Field(default=None, description="Deck card to reschedule with this score")
 
 
 class FlashCardAnswerResponse(BaseModel):
@@ -206,6 +259,14 @@ class FlashCardAnswerResponse(BaseModel):
     feedback: str
     is_correct: bool
     is_partial: bool
+    next_review_at: Optional[datetime] = Field(default=None, description="When the deck card is due again")
+
+
+class FlashCardDeckResponse(BaseModel):
+    """Deck cards due for review."""
+    user_id: str
+    flash_cards: List[Dict[str, Any]]
+    deck_size: int
 
 
 class FlashCardSessionComplete(BaseModel):
@@ -214,6 +275,7 @@ class FlashCardSessionComplete(BaseModel):
     total_score: float
     max_score: float
     card_results: List[Dict[str, Any]]
+    user_id: Optional[str] = Field(default=None, description="Record the session in the user's learning history")
 
 
 class FlashCardAnalysisResponse(BaseModel):
@@ -225,6 +287,23 @@ class FlashCardAnalysisResponse(BaseModel):
     next_difficulty: str
 
 
+class FlashCardBatchEvaluateRequest(BaseModel):
+    """Request for evaluating a whole flash card session at once."""
+    answers: List[FlashCardAnswerRequest] = Field(..., min_length=1)
+    topic: Optional[str] = None
+    user_id: Optional[str] = None
+    analyze: bool = Field(default=False, description="Also return the session analysis")
+
+
+class FlashCardBatchEvaluateResponse(BaseModel):
+    """Per-card evaluations (in request order) and optional session analysis."""
+    results: List[FlashCardAnswerResponse]
+    total_score: float
+    max_score: float
+    graded_locally: int = Field(..., description="Answers graded without the LLM")
+    analysis: Optional[FlashCardAnalysisResponse] = None
+
+
 class ClinicalCaseRequest(BaseModel):
     """Request for clinical case generation."""
     topic: Optional[str] = None
@@ -244,6 +323,7 @@ class ClinicalSessionStartRequest(BaseModel):
     topic: Optional[str] = None
     difficulty_level: DifficultyLevel = DifficultyLevel.MED
     system_filter: Optional[SystemType] = None
+    user_id: Optional[str] = Field(default=None, description="Record the outcome in the user's learning history")
 
 
 class ClinicalSessionStartResponse(BaseModel):
@@ -263,6 +343,12 @@ class ClinicalSessionInteractionRequest(BaseModel):
     request_hint: bool = False
 
 
+class ClinicalSessionMessage(BaseModel):
+    """Student message sent on a clinical session WebSocket."""
+    user_message: str
+    request_hint: bool = False
+
+
 class ClinicalSessionInteractionResponse(BaseModel):
     """Response to clinical session interaction."""
     ai_response: str
@@ -278,6 +364,43 @@ class ClinicalSessionInteractionResponse(BaseModel):
     completion_data: Optional[Dict[str, Any]] = None
 
 
+class ClinicalTurnResult(BaseModel):
+    """Structured model output for one clinical session turn."""
+    response: str = Field(..., min_length=1, description="Reply shown to the student")
+    revealed_information: Optional[str] = None
+    next_stage: Optional[Literal["gathering_info", "diagnosis", "complete"]] = None
+    question_posed: Optional[str] = None
+    is_correct: Optional[bool] = None
+    guiding_questions: Optional[List[str]] = None
+    completion: Optional[Dict[str, Any]] = None  # Session analysis, filled when next_stage is "complete"
+
+    @field_validator("next_stage", mode="before")
+    @classmethod
+    def _normalize_stage(cls, value):
+        if isinstance(value, str):
+            value = value.strip().lower()
+            return value if value not in ("", "null", "none") else None
+        return value
+
+    @field_validator("guiding_questions", mode="before")
+    @classmethod
+    def _wrap_question(cls, value):
+        return [value] if isinstance(value, str) else value
+
+
+class ChunkSummary(BaseModel):
+    """Structured model output summarizing one knowledge base chunk."""
+    summary: str = Field(..., min_length=1)
+    key_terms: List[str] = Field(default_factory=list)
+
+    @field_validator("key_terms", mode="before")
+    @classmethod
+    def _split_terms(cls, value):
+        if value is None:
+            return []
+        return [t.strip() for t in value.split(",") if t.strip()] if isinstance(value, str) else value
+
+
 class ClinicalSessionCompleteResponse(BaseModel):
     """Response when clinical session is complete."""
     performance_summary: str
@@ -302,4 +425,3 @@ class StudyNotesResponse(BaseModel):
     notes: str
     topic: str
     difficulty: str
-
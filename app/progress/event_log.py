@@ -0,0 +1,128 @@
+"""Append-only log of learning events with per-user, per-topic aggregates."""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+QUIZ_ANSWER = "quiz_answer"
+FLASH_CARD_SESSION = "flash_card_session"
+CLINICAL_SESSION = "clinical_session"
+
+
+class LearningEventLog:
+    """
+    SQLite-backed learning history.
+
+    Every event is appended to `events` and, in the same transaction, folded
+    into a running aggregate row per (user_id, topic, kind). Progress reads
+    only touch a user's aggregate rows, so their cost grows with the topics
+    the user has studied rather than with the size of the history.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.learning_events_path
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode; transactions are opened explicitly
+        self._conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    max_score REAL NOT NULL,
+                    difficulty_level TEXT,
+                    details TEXT,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS topic_aggregates (
+                    user_id TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    events INTEGER NOT NULL,
+                    score REAL NOT NULL,
+                    max_score REAL NOT NULL,
+                    difficulty_level TEXT,
+                    last_active REAL NOT NULL,
+                    PRIMARY KEY (user_id, topic, kind)
+                )
+            """)
+
+    def record(
+        self,
+        user_id: str,
+        topic: str,
+        kind: str,
+        score: float,
+        max_score: float = 1.0,
+        difficulty_level: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Append an event and update the user's running aggregate for its topic."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO events (user_id, topic, kind, score, max_score, difficulty_level, details, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, topic, kind, score, max_score, difficulty_level,
+                     json.dumps(details) if details else None, now)
+                )
+                self._conn.execute("""
+                    INSERT INTO topic_aggregates (user_id, topic, kind, events, score, max_score, difficulty_level, last_active)
+                    VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, topic, kind) DO UPDATE SET
+                        events = events + 1,
+                        score = score + excluded.score,
+                        max_score = max_score + excluded.max_score,
+                        difficulty_level = COALESCE(excluded.difficulty_level, difficulty_level),
+                        last_active = excluded.last_active
+                """, (user_id, topic, kind, score, max_score, difficulty_level, now))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_topic_aggregates(self, user_id: str) -> List[Dict[str, Any]]:
+        """Running aggregates for every (topic, kind) the user has events for."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT topic, kind, events, score, max_score, difficulty_level, last_active "
+                "FROM topic_aggregates WHERE user_id = ?",
+                (user_id,)
+            ).fetchall()
+        return [
+            {
+                "topic": topic,
+                "kind": kind,
+                "events": events,
+                "score": score,
+                "max_score": max_score,
+                "difficulty_level": difficulty_level,
+                "last_active": last_active
+            }
+            for topic, kind, events, score, max_score, difficulty_level, last_active in rows
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Event log size."""
+        with self._lock:
+            events = self._conn.execute("SELECT COALESCE(MAX(event_id), 0) FROM events").fetchone()[0]
+            aggregates = self._conn.execute("SELECT COUNT(*) FROM topic_aggregates").fetchone()[0]
+        return {"events": events, "aggregates": aggregates}
@@ -0,0 +1,182 @@
+"""Persistent bank of pre-generated quiz questions."""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.models.schemas import QuizQuestion, DifficultyLevel
+
+logger = logging.getLogger(__name__)
+
+BankKey = Tuple[str, str, str]  # (chunk_id, question_type, difficulty_level)
+
+
+class QuestionBank:
+    """
+    SQLite-backed store of generated questions per chunk, question type and difficulty.
+    
+    Questions are indexed by system, difficulty_level and structure_tested for
+    topic-less quizzes, and by chunk_id so they can be invalidated when the
+    chunk changes. Each row records a hash of the chunk content it was built
+    from; a lookup with different content treats the row as stale.
+    """
+    
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.question_bank_path
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    chunk_id TEXT NOT NULL,
+                    question_type TEXT NOT NULL,
+                    difficulty_level TEXT NOT NULL,
+                    system TEXT,
+                    structure_tested TEXT,
+                    chunk_hash TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (chunk_id, question_type, difficulty_level)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS build_claims (
+                    claim_key TEXT PRIMARY KEY,
+                    claimed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_questions_lookup "
+                "ON questions (system, difficulty_level, structure_tested)"
+            )
+    
+    def add(self, question: QuizQuestion, chunk: Dict[str, Any], chunk_hash: str) -> None:
+        """Store (or replace) the question generated from a chunk."""
+        payload = question.model_dump_json(exclude={"question_id"})
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO questions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    chunk["chunk_id"],
+                    question.question_type.value,
+                    question.difficulty.value,
+                    chunk["metadata"].get("system"),
+                    question.structure_tested,
+                    chunk_hash,
+                    payload,
+                    time.time()
+                )
+            )
+    
+    def get_many(self, keys: List[BankKey], chunk_hashes: Dict[str, str]) -> Dict[BankKey, QuizQuestion]:
+        """
+        Look up questions for (chunk_id, question_type, difficulty_level) keys.
+        
+        Rows whose chunk hash no longer matches chunk_hashes are dropped.
+        """
+        if not keys:
+            return {}
+        chunk_ids = sorted({k[0] for k in keys})
+        placeholders = ",".join("?" * len(chunk_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, question_type, difficulty_level, chunk_hash, payload "
+                f"FROM questions WHERE chunk_id IN ({placeholders})",
+                chunk_ids
+            ).fetchall()
+        
+        wanted = set(keys)
+        found: Dict[BankKey, QuizQuestion] = {}
+        stale = []
+        for chunk_id, question_type, difficulty, chunk_hash, payload in rows:
+            key = (chunk_id, question_type, difficulty)
+            if key not in wanted:
+                continue
+            if chunk_hashes.get(chunk_id, chunk_hash) != chunk_hash:
+                stale.append(chunk_id)
+                continue
+            found[key] = self._load(payload)
+        
+        if stale:
+            self.invalidate_chunks(stale)
+        self.hits += len(found)
+        self.misses += len(wanted) - len(found)
+        return found
+    
+    def find(
+        self,
+        difficulty_level: DifficultyLevel,
+        system: Optional[str] = None,
+        structure_tested: Optional[str] = None,
+        limit: int = 100
+    ) -> List[QuizQuestion]:
+        """Return banked questions matching the indexed filters, most recent first."""
+        query = "SELECT payload FROM questions WHERE difficulty_level = ?"
+        params: List[Any] = [difficulty_level.value]
+        if system:
+            query += " AND system = ?"
+            params.append(system)
+        if structure_tested:
+            query += " AND structure_tested = ?"
+            params.append(structure_tested)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._load(payload) for (payload,) in rows]
+    
+    def claim(self, claim_key: str) -> bool:
+        """
+        Claim the right to build bank questions for a key, shared by every process using this database.
+
+        Returns False while another claim on the key is younger than prebuild_claim_seconds, so
+        workers hearing about the same chunks do not all generate for them; an older claim (the
+        build finished or its worker died) can be taken over.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO build_claims VALUES (?, ?) ON CONFLICT(claim_key) DO UPDATE "
+                "SET claimed_at = excluded.claimed_at WHERE build_claims.claimed_at < ?",
+                (claim_key, now, now - settings.prebuild_claim_seconds)
+            )
+        return cursor.rowcount == 1
+
+    def invalidate_chunks(self, chunk_ids: List[str]) -> int:
+        """Delete every question generated from the given chunks."""
+        if not chunk_ids:
+            return 0
+        placeholders = ",".join("?" * len(chunk_ids))
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"DELETE FROM questions WHERE chunk_id IN ({placeholders})",
+                list(chunk_ids)
+            )
+        if cursor.rowcount:
+            logger.info(f"Invalidated {cursor.rowcount} banked questions")
+        return cursor.rowcount
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "questions": count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+    
+    def _load(self, payload: str) -> QuizQuestion:
+        data = json.loads(payload)
+        data["question_id"] = "banked"  # Replaced with a fresh ID per quiz
+        return QuizQuestion(**data)
@@ -1,6 +1,10 @@
 """Quiz generation and evaluation engine."""
 
+import random
+import re
+import threading
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from typing import List, Dict, Any, Optional
 import logging
 
@@ -9,6 +13,11 @@ from langchain.prompts import ChatPromptTemplate
 from langchain.chains import LLMChain
 
 from app.core.config import settings
+from app.core.deadline import Deadline
+from app.core.request_keys import content_hash, normalize_text
+from app.quiz.question_bank import QuestionBank
+from app.quiz.quiz_store import QuizStore, create_quiz_store
+from app.progress.event_log import LearningEventLog, QUIZ_ANSWER
 from app.rag.vector_store import VectorStore
 from app.models.schemas import (
     QuizQuestionType, DifficultyLevel, SystemType,
@@ -21,16 +30,39 @@ logger = logging.getLogger(__name__)
 class QuizEngine:
     """Generates and evaluates quiz questions from knowledge base."""
     
-    def __init__(self, vector_store: VectorStore):
+    def __init__(self, vector_store: VectorStore, event_log: Optional[LearningEventLog] = None):
         self.vector_store = vector_store
+        self.event_log = event_log
         self.llm = ChatOpenAI(
             model=settings.openai_model,
             temperature=0.5,
             openai_api_key=settings.openai_api_key
         )
+        # Distinct chunks per question (MMR diversification)
+        self.use_mmr = settings.quiz_use_mmr
         
-        # Active quizzes storage (in production, use a database)
-        self.active_quizzes: Dict[str, Dict[str, Any]] = {}
+        # Bounded pool for concurrent question generation
+        self.generation_executor = ThreadPoolExecutor(
+            max_workers=settings.quiz_generation_concurrency,
+            thread_name_prefix="quiz-generation"
+        )
+        
+        # Pre-generated questions, built in the background as chunks are ingested
+        self.question_bank = QuestionBank() if settings.question_bank_enabled else None
+        self.bank_executor = ThreadPoolExecutor(
+            max_workers=settings.question_bank_build_concurrency,
+            thread_name_prefix="question-bank"
+        )
+        self.vector_store.add_change_listener(self._on_chunks_changed)
+        
+        # Explanatory feedback for locally graded answers is written in the background
+        self.feedback_executor = ThreadPoolExecutor(
+            max_workers=settings.quiz_feedback_concurrency,
+            thread_name_prefix="quiz-feedback"
+        )
+        
+        # Active quizzes, evicted after settings.quiz_ttl_seconds (SQLite backend for multiple workers)
+        self.quiz_store: QuizStore = create_quiz_store()
         
         # Question generation prompt
         self.question_prompt = ChatPromptTemplate.from_messages([
@@ -61,8 +93,6 @@ Generate a question in JSON format:
             ("human", "Generate a {question_type} question about: {topic}")
         ])
         
-        self.question_chain = LLMChain(llm=self.llm, prompt=self.question_prompt)
-        
         # Feedback generation prompt
         self.feedback_prompt = ChatPromptTemplate.from_messages([
             ("system", """You are providing feedback on a quiz answer.
@@ -105,90 +135,432 @@ Format as JSON:
         Returns:
             Quiz with questions and metadata
         """
-        quiz_id = str(uuid.uuid4())
+        questions = self.build_questions(
+            topic=topic,
+            difficulty_level=difficulty_level,
+            system_filter=system_filter,
+            num_questions=num_questions
+        )
+        return self.create_quiz(user_id, topic, difficulty_level, questions)
+
+    def build_questions(
+        self,
+        topic: Optional[str] = None,
+        difficulty_level: DifficultyLevel = DifficultyLevel.UNDERGRAD,
+        system_filter: Optional[SystemType] = None,
+        num_questions: int = 5,
+        deadline: Optional[Deadline] = None
+    ) -> List[QuizQuestion]:
+        """
+        Generate quiz questions without registering a quiz.
+        
+        The result depends only on the request parameters, so concurrent
+        identical requests from different users can share it. When the
+        deadline runs out, the questions generated so far are returned.
+        """
         query = topic or "neuroanatomy"
+        deadline = deadline or Deadline()
 
-        def fallback():
-            return self._get_hardcoded_quiz(quiz_id, user_id, topic, difficulty_level, num_questions)
+        # Topic-less quizzes can be assembled from the bank without retrieval
+        if topic is None:
+            banked = self._assemble_from_bank(difficulty_level, system_filter, num_questions)
+            if banked:
+                return banked
 
         try:
-            try:
-                filter_dict = {"difficulty_level": difficulty_level.value}
-                if system_filter:
-                    filter_dict["system"] = system_filter.value
+            retrieved_chunks = self._retrieve_quiz_chunks(
+                query, difficulty_level, system_filter, num_questions, deadline
+            )
 
-                retrieved_chunks = self.vector_store.search(
-                    query=query,
-                    top_k=num_questions * 2,
-                    filter_dict=filter_dict,
-                    min_score=0.3
+            if not retrieved_chunks:
+                return self._generate_questions_from_general_knowledge(
+                    topic, difficulty_level, num_questions
                 )
 
-                if not retrieved_chunks:
-                    retrieved_chunks = self.vector_store.search(
-                        query=query or "neuroanatomy",
-                        top_k=num_questions * 2,
-                        filter_dict=None,
-                        min_score=0.2
-                    )
-            except Exception as e:
-                logger.warning(f"Vector store search failed: {e}")
-                retrieved_chunks = []
+            # Reuse banked questions; generate only the gaps, concurrently,
+            # keeping the planned order and type rotation
+            plan = self._plan_questions(retrieved_chunks, num_questions, topic)
+            planned = self._questions_from_bank(plan, difficulty_level)
+            gaps = [i for i in range(len(plan)) if i not in planned]
+            futures = dict(zip(gaps, self._submit_questions([plan[i] for i in gaps], difficulty_level)))
 
-            if not retrieved_chunks:
-                return self._generate_quiz_from_general_knowledge(
-                    quiz_id, user_id, topic, difficulty_level, num_questions
+            done, not_done = wait(futures.values(), timeout=deadline.timeout(floor=0.0))
+            if not_done:
+                deadline.skip("remaining_questions")
+                for future in not_done:
+                    future.cancel()
+
+            for i, future in futures.items():
+                if future in done and future.result():
+                    planned[i] = future.result()
+            questions = [planned[i] for i in sorted(planned)]
+
+            if not questions and deadline.expired():
+                return self._get_hardcoded_questions(difficulty_level, num_questions)
+
+            if not questions:
+                return self._generate_questions_from_general_knowledge(
+                    topic, difficulty_level, num_questions
                 )
 
-            # Generate questions
-            questions = []
-            used_chunks = set()
+            return questions
 
-            for i in range(num_questions):
-                available_chunks = [c for c in retrieved_chunks if c["chunk_id"] not in used_chunks]
-                if not available_chunks:
+        except Exception as e:
+            logger.error(f"Quiz generation failed: {e}")
+            return self._get_hardcoded_questions(difficulty_level, num_questions)
+
+    def _retrieve_quiz_chunks(
+        self,
+        query: str,
+        difficulty_level: DifficultyLevel,
+        system_filter: Optional[SystemType],
+        num_questions: int,
+        deadline: Deadline
+    ) -> List[Dict[str, Any]]:
+        """Retrieve candidate chunks for a quiz, widening the filter if nothing matches."""
+        try:
+            filter_dict = {"difficulty_level": difficulty_level.value}
+            if system_filter:
+                filter_dict["system"] = system_filter.value
+
+            retrieved_chunks = self.vector_store.search(
+                query=query,
+                top_k=num_questions * 2,
+                filter_dict=filter_dict,
+                min_score=0.3,
+                use_mmr=self.use_mmr
+            )
+
+            if not retrieved_chunks and deadline.allows("broad_fallback", settings.deadline_fallback_min_seconds):
+                retrieved_chunks = self.vector_store.search(
+                    query=query or "neuroanatomy",
+                    top_k=num_questions * 2,
+                    filter_dict=None,
+                    min_score=0.2,
+                    use_mmr=self.use_mmr
+                )
+            return retrieved_chunks
+        except Exception as e:
+            logger.warning(f"Vector store search failed: {e}")
+            return []
+
+    def start_progressive_quiz(
+        self,
+        user_id: str,
+        topic: Optional[str] = None,
+        difficulty_level: DifficultyLevel = DifficultyLevel.UNDERGRAD,
+        system_filter: Optional[SystemType] = None,
+        num_questions: int = 5,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """
+        Register a quiz as soon as its first question is ready.
+        
+        The remaining questions keep generating in the background and are
+        added to the quiz as they finish; poll them with get_quiz_questions.
+        """
+        deadline = deadline or Deadline()
+        if topic is None:
+            banked = self._assemble_from_bank(difficulty_level, system_filter, num_questions)
+            if banked:
+                return self.create_quiz(user_id, topic, difficulty_level, banked)
+
+        retrieved_chunks = self._retrieve_quiz_chunks(
+            topic or "neuroanatomy", difficulty_level, system_filter, num_questions, deadline
+        )
+        if not retrieved_chunks:
+            # Nothing to generate incrementally; fall back to general knowledge in one go
+            questions = self._generate_questions_from_general_knowledge(topic, difficulty_level, num_questions)
+            return self.create_quiz(user_id, topic, difficulty_level, questions, deadline.skipped_stages)
+
+        plan = self._plan_questions(retrieved_chunks, num_questions, topic)
+        banked = self._questions_from_bank(plan, difficulty_level)
+        gaps = [i for i in range(len(plan)) if i not in banked]
+        result = self.create_quiz(
+            user_id, topic, difficulty_level,
+            [banked[i] for i in sorted(banked)],
+            deadline.skipped_stages,
+            pending_questions=len(gaps)
+        )
+        quiz_id = result["quiz_id"]
+        if not gaps:
+            return result
+
+        # Signalled after each delivery has been written to the store (future waiters wake
+        # before done callbacks run, so waiting on the futures could miss the question)
+        delivered = threading.Condition()
+        futures = self._submit_questions([plan[i] for i in gaps], difficulty_level)
+        for future in futures:
+            future.add_done_callback(lambda f: self._deliver_question(quiz_id, f, delivered))
+
+        # Hold the response until at least one question is available
+        with delivered:
+            while True:
+                quiz = self.quiz_store.get(quiz_id)
+                if not quiz or quiz["questions"] or not quiz["pending_questions"]:
+                    break
+                timeout = deadline.timeout(floor=0.0)
+                if timeout == 0.0:
+                    deadline.skip("first_question")
                     break
+                delivered.wait(timeout)
+
+        def ensure_questions(quiz: Dict[str, Any]) -> None:
+            if not quiz["questions"]:
+                # Nothing usable yet: serve hardcoded questions rather than an empty quiz,
+                # and stop accepting the background questions still generating
+                for question in self._get_hardcoded_questions(difficulty_level, num_questions):
+                    quiz["questions"][question.question_id] = question
+                quiz["pending_questions"] = 0
+
+        quiz = self.quiz_store.update(quiz_id, ensure_questions)
+        if quiz is not None and not quiz["pending_questions"]:
+            for future in futures:
+                future.cancel()
+        if quiz is None:
+            raise ValueError(f"Quiz {quiz_id} expired before its first question was ready")
+        result["questions"] = list(quiz["questions"].values())
+        result["pending_questions"] = quiz["pending_questions"]
+        result["skipped_stages"] = deadline.skipped_stages
+        return result
+
+    def _deliver_question(self, quiz_id: str, future: Future, delivered: threading.Condition) -> None:
+        """Add a finished background question to its quiz, unless the quiz stopped waiting for it."""
+        question = None
+        if not future.cancelled() and future.exception() is None:
+            question = future.result()
+        if question:
+            question = question.model_copy(update={"question_id": str(uuid.uuid4())})
+
+        def deliver(quiz: Dict[str, Any]) -> None:
+            if quiz["pending_questions"] <= 0:
+                return
+            quiz["pending_questions"] -= 1
+            if question:
+                quiz["questions"][question.question_id] = question
 
-                chunk = available_chunks[i % len(available_chunks)]
-                used_chunks.add(chunk["chunk_id"])
+        try:
+            self.quiz_store.update(quiz_id, deliver)
+        except Exception as e:
+            logger.error(f"Error delivering quiz question: {str(e)}")
+        finally:
+            with delivered:
+                delivered.notify_all()
 
-                question_types = [QuizQuestionType.MCQ, QuizQuestionType.SHORT_ANSWER, QuizQuestionType.CLINICAL_VIGNETTE]
-                question_type = question_types[i % len(question_types)]
+    def get_quiz_questions(
+        self,
+        quiz_id: str,
+        user_id: str,
+        after: int = 0
+    ) -> Dict[str, Any]:
+        """Return the questions delivered so far (from position `after`) and how many are pending."""
+        quiz = self.quiz_store.get(quiz_id)
+        if quiz is None:
+            raise ValueError(f"Quiz {quiz_id} not found")
 
-                question = self._generate_question(
-                    chunk=chunk,
-                    question_type=question_type,
-                    difficulty=difficulty_level,
-                    topic=topic or chunk["metadata"].get("structure_name", "neuroanatomy")
-                )
+        if quiz["user_id"] != user_id:
+            raise ValueError("User does not have access to this quiz")
 
-                if question:
-                    questions.append(question)
+        questions = list(quiz["questions"].values())[after:]
+        pending = quiz.get("pending_questions", 0)
+        return {
+            "quiz_id": quiz_id,
+            "questions": questions,
+            "pending_questions": pending,
+            "is_complete": pending == 0
+        }
 
-            if not questions:
-                return self._generate_quiz_from_general_knowledge(
-                    quiz_id, user_id, topic, difficulty_level, num_questions
-                )
+    def create_quiz(
+        self,
+        user_id: str,
+        topic: Optional[str],
+        difficulty_level: DifficultyLevel,
+        questions: List[QuizQuestion],
+        skipped_stages: Optional[List[str]] = None,
+        pending_questions: int = 0
+    ) -> Dict[str, Any]:
+        """Register a quiz for a user from already generated questions."""
+        quiz_id = str(uuid.uuid4())
+        # Fresh question IDs per quiz - the same questions may be shared by coalesced requests
+        questions = [q.model_copy(update={"question_id": str(uuid.uuid4())}) for q in questions]
 
-            self.active_quizzes[quiz_id] = {
-                "user_id": user_id,
-                "questions": {q.question_id: q for q in questions},
-                "answers": {},
-                "topic": topic or "General Neuroanatomy",
-                "difficulty_level": difficulty_level,
-                "started_at": None
-            }
+        self.quiz_store.put(quiz_id, {
+            "user_id": user_id,
+            "questions": {q.question_id: q for q in questions},
+            "answers": {},
+            "topic": topic or "General Neuroanatomy",
+            "difficulty_level": difficulty_level,
+            "started_at": None,
+            "pending_questions": pending_questions
+        })
 
-            return {
-                "quiz_id": quiz_id,
-                "questions": questions,
-                "topic": topic or "General Neuroanatomy",
-                "difficulty_level": difficulty_level
-            }
+        return {
+            "quiz_id": quiz_id,
+            "questions": questions,
+            "topic": topic or "General Neuroanatomy",
+            "difficulty_level": difficulty_level,
+            "skipped_stages": skipped_stages or [],
+            "pending_questions": pending_questions
+        }
+
+    def _plan_questions(
+        self,
+        retrieved_chunks: List[Dict[str, Any]],
+        num_questions: int,
+        topic: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """Pick a distinct chunk and a question type (MCQ, short answer, vignette rotation) per question."""
+        question_types = [QuizQuestionType.MCQ, QuizQuestionType.SHORT_ANSWER, QuizQuestionType.CLINICAL_VIGNETTE]
+        plan = []
+        used_chunks = set()
+
+        for i in range(num_questions):
+            available_chunks = [c for c in retrieved_chunks if c["chunk_id"] not in used_chunks]
+            if not available_chunks:
+                break
+
+            chunk = available_chunks[i % len(available_chunks)]
+            used_chunks.add(chunk["chunk_id"])
+
+            plan.append({
+                "chunk": chunk,
+                "question_type": question_types[i % len(question_types)],
+                "topic": topic or chunk["metadata"].get("structure_name", "neuroanatomy")
+            })
+
+        return plan
+
+    def _submit_questions(
+        self,
+        plan: List[Dict[str, Any]],
+        difficulty: DifficultyLevel
+    ) -> List[Future]:
+        """Start generating every planned question on the bounded generation pool."""
+        return [
+            self.generation_executor.submit(self._generate_and_bank_question, item, difficulty)
+            for item in plan
+        ]
+
+    def _generate_and_bank_question(
+        self,
+        item: Dict[str, Any],
+        difficulty: DifficultyLevel
+    ) -> Optional[QuizQuestion]:
+        """Generate a planned question and store it in the bank for later quizzes."""
+        question = self._generate_question(
+            chunk=item["chunk"],
+            question_type=item["question_type"],
+            difficulty=difficulty,
+            topic=item["topic"]
+        )
+        if question and self.question_bank is not None:
+            try:
+                self.question_bank.add(question, item["chunk"], content_hash(item["chunk"]["content"]))
+            except Exception as e:
+                logger.warning(f"Could not bank question: {e}")
+        return question
 
+    def _questions_from_bank(
+        self,
+        plan: List[Dict[str, Any]],
+        difficulty: DifficultyLevel
+    ) -> Dict[int, QuizQuestion]:
+        """Return banked questions for planned slots, keyed by plan index."""
+        if self.question_bank is None or not plan:
+            return {}
+        keys = [(item["chunk"]["chunk_id"], item["question_type"].value, difficulty.value) for item in plan]
+        hashes = {item["chunk"]["chunk_id"]: content_hash(item["chunk"]["content"]) for item in plan}
+        try:
+            found = self.question_bank.get_many(keys, hashes)
         except Exception as e:
-            logger.error(f"Quiz generation failed: {e}")
-            return fallback()
+            logger.warning(f"Question bank lookup failed: {e}")
+            return {}
+        return {i: found[key] for i, key in enumerate(keys) if key in found}
+
+    def _assemble_from_bank(
+        self,
+        difficulty_level: DifficultyLevel,
+        system_filter: Optional[SystemType],
+        num_questions: int
+    ) -> Optional[List[QuizQuestion]]:
+        """Build a whole quiz from the bank (type rotation, distinct chunks), or None if it has gaps."""
+        if self.question_bank is None:
+            return None
+        try:
+            candidates = self.question_bank.find(
+                difficulty_level,
+                system=system_filter.value if system_filter else None,
+                limit=num_questions * 10
+            )
+        except Exception as e:
+            logger.warning(f"Question bank lookup failed: {e}")
+            return None
+        random.shuffle(candidates)
+
+        question_types = [QuizQuestionType.MCQ, QuizQuestionType.SHORT_ANSWER, QuizQuestionType.CLINICAL_VIGNETTE]
+        questions = []
+        used_chunks = set()
+        for i in range(num_questions):
+            wanted = question_types[i % len(question_types)]
+            match = next(
+                (q for q in candidates if q.question_type == wanted and q.source_chunk_id not in used_chunks),
+                None
+            )
+            if match is None:
+                return None
+            used_chunks.add(match.source_chunk_id)
+            questions.append(match)
+        return questions
+
+    def schedule_question_bank_build(self, chunk_ids: List[str]) -> None:
+        """Pre-generate bank questions for new chunks in the background."""
+        if self.question_bank is None or not settings.question_bank_prebuild or not chunk_ids:
+            return
+        self.bank_executor.submit(self._build_question_bank, list(chunk_ids))
+
+    def _build_question_bank(self, chunk_ids: List[str]) -> None:
+        """Generate every question type for each chunk at the chunk's own difficulty."""
+        question_types = [QuizQuestionType.MCQ, QuizQuestionType.SHORT_ANSWER, QuizQuestionType.CLINICAL_VIGNETTE]
+        built = 0
+        try:
+            chunks = self.vector_store.get_chunks(chunk_ids)
+        except Exception as e:
+            logger.error(f"Question bank build failed to load chunks: {e}")
+            return
+
+        for chunk in chunks:
+            try:
+                difficulty = DifficultyLevel(chunk["metadata"].get("difficulty_level", DifficultyLevel.UNDERGRAD.value))
+            except ValueError:
+                difficulty = DifficultyLevel.UNDERGRAD
+            plan = [
+                {
+                    "chunk": chunk,
+                    "question_type": question_type,
+                    "topic": chunk["metadata"].get("structure_name", "neuroanatomy")
+                }
+                for question_type in question_types
+            ]
+            banked = self._questions_from_bank(plan, difficulty)
+            if len(banked) == len(plan):
+                continue
+            # Every worker hears about new chunks; only the one holding the claim generates
+            if not self.question_bank.claim(f"{chunk['chunk_id']}:{content_hash(chunk['content'])}"):
+                continue
+            for i, item in enumerate(plan):
+                if i not in banked and self._generate_and_bank_question(item, difficulty):
+                    built += 1
+
+        logger.info(f"Question bank: generated {built} questions for {len(chunks)} chunks")
+
+    def _on_chunks_changed(self, added_ids: List[str], removed_ids: List[str]) -> None:
+        """Keep the bank in step with the knowledge base."""
+        if self.question_bank is None:
+            return
+        if removed_ids:
+            self.question_bank.invalidate_chunks(removed_ids)
+        if added_ids:
+            self.schedule_question_bank_build(added_ids)
 
     def _generate_question(
         self,
@@ -199,12 +571,14 @@ Format as JSON:
     ) -> Optional[QuizQuestion]:
         """Generate a single question from a chunk."""
         try:
-            response_text = self.question_chain.run(
-                context=chunk["content"][:1000],  # Limit context length
-                topic=topic,
-                question_type=question_type.value,
-                difficulty=difficulty.value
-            )
+            # Per-question timeout so one slow generation cannot hold up the quiz
+            question_llm = self.llm.bind(timeout=settings.quiz_question_timeout_seconds)
+            response_text = (self.question_prompt | question_llm).invoke({
+                "context": chunk["content"][:1000],  # Limit context length
+                "topic": topic,
+                "question_type": question_type.value,
+                "difficulty": difficulty.value
+            }).content
             
             # Parse response
             question_data = self._parse_json_response(response_text)
@@ -214,9 +588,6 @@ Format as JSON:
             
             question_id = str(uuid.uuid4())
             
-            # Store explanation in metadata for feedback generation
-            explanation = question_data.get("explanation", "")
-            
             question_obj = QuizQuestion(
                 question_id=question_id,
                 question=question_data.get("question", ""),
@@ -226,12 +597,10 @@ Format as JSON:
                 structure_tested=question_data.get("structure_tested", chunk["metadata"].get("structure_name", "Unknown")),
                 difficulty=difficulty,
                 learning_objective=question_data.get("learning_objective", "Understand neuroanatomy"),
-                source_chunk_id=chunk["chunk_id"]
+                source_chunk_id=chunk["chunk_id"],
+                explanation=question_data.get("explanation", "")  # Used for feedback generation
             )
             
-            # Store explanation as attribute for later use
-            question_obj.explanation = explanation
-            
             return question_obj
         except Exception as e:
             logger.error(f"Error generating question: {str(e)}")
@@ -245,11 +614,10 @@ Format as JSON:
         user_id: str
     ) -> Dict[str, Any]:
         """Evaluate a quiz answer and provide feedback."""
-        if quiz_id not in self.active_quizzes:
+        quiz = self.quiz_store.get(quiz_id)
+        if quiz is None:
             raise ValueError(f"Quiz {quiz_id} not found")
         
-        quiz = self.active_quizzes[quiz_id]
-        
         if quiz["user_id"] != user_id:
             raise ValueError("User does not have access to this quiz")
         
@@ -258,15 +626,45 @@ Format as JSON:
         
         question = quiz["questions"][question_id]
         
-        # Generate feedback
-        feedback = self._generate_feedback(question, answer)
+        # MCQs and exact matches are graded locally; only free text needs the LLM to judge
+        is_correct = self._grade_locally(question, answer)
+        if is_correct is None:
+            feedback = self._generate_feedback(question, answer)
+        else:
+            feedback = self._local_feedback(question, is_correct)
         
-        # Store answer
-        quiz["answers"][question_id] = {
-            "answer": answer,
-            "feedback": feedback,
-            "is_correct": feedback.is_correct
-        }
+        # Store answer (a resubmission replaces it, but only the first attempt goes to the learning log)
+        first_attempt = False
+
+        def store_answer(quiz: Dict[str, Any]) -> None:
+            nonlocal first_attempt
+            first_attempt = question_id not in quiz["answers"]
+            quiz["answers"][question_id] = {
+                "answer": answer,
+                "feedback": feedback,
+                "is_correct": feedback.is_correct
+            }
+        
+        quiz = self.quiz_store.update(quiz_id, store_answer)
+        if quiz is None:
+            raise ValueError(f"Quiz {quiz_id} not found")
+        
+        if self.event_log is not None and first_attempt:
+            try:
+                self.event_log.record(
+                    user_id=user_id,
+                    topic=quiz["topic"],
+                    kind=QUIZ_ANSWER,
+                    score=1.0 if feedback.is_correct else 0.0,
+                    difficulty_level=quiz["difficulty_level"].value,
+                    details={"quiz_id": quiz_id, "question_id": question_id}
+                )
+            except Exception as e:
+                logger.error(f"Error recording quiz answer: {str(e)}")
+        
+        if feedback.feedback_pending:
+            future = self.feedback_executor.submit(self._generate_feedback, question, answer, is_correct)
+            future.add_done_callback(lambda f: self._store_feedback(quiz_id, question_id, answer, f))
         
         # Calculate score
         total_questions = len(quiz["questions"])
@@ -280,14 +678,83 @@ Format as JSON:
             "questions_answered": len(quiz["answers"])
         }
     
+    def _grade_locally(self, question: QuizQuestion, answer: str) -> Optional[bool]:
+        """Grade an answer without the LLM, or return None when it needs judgement."""
+        if not answer.strip():
+            return False
+
+        if question.question_type == QuizQuestionType.MCQ and question.options:
+            correct = self._resolve_option(question.correct_answer, question.options)
+            chosen = self._resolve_option(answer, question.options)
+            if correct is not None and chosen is not None:
+                return correct == chosen
+
+        if normalize_text(answer) == normalize_text(question.correct_answer):
+            return True
+        return None
+
+    def _resolve_option(self, text: str, options: List[str]) -> Optional[int]:
+        """Map an answer ("B", "b) Thalamus" or the option text) to an option index."""
+        normalized = normalize_text(text)
+        normalized_options = [normalize_text(o) for o in options]
+        if normalized in normalized_options:
+            return normalized_options.index(normalized)
+
+        # "b) thalamus" / "(b) thalamus" -> "thalamus"
+        stripped = re.sub(r"^\(?[a-z][).:]\s*", "", normalized)
+        stripped_options = [re.sub(r"^\(?[a-z][).:]\s*", "", o) for o in normalized_options]
+        if stripped in stripped_options:
+            return stripped_options.index(stripped)
+
+        letter = re.fullmatch(r"\(?([a-z])\)?[.:]?", normalized)
+        if letter:
+            index = ord(letter.group(1)) - ord("a")
+            if index < len(options):
+                return index
+        return None
+
+    def _local_feedback(self, question: QuizQuestion, is_correct: bool) -> QuizFeedback:
+        """Immediate feedback for a locally graded answer; the LLM version follows."""
+        return QuizFeedback(
+            is_correct=is_correct,
+            feedback="Correct!" if is_correct else "Incorrect.",
+            explanation=question.explanation or f"The correct answer is: {question.correct_answer}",
+            correct_answer=question.correct_answer,
+            related_anatomy=question.structure_tested,
+            feedback_pending=True
+        )
+
+    def _store_feedback(self, quiz_id: str, question_id: str, answer: str, future: Future) -> None:
+        """Replace the immediate feedback with the generated one, unless the answer was resubmitted."""
+        generated = None
+        if not future.cancelled() and future.exception() is None:
+            generated = future.result()
+
+        def store(quiz: Dict[str, Any]) -> None:
+            record = quiz["answers"].get(question_id)
+            if record is None or record["answer"] != answer or not record["feedback"].feedback_pending:
+                return
+            record["feedback"] = generated or record["feedback"].model_copy(update={"feedback_pending": False})
+
+        try:
+            self.quiz_store.update(quiz_id, store)
+        except Exception as e:
+            logger.error(f"Error storing quiz feedback: {str(e)}")
+
     def _generate_feedback(
         self,
         question: QuizQuestion,
-        student_answer: str
+        student_answer: str,
+        is_correct: Optional[bool] = None
     ) -> QuizFeedback:
-        """Generate feedback for a student answer."""
+        """
+        Generate feedback for a student answer.
+        
+        When the answer was already graded locally, `is_correct` overrides
+        the LLM's verdict so the score never changes after the fact.
+        """
         try:
-            explanation = getattr(question, "explanation", "")
+            explanation = question.explanation
             if not explanation:
                 explanation = f"The correct answer is {question.correct_answer} because it accurately describes the neuroanatomical structure or pathway."
             
@@ -303,7 +770,8 @@ Format as JSON:
             
             if not feedback_data:
                 # Fallback feedback
-                is_correct = student_answer.lower().strip() == question.correct_answer.lower().strip()
+                if is_correct is None:
+                    is_correct = student_answer.lower().strip() == question.correct_answer.lower().strip()
                 return QuizFeedback(
                     is_correct=is_correct,
                     feedback="Correct!" if is_correct else "Incorrect. Try again.",
@@ -313,7 +781,7 @@ Format as JSON:
                 )
             
             return QuizFeedback(
-                is_correct=feedback_data.get("is_correct", False),
+                is_correct=is_correct if is_correct is not None else feedback_data.get("is_correct", False),
                 feedback=feedback_data.get("feedback", ""),
                 explanation=feedback_data.get("explanation", ""),
                 correct_answer=question.correct_answer,
@@ -322,7 +790,8 @@ Format as JSON:
         except Exception as e:
             logger.error(f"Error generating feedback: {str(e)}")
             # Fallback
-            is_correct = student_answer.lower().strip() == question.correct_answer.lower().strip()
+            if is_correct is None:
+                is_correct = student_answer.lower().strip() == question.correct_answer.lower().strip()
             return QuizFeedback(
                 is_correct=is_correct,
                 feedback="Correct!" if is_correct else "Incorrect.",
@@ -331,14 +800,12 @@ Format as JSON:
                 related_anatomy=question.structure_tested
             )
     
-    def _generate_quiz_from_general_knowledge(
+    def _generate_questions_from_general_knowledge(
         self,
-        quiz_id: str,
-        user_id: str,
         topic: Optional[str],
         difficulty_level: DifficultyLevel,
         num_questions: int
-    ) -> Dict[str, Any]:
+    ) -> List[QuizQuestion]:
         """Generate quiz from general knowledge when KB is empty."""
         prompt = ChatPromptTemplate.from_messages([
             ("system", """Generate {num_questions} neuroanatomy quiz questions as a JSON array.
@@ -352,7 +819,7 @@ Topic: {topic}"""),
             result = chain.run(num_questions=num_questions, topic=topic or "neuroanatomy")
         except Exception as run_err:
             logger.warning(f"Quiz LLM run failed: {run_err}")
-            return self._get_hardcoded_quiz(quiz_id, user_id, topic, difficulty_level, num_questions)
+            return self._get_hardcoded_questions(difficulty_level, num_questions)
 
         import json
         import re
@@ -374,37 +841,23 @@ Topic: {topic}"""),
                     structure_tested=q.get("structure_tested", "neuroanatomy"),
                     difficulty=difficulty_level,
                     learning_objective=q.get("learning_objective", ""),
-                    source_chunk_id="general"
+                    source_chunk_id="general",
+                    explanation=q.get("explanation", "")
                 )
-                qobj.explanation = q.get("explanation", "")
                 questions.append(qobj)
-            self.active_quizzes[quiz_id] = {
-                "user_id": user_id,
-                "questions": {q.question_id: q for q in questions},
-                "answers": {},
-                "topic": topic or "General Neuroanatomy",
-                "difficulty_level": difficulty_level,
-                "started_at": None
-            }
-            return {
-                "quiz_id": quiz_id,
-                "questions": questions,
-                "topic": topic or "General Neuroanatomy",
-                "difficulty_level": difficulty_level
-            }
+            if not questions:
+                return self._get_hardcoded_questions(difficulty_level, num_questions)
+            return questions
         except Exception as e:
             logger.error(f"Fallback quiz generation failed: {e}")
             # Return hardcoded quiz so the feature never fails
-            return self._get_hardcoded_quiz(quiz_id, user_id, topic, difficulty_level, num_questions)
+            return self._get_hardcoded_questions(difficulty_level, num_questions)
 
-    def _get_hardcoded_quiz(
+    def _get_hardcoded_questions(
         self,
-        quiz_id: str,
-        user_id: str,
-        topic: Optional[str],
         difficulty_level: DifficultyLevel,
         num_questions: int
-    ) -> Dict[str, Any]:
+    ) -> List[QuizQuestion]:
         """Return a hardcoded quiz when LLM fails - ensures quiz always works."""
         questions = [
             QuizQuestion(
@@ -466,21 +919,7 @@ Topic: {topic}"""),
         questions = questions[:num_questions]
         for q in questions:
             q.explanation = f"The correct answer is {q.correct_answer}."
-
-        self.active_quizzes[quiz_id] = {
-            "user_id": user_id,
-            "questions": {q.question_id: q for q in questions},
-            "answers": {},
-            "topic": topic or "General Neuroanatomy",
-            "difficulty_level": difficulty_level,
-            "started_at": None
-        }
-        return {
-            "quiz_id": quiz_id,
-            "questions": questions,
-            "topic": topic or "General Neuroanatomy",
-            "difficulty_level": difficulty_level
-        }
+        return questions
 
     def _parse_json_response(self, response_text: str) -> Optional[Dict[str, Any]]:
         """Parse JSON from LLM response."""
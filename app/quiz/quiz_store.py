@@ -0,0 +1,253 @@
+"""Storage backends for active quizzes."""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.models.schemas import QuizQuestion, QuizFeedback, DifficultyLevel
+
+logger = logging.getLogger(__name__)
+
+QuizMutator = Callable[[Dict[str, Any]], None]
+
+
+def serialize_quiz(quiz: Dict[str, Any]) -> str:
+    """Compact JSON form of a quiz (pydantic models dumped, None fields dropped)."""
+    return json.dumps({
+        "user_id": quiz["user_id"],
+        "topic": quiz["topic"],
+        "difficulty_level": DifficultyLevel(quiz["difficulty_level"]).value,
+        "started_at": quiz.get("started_at"),
+        "pending_questions": quiz.get("pending_questions", 0),
+        "questions": [
+            q.model_dump(mode="json", exclude_none=True) for q in quiz["questions"].values()
+        ],
+        "answers": {
+            question_id: {
+                "answer": a["answer"],
+                "is_correct": a["is_correct"],
+                "feedback": a["feedback"].model_dump(mode="json", exclude_none=True)
+            }
+            for question_id, a in quiz["answers"].items()
+        }
+    }, separators=(",", ":"))
+
+
+def deserialize_quiz(payload: str) -> Dict[str, Any]:
+    """Rebuild the working form of a quiz from serialize_quiz output."""
+    data = json.loads(payload)
+    questions = [QuizQuestion(**q) for q in data["questions"]]
+    return {
+        "user_id": data["user_id"],
+        "topic": data["topic"],
+        "difficulty_level": DifficultyLevel(data["difficulty_level"]),
+        "started_at": data.get("started_at"),
+        "pending_questions": data.get("pending_questions", 0),
+        "questions": {q.question_id: q for q in questions},
+        "answers": {
+            question_id: {
+                "answer": a["answer"],
+                "is_correct": a["is_correct"],
+                "feedback": QuizFeedback(**a["feedback"])
+            }
+            for question_id, a in data["answers"].items()
+        }
+    }
+
+
+class QuizStore(ABC):
+    """
+    Interface for quiz storage keyed by quiz_id.
+
+    Quizzes are stored serialized, so `get` returns a copy; changes must go
+    through `update`, which applies a mutator atomically. Entries expire
+    `ttl_seconds` after their last write.
+    """
+
+    @abstractmethod
+    def get(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def put(self, quiz_id: str, quiz: Dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    def update(self, quiz_id: str, mutate: QuizMutator) -> Optional[Dict[str, Any]]:
+        """Apply `mutate` to the stored quiz and save it; returns the new quiz or None if missing."""
+
+    @abstractmethod
+    def delete(self, quiz_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def get_stats(self) -> Dict[str, Any]:
+        pass
+
+
+class InMemoryQuizStore(QuizStore):
+    """Per-process store; entries are kept in write order so expiry is checked from the oldest."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds or settings.quiz_ttl_seconds
+        self.max_entries = max_entries or settings.quiz_store_max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # quiz_id -> (expires_at, payload)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._evict(time.time())
+            entry = self._entries.get(quiz_id)
+        return deserialize_quiz(entry[1]) if entry else None
+
+    def put(self, quiz_id: str, quiz: Dict[str, Any]) -> None:
+        payload = serialize_quiz(quiz)
+        with self._lock:
+            self._write(quiz_id, payload)
+
+    def update(self, quiz_id: str, mutate: QuizMutator) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._evict(time.time())
+            entry = self._entries.get(quiz_id)
+            if entry is None:
+                return None
+            quiz = deserialize_quiz(entry[1])
+            mutate(quiz)
+            self._write(quiz_id, serialize_quiz(quiz))
+        return quiz
+
+    def delete(self, quiz_id: str) -> None:
+        with self._lock:
+            self._remove(quiz_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "quizzes": len(self._entries),
+                "bytes": sum(len(e[1]) for e in self._entries.values()),
+                "evictions": self.evictions
+            }
+
+    def _write(self, quiz_id: str, payload: str) -> None:
+        self._entries[quiz_id] = (time.time() + self.ttl_seconds, payload)
+        self._entries.move_to_end(quiz_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            quiz_id, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._remove(quiz_id)
+            self.evictions += 1
+
+    def _remove(self, quiz_id: str) -> None:
+        self._entries.pop(quiz_id, None)
+
+
+class SQLiteQuizStore(QuizStore):
+    """
+    Store shared by every worker process on the host.
+
+    Updates run in an IMMEDIATE transaction so concurrent writers from other
+    processes are serialized by SQLite.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, ttl_seconds: Optional[float] = None):
+        self.db_path = db_path or settings.quiz_store_path
+        self.ttl_seconds = ttl_seconds or settings.quiz_ttl_seconds
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode; transactions are opened explicitly
+        self._conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS quizzes (
+                    quiz_id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    payload TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_quizzes_expiry ON quizzes (expires_at)")
+
+    def get(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM quizzes WHERE quiz_id = ? AND expires_at > ?",
+                (quiz_id, time.time())
+            ).fetchone()
+        return deserialize_quiz(row[0]) if row else None
+
+    def put(self, quiz_id: str, quiz: Dict[str, Any]) -> None:
+        payload = serialize_quiz(quiz)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM quizzes WHERE expires_at <= ?", (now,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO quizzes (quiz_id, user_id, expires_at, payload) VALUES (?, ?, ?, ?)",
+                    (quiz_id, quiz["user_id"], now + self.ttl_seconds, payload)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update(self, quiz_id: str, mutate: QuizMutator) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT payload FROM quizzes WHERE quiz_id = ? AND expires_at > ?",
+                    (quiz_id, now)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                quiz = deserialize_quiz(row[0])
+                mutate(quiz)
+                self._conn.execute(
+                    "UPDATE quizzes SET expires_at = ?, payload = ? WHERE quiz_id = ?",
+                    (now + self.ttl_seconds, serialize_quiz(quiz), quiz_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return quiz
+
+    def delete(self, quiz_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM quizzes WHERE quiz_id = ?", (quiz_id,))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM quizzes WHERE expires_at > ?",
+                (time.time(),)
+            ).fetchone()
+        return {"backend": "sqlite", "quizzes": count, "bytes": size}
+
+
+def create_quiz_store() -> QuizStore:
+    """Build the quiz store selected by settings.quiz_store_backend."""
+    if settings.quiz_store_backend == "sqlite":
+        return SQLiteQuizStore()
+    if settings.quiz_store_backend != "memory":
+        logger.warning(f"Unknown quiz store backend '{settings.quiz_store_backend}', using memory")
+    return InMemoryQuizStore()
@@ -8,6 +8,9 @@ from langchain.prompts import ChatPromptTemplate
 from langchain.chains import LLMChain
 
 from app.core.config import settings
+from app.core.deadline import Deadline
+from app.core.request_keys import request_key
+from app.core.ttl_cache import TTLCache
 from app.rag.vector_store import VectorStore
 from app.models.schemas import QueryIntent, SystemType, DifficultyLevel
 
@@ -24,6 +27,13 @@ class RetrievalChain:
             temperature=0.1,  # Low temperature for factual accuracy
             openai_api_key=settings.openai_api_key
         )
+        self.use_mmr = settings.rag_use_mmr
+        
+        # Known misses -> total_chunks, so retries skip the whole search cascade
+        self.negative_cache = TTLCache(
+            ttl_seconds=settings.negative_cache_ttl_seconds,
+            max_entries=settings.negative_cache_max_entries
+        )
         
         # Intent classification prompt
         self.intent_prompt = ChatPromptTemplate.from_messages([
@@ -71,42 +81,70 @@ Provide a clear, accurate, and educational response based ONLY on the context ab
         user_id: Optional[str] = None,
         difficulty_level: Optional[DifficultyLevel] = None,
         system_filter: Optional[SystemType] = None,
-        clinical_only: bool = False
+        clinical_only: bool = False,
+        use_mmr: Optional[bool] = None,
+        query_embedding: Optional[List[float]] = None,
+        prefetched_chunks: Optional[List[Dict[str, Any]]] = None,
+        deadline: Optional[Deadline] = None
     ) -> Dict[str, Any]:
         """
         Process a user query through the RAG pipeline.
         
+        Args:
+            use_mmr: Diversify retrieved chunks with MMR (defaults to settings.rag_use_mmr)
+            query_embedding: Pre-computed query embedding, reused by every query search
+            prefetched_chunks: Result of the first threshold search, if already run (see retrieve_batch)
+            deadline: Request time budget; optional stages are skipped when it runs low
+        
         Returns:
-            Dict with 'answer', 'sources', 'confidence', 'intent'
+            Dict with 'answer', 'sources', 'confidence', 'intent', 'skipped_stages'
         """
-        # Step 1: Classify intent
-        intent = self._classify_intent(query)
+        deadline = deadline or Deadline()
+        use_mmr = self.use_mmr if use_mmr is None else use_mmr
         
-        # Step 2: Build filters
-        filter_dict = {}
-        if system_filter:
-            filter_dict["system"] = system_filter.value
-        if clinical_only:
-            filter_dict["clinical_relevance"] = True
-        if difficulty_level:
-            filter_dict["difficulty_level"] = difficulty_level.value
+        # Step 1: Build filters
+        filter_dict = self._build_filters(difficulty_level, system_filter, clinical_only)
+        
+        # Known miss for this query/filters/KB generation: go straight to the fallback
+        # (the intent classified on the first miss is cached with it)
+        miss_key = request_key(query, filter_dict, self.vector_store.generation)
+        cached_miss = self.negative_cache.get(miss_key)
+        if cached_miss is not None:
+            logger.info("Negative cache hit - skipping retrieval cascade")
+            cached_total_chunks, cached_intent = cached_miss
+            return self._fallback_general_knowledge(query, cached_intent, cached_total_chunks, deadline)
+        
+        # Step 2: Classify intent (optional - default intent when the budget is tight)
+        if deadline.allows("intent_classification", settings.deadline_intent_min_seconds):
+            intent = self._classify_intent(query, deadline)
+        else:
+            intent = QueryIntent.FACTUAL.value
         
         # Step 3: Retrieve relevant chunks
         # First try with normal threshold
-        retrieved_chunks = self.vector_store.search(
-            query=query,
-            top_k=settings.retrieval_top_k,
-            filter_dict=filter_dict if filter_dict else None,
-            min_score=settings.min_retrieval_score
-        )
+        if prefetched_chunks is not None:
+            retrieved_chunks = prefetched_chunks
+        else:
+            if query_embedding is None:
+                query_embedding = self.vector_store.embed_queries([query])[0]
+            retrieved_chunks = self.vector_store.search(
+                query=query,
+                top_k=settings.retrieval_top_k,
+                filter_dict=filter_dict if filter_dict else None,
+                min_score=settings.min_retrieval_score,
+                use_mmr=use_mmr,
+                query_embedding=query_embedding
+            )
         
         # If no results, try with lower threshold (in case knowledge base is sparse)
-        if not retrieved_chunks:
+        if not retrieved_chunks and deadline.allows("low_threshold_retry", settings.deadline_fallback_min_seconds):
             retrieved_chunks = self.vector_store.search(
                 query=query,
                 top_k=settings.retrieval_top_k,
                 filter_dict=filter_dict if filter_dict else None,
-                min_score=0.3  # Lower threshold for sparse knowledge bases
+                min_score=0.3,  # Lower threshold for sparse knowledge bases
+                use_mmr=use_mmr,
+                query_embedding=query_embedding
             )
         
         # Step 4: Check retrieval confidence - try fallback strategies
@@ -114,7 +152,8 @@ Provide a clear, accurate, and educational response based ONLY on the context ab
             stats = self.vector_store.get_collection_stats()
             if stats["total_chunks"] == 0:
                 # Knowledge base empty - use general knowledge for educational queries
-                return self._fallback_general_knowledge(query, intent)
+                self.negative_cache.set(miss_key, (0, intent))
+                return self._fallback_general_knowledge(query, intent, deadline=deadline)
             else:
                 # Try broader retrieval for summarize/explain type queries
                 query_lower = query.lower()
@@ -125,27 +164,45 @@ Provide a clear, accurate, and educational response based ONLY on the context ab
                 if any(w in query_lower for w in ["summarize", "summary", "key points", "main points"]):
                     broad_queries = ["key points", "main points", "summary"] + broad_queries
                 for bq in broad_queries:
+                    if not deadline.allows("broad_fallback", settings.deadline_fallback_min_seconds):
+                        break
                     retrieved_chunks = self.vector_store.search(
                         query=bq,
                         top_k=settings.retrieval_top_k * 2,
                         filter_dict=None,
-                        min_score=0.2
+                        min_score=0.2,
+                        use_mmr=use_mmr
                     )
                     if retrieved_chunks:
                         break
                 if not retrieved_chunks:
-                    return self._fallback_general_knowledge(query, intent, stats["total_chunks"])
+                    # Only a complete cascade proves a miss
+                    if not deadline.skipped_stages:
+                        self.negative_cache.set(miss_key, (stats["total_chunks"], intent))
+                    return self._fallback_general_knowledge(query, intent, stats["total_chunks"], deadline)
+        
+        # Keep only the strongest sources when there is little time left to generate
+        if (len(retrieved_chunks) > settings.deadline_min_sources
+                and not deadline.allows("extra_sources", settings.deadline_extra_sources_min_seconds)):
+            retrieved_chunks = sorted(retrieved_chunks, key=lambda c: c["score"], reverse=True)[:settings.deadline_min_sources]
         
         # Calculate average confidence
         avg_confidence = sum(chunk["score"] for chunk in retrieved_chunks) / len(retrieved_chunks)
         
-        # Step 5: Generate answer from context
+        # Step 5: Generate answer from context (partial, extractive answer if out of time)
         context = self._format_context(retrieved_chunks)
         
-        answer = self.answer_chain.run(
-            context=context,
-            query=query
-        )
+        answer = None
+        if not deadline.expired():
+            try:
+                answer = self._run_chain(self.answer_chain, deadline, context=context, query=query)
+            except Exception as e:
+                if not deadline.expired():
+                    raise
+                logger.warning(f"Answer generation timed out: {str(e)}")
+        if answer is None:
+            deadline.skip("generation")
+            answer = self._partial_answer(retrieved_chunks)
         
         # Format sources - include content for frontend display
         sources = [
@@ -165,13 +222,92 @@ Provide a clear, accurate, and educational response based ONLY on the context ab
             "answer": answer,
             "sources": sources,
             "confidence": avg_confidence,
-            "intent": QueryIntent(intent.strip().lower())
+            "intent": QueryIntent(intent.strip().lower()),
+            "skipped_stages": deadline.skipped_stages
         }
     
-    def _classify_intent(self, query: str) -> str:
+    def retrieve_batch(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Run the first retrieval step for many queries at once.
+        
+        All queries are embedded in a single embeddings request, and queries
+        sharing the same filters are searched with one multi-query vector call.
+        
+        Args:
+            requests: Dicts with process_query keyword arguments
+                ('query', 'difficulty_level', 'system_filter', 'clinical_only', 'use_mmr')
+        
+        Returns:
+            Per request, in order: {'query_embedding': [...], 'prefetched_chunks': [...]},
+            ready to be passed to process_query
+        """
+        embeddings = self.vector_store.embed_queries([r["query"] for r in requests])
+        
+        # Group requests that can share a vector call
+        groups: Dict[Any, List[int]] = {}
+        for i, r in enumerate(requests):
+            filter_dict = self._build_filters(
+                r.get("difficulty_level"), r.get("system_filter"), r.get("clinical_only", False)
+            )
+            use_mmr = self.use_mmr if r.get("use_mmr") is None else r["use_mmr"]
+            groups.setdefault((tuple(sorted(filter_dict.items())), use_mmr), []).append(i)
+        
+        prefetched: List[Optional[List[Dict[str, Any]]]] = [None] * len(requests)
+        for (filter_items, use_mmr), indexes in groups.items():
+            filter_dict = dict(filter_items)
+            results = self.vector_store.search_batch(
+                query_embeddings=[embeddings[i] for i in indexes],
+                top_k=settings.retrieval_top_k,
+                filter_dict=filter_dict if filter_dict else None,
+                min_score=settings.min_retrieval_score,
+                use_mmr=use_mmr
+            )
+            for i, chunks in zip(indexes, results):
+                prefetched[i] = chunks
+        
+        return [
+            {"query_embedding": embeddings[i], "prefetched_chunks": prefetched[i]}
+            for i in range(len(requests))
+        ]
+    
+    def _build_filters(
+        self,
+        difficulty_level: Optional[DifficultyLevel],
+        system_filter: Optional[SystemType],
+        clinical_only: bool
+    ) -> Dict[str, Any]:
+        """Build metadata filters for a query."""
+        filter_dict = {}
+        if system_filter:
+            filter_dict["system"] = system_filter.value
+        if clinical_only:
+            filter_dict["clinical_relevance"] = True
+        if difficulty_level:
+            filter_dict["difficulty_level"] = difficulty_level.value
+        return filter_dict
+    
+    def _run_chain(self, chain: LLMChain, deadline: Deadline, **inputs) -> str:
+        """Run an LLM chain with the request's remaining time as the call timeout."""
+        timeout = deadline.timeout()
+        if timeout is None:
+            return chain.run(**inputs)
+        return (chain.prompt | chain.llm.bind(timeout=timeout)).invoke(inputs).content
+    
+    def _partial_answer(self, chunks: List[Dict[str, Any]]) -> str:
+        """Extractive answer from the top sources, used when there is no time left to generate."""
+        lines = ["I ran out of time to compose a full answer. The most relevant passages in the knowledge base are:", ""]
+        for chunk in chunks[:3]:
+            structure = chunk["metadata"].get("structure_name", "Source")
+            lines.append(f"- **{structure}**: {chunk['content'][:300].strip()}...")
+        return "\n".join(lines)
+    
+    def _classify_intent(self, query: str, deadline: Optional[Deadline] = None) -> str:
         """Classify the intent of a user query."""
         try:
-            intent = self.intent_chain.run(query=query)
+            if deadline is not None:
+                intent = self._run_chain(self.intent_chain, deadline, query=query)
+            else:
+                intent = self.intent_chain.run(query=query)
             return intent.strip().lower()
         except Exception as e:
             logger.error(f"Error classifying intent: {str(e)}")
@@ -181,9 +317,11 @@ Provide a clear, accurate, and educational response based ONLY on the context ab
         self,
         query: str,
         intent: str,
-        total_chunks: int = 0
+        total_chunks: int = 0,
+        deadline: Optional[Deadline] = None
     ) -> Dict[str, Any]:
         """Use LLM general knowledge when KB is empty or retrieval fails for summarize/explain queries."""
+        deadline = deadline or Deadline()
         fallback_prompt = ChatPromptTemplate.from_messages([
             ("system", """You are NeuraBuddy, an expert neuroanatomy teaching assistant.
 The user asked: {query}
@@ -201,12 +339,23 @@ Format with markdown: **bold** for key terms, bullet points (- ) for lists."""),
             context = "The user has not uploaded any documents yet."
         else:
             context = f"Retrieval found no direct matches, but the knowledge base has {total_chunks} chunks."
-        answer = fallback_chain.run(query=query, context=context)
+        answer = None
+        if not deadline.expired():
+            try:
+                answer = self._run_chain(fallback_chain, deadline, query=query, context=context)
+            except Exception as e:
+                if not deadline.expired():
+                    raise
+                logger.warning(f"General knowledge fallback timed out: {str(e)}")
+        if answer is None:
+            deadline.skip("generation")
+            answer = "I couldn't find this in the knowledge base and ran out of time to answer from general knowledge. Please try again."
         return {
             "answer": answer,
             "sources": [],
             "confidence": 0.5,
-            "intent": QueryIntent(intent.strip().lower()) if intent else QueryIntent.FACTUAL
+            "intent": QueryIntent(intent.strip().lower()) if intent else QueryIntent.FACTUAL,
+            "skipped_stages": deadline.skipped_stages
         }
 
     def _format_context(self, chunks: List[Dict[str, Any]]) -> str:
@@ -1,14 +1,21 @@
 """Vector database setup and management using ChromaDB."""
 
+import os
+import sqlite3
+import threading
+import time
 import uuid
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional, Set
 import logging
 
 import chromadb
+import numpy as np
 from chromadb.config import Settings
 from langchain_openai import OpenAIEmbeddings
 
 from app.core.config import settings
+from app.core.request_keys import request_key
+from app.core.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +44,37 @@ class VectorStore:
             metadata={"hnsw:space": "cosine"}
         )
         
+        # Knowledge base generation - a counter persisted next to the collection and
+        # bumped on every write (by any process), so caches and coalesced requests
+        # keyed on it never outlive the content they saw
+        self._generation_lock = threading.RLock()
+        generation_path = settings.kb_generation_path or os.path.join(settings.chroma_persist_dir, "generation.db")
+        self._generation_conn = sqlite3.connect(generation_path, check_same_thread=False)
+        with self._generation_lock, self._generation_conn:
+            self._generation_conn.execute("PRAGMA journal_mode=WAL")
+            self._generation_conn.execute(
+                "CREATE TABLE IF NOT EXISTS kb_generation (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self._generation_conn.execute(
+                "INSERT OR IGNORE INTO kb_generation VALUES (?, 0)", (settings.chroma_collection_name,)
+            )
+        
+        # Callbacks notified with (added_ids, removed_ids) after every write
+        self._change_listeners: List[Callable[[List[str], List[str]], None]] = []
+        # Chunk IDs as of the last generation this process has seen; writes made by other
+        # processes (e.g. scripts/ingest_documents.py) are diffed against it and announced
+        self._seen_generation = self._read_generation()
+        self._known_ids: Set[str] = self._stored_ids()
+        # Other processes' writes are picked up by a background poll, so reading
+        # the generation (done on the event loop) stays an attribute access
+        if settings.kb_generation_poll_seconds > 0:
+            threading.Thread(target=self._watch_generation, name="kb-generation", daemon=True).start()
+        
+        # Query embeddings do not depend on the knowledge base; search results
+        # are keyed on the generation so writes invalidate them
+        self.embedding_cache = TTLCache(settings.embedding_cache_ttl_seconds, settings.embedding_cache_max_entries)
+        self.retrieval_cache = TTLCache(settings.retrieval_cache_ttl_seconds, settings.retrieval_cache_max_entries)
+        
         logger.info(f"Initialized vector store: {settings.chroma_collection_name}")
     
     def add_chunks(
@@ -95,6 +133,7 @@ class VectorStore:
             documents=texts,
             metadatas=metadatas
         )
+        self._record_write(chunk_ids, [])
         
         logger.info(f"Added {len(chunks)} chunks to vector store")
         
@@ -105,7 +144,11 @@ class VectorStore:
         query: str,
         top_k: int = None,
         filter_dict: Optional[Dict[str, Any]] = None,
-        min_score: Optional[float] = None
+        min_score: Optional[float] = None,
+        use_mmr: bool = False,
+        fetch_k: Optional[int] = None,
+        mmr_lambda: Optional[float] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         Search for similar chunks.
@@ -115,11 +158,78 @@ class VectorStore:
             top_k: Number of results to return
             filter_dict: Metadata filters (e.g., {"system": "brainstem"})
             min_score: Minimum similarity score (0-1)
+            use_mmr: Diversify results with maximal marginal relevance
+            fetch_k: Candidate pool size for MMR (defaults to top_k * mmr_fetch_multiplier)
+            mmr_lambda: Relevance/diversity trade-off for MMR (defaults to settings.mmr_lambda)
+            query_embedding: Pre-computed embedding of `query` (skips the embedding call)
         
         Returns:
             List of result dicts with 'content', 'metadata', and 'score'
         """
+        # Keyed on the query text; a supplied embedding is always the embedding of that text
+        cache_key = request_key(query, top_k, filter_dict, min_score, use_mmr, fetch_k, mmr_lambda, self.generation)
+        cached = self.retrieval_cache.get(cache_key)
+        if cached is not None:
+            return [dict(chunk) for chunk in cached]
+        if query_embedding is None:
+            query_embedding = self.embed_queries([query])[0]
+        
+        results = self.search_batch(
+            query_embeddings=[query_embedding],
+            top_k=top_k,
+            filter_dict=filter_dict,
+            min_score=min_score,
+            use_mmr=use_mmr,
+            fetch_k=fetch_k,
+            mmr_lambda=mmr_lambda
+        )[0]
+        
+        logger.info(f"Retrieved {len(results)} chunks for query")
+        
+        self.retrieval_cache.set(cache_key, [dict(chunk) for chunk in results])
+        return results
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed many queries in a single embeddings request (cached per query text)."""
+        if not queries:
+            return []
+        vectors = [self.embedding_cache.get(query) for query in queries]
+        missing = list(dict.fromkeys(query for query, vector in zip(queries, vectors) if vector is None))
+        if missing:
+            computed = dict(zip(missing, self.embeddings.embed_documents(missing)))
+            for query, vector in computed.items():
+                self.embedding_cache.set(query, vector)
+            vectors = [computed[query] if vector is None else vector for query, vector in zip(queries, vectors)]
+        return vectors
+    
+    def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = None,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        min_score: Optional[float] = None,
+        use_mmr: bool = False,
+        fetch_k: Optional[int] = None,
+        mmr_lambda: Optional[float] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several pre-embedded queries in one vector database call.
+        
+        All queries share the same filters and options; see search() for the
+        meaning of each argument.
+        
+        Returns:
+            One list of result dicts per query embedding, in input order
+        """
+        if not query_embeddings:
+            return []
+        
         top_k = top_k or settings.retrieval_top_k
+        n_results = top_k
+        include = ["documents", "metadatas", "distances"]
+        if use_mmr:
+            n_results = max(fetch_k or top_k * settings.mmr_fetch_multiplier, top_k)
+            include.append("embeddings")
         
         # Build where clause for filtering
         where = None
@@ -127,53 +237,208 @@ class VectorStore:
             where = {}
             for key, value in filter_dict.items():
                 where[key] = value
+            # ChromaDB takes a single condition per where clause; combine several with $and
+            if len(where) > 1:
+                where = {"$and": [{key: value} for key, value in where.items()]}
         
-        # Compute query embedding
-        query_embedding = self.embeddings.embed_query(query)
-        
-        # Search using ChromaDB with pre-computed embedding
+        # Search using ChromaDB with pre-computed embeddings
         results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            where=where if where else None
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where if where else None,
+            include=include
         )
         
-        # Format results
-        formatted_results = []
-        
-        if results["ids"] and len(results["ids"][0]) > 0:
-            for i in range(len(results["ids"][0])):
-                # Calculate similarity score (ChromaDB uses cosine distance)
-                # Convert distance to similarity: similarity = 1 - distance
-                distances = results.get("distances", [[]])
-                distance = distances[0][i] if distances and distances[0] else 1.0
-                score = 1.0 - distance  # Convert distance to similarity
-                
-                # Apply minimum score filter
-                if min_score and score < min_score:
-                    continue
-                
-                chunk_id = results["ids"][0][i]
-                content = results["documents"][0][i]
-                metadata = results["metadatas"][0][i] if results["metadatas"] else {}
-                
-                formatted_results.append({
-                    "chunk_id": chunk_id,
-                    "content": content,
-                    "metadata": metadata,
-                    "score": score
-                })
-        
-        logger.info(f"Retrieved {len(formatted_results)} chunks for query")
-        
-        return formatted_results
+        all_results = []
+        for q, query_embedding in enumerate(query_embeddings):
+            # Format results
+            formatted_results = []
+            candidate_embeddings = []
+            
+            ids = results["ids"][q] if results["ids"] else []
+            if len(ids) > 0:
+                embeddings = results.get("embeddings") if use_mmr else None
+                for i in range(len(ids)):
+                    # Calculate similarity score (ChromaDB uses cosine distance)
+                    # Convert distance to similarity: similarity = 1 - distance
+                    distances = results.get("distances", [[]])
+                    distance = distances[q][i] if distances and len(distances[q]) > 0 else 1.0
+                    score = 1.0 - distance  # Convert distance to similarity
+                    
+                    # Apply minimum score filter
+                    if min_score and score < min_score:
+                        continue
+                    
+                    chunk_id = ids[i]
+                    content = results["documents"][q][i]
+                    metadata = results["metadatas"][q][i] if results["metadatas"] else {}
+                    
+                    formatted_results.append({
+                        "chunk_id": chunk_id,
+                        "content": content,
+                        "metadata": metadata,
+                        "score": score
+                    })
+                    if embeddings is not None:
+                        candidate_embeddings.append(embeddings[q][i])
+            
+            if use_mmr and len(formatted_results) > top_k and len(candidate_embeddings) == len(formatted_results):
+                selected = self._mmr_select(
+                    query_embedding,
+                    candidate_embeddings,
+                    top_k,
+                    settings.mmr_lambda if mmr_lambda is None else mmr_lambda
+                )
+                formatted_results = [formatted_results[i] for i in selected]
+            else:
+                formatted_results = formatted_results[:top_k]
+            
+            all_results.append(formatted_results)
+        
+        return all_results
+    
+    def _mmr_select(
+        self,
+        query_embedding: List[float],
+        candidate_embeddings: List[List[float]],
+        k: int,
+        lambda_mult: float
+    ) -> List[int]:
+        """
+        Pick k diverse candidates with maximal marginal relevance.
+        
+        Each step selects the candidate maximizing
+        lambda * sim(query, doc) - (1 - lambda) * max sim(doc, selected),
+        so near-duplicate chunks (overlap, repeated uploads) are pushed down.
+        
+        Returns:
+            Indices into candidate_embeddings, in selection order
+        """
+        docs = np.asarray(candidate_embeddings, dtype=np.float32)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        
+        docs = docs / np.clip(np.linalg.norm(docs, axis=1, keepdims=True), 1e-12, None)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        
+        relevance = docs @ query
+        similarity = docs @ docs.T
+        
+        first = int(np.argmax(relevance))
+        selected = [first]
+        max_similarity = similarity[first].copy()
+        
+        for _ in range(1, min(k, len(docs))):
+            mmr_scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_similarity
+            mmr_scores[selected] = -np.inf
+            best = int(np.argmax(mmr_scores))
+            selected.append(best)
+            max_similarity = np.maximum(max_similarity, similarity[best])
+        
+        return selected
+    
+    def get_chunks(self, chunk_ids: List[str]) -> List[Dict[str, Any]]:
+        """Fetch chunks by ID, in the same dict shape as search results (without 'score')."""
+        if not chunk_ids:
+            return []
+        results = self.collection.get(ids=chunk_ids, include=["documents", "metadatas"])
+        chunks = [
+            {
+                "chunk_id": chunk_id,
+                "content": results["documents"][i],
+                "metadata": results["metadatas"][i] if results["metadatas"] else {}
+            }
+            for i, chunk_id in enumerate(results["ids"])
+        ]
+        # ChromaDB does not guarantee order for get()
+        order = {chunk_id: i for i, chunk_id in enumerate(chunk_ids)}
+        return sorted(chunks, key=lambda c: order.get(c["chunk_id"], len(order)))
+    
+    @property
+    def generation(self) -> int:
+        """Knowledge base generation as last seen by this process (never blocks)."""
+        return self._seen_generation
+    
+    def add_change_listener(self, listener: Callable[[List[str], List[str]], None]) -> None:
+        """
+        Register a callback invoked with (added_ids, removed_ids) after chunks change.
+        
+        Writes by other processes are announced from the background generation poll.
+        """
+        self._change_listeners.append(listener)
+    
+    def announce_existing_chunks(self) -> None:
+        """Announce every stored chunk as added, so listeners catch up on chunks ingested while offline."""
+        with self._generation_lock:
+            self._known_ids = self._stored_ids()
+            self._seen_generation = self._read_generation()
+            ids = sorted(self._known_ids)
+        if ids:
+            self._notify_change(ids, [])
+    
+    def _watch_generation(self) -> None:
+        while True:
+            time.sleep(settings.kb_generation_poll_seconds)
+            try:
+                self._sync_external_changes()
+            except Exception as e:
+                logger.error(f"Knowledge base generation poll failed: {str(e)}")
+    
+    def _read_generation(self) -> int:
+        with self._generation_lock:
+            (value,) = self._generation_conn.execute(
+                "SELECT value FROM kb_generation WHERE name = ?", (settings.chroma_collection_name,)
+            ).fetchone()
+        return value
+    
+    def _record_write(self, added_ids: List[str], removed_ids: List[str]) -> None:
+        """Bump the shared generation after a write and notify listeners."""
+        with self._generation_lock:
+            with self._generation_conn:
+                self._generation_conn.execute(
+                    "UPDATE kb_generation SET value = value + 1 WHERE name = ?", (settings.chroma_collection_name,)
+                )
+                generation = self._read_generation()
+            self._known_ids.update(added_ids)
+            self._known_ids.difference_update(removed_ids)
+            if generation == self._seen_generation + 1:
+                self._seen_generation = generation
+        # Otherwise another process wrote in between; the sync announces only its chunks
+        self._sync_external_changes()
+        self._notify_change(added_ids, removed_ids)
+    
+    def _sync_external_changes(self) -> None:
+        """Diff the stored chunk IDs against the last known set and announce the difference."""
+        with self._generation_lock:
+            generation = self._read_generation()
+            if generation == self._seen_generation:
+                return
+            self._seen_generation = generation
+            stored = self._stored_ids()
+            previous, self._known_ids = self._known_ids, stored
+        if not self._change_listeners:
+            return
+        added, removed = sorted(stored - previous), sorted(previous - stored)
+        if added or removed:
+            logger.info(f"Knowledge base changed in another process: {len(added)} chunks added, {len(removed)} removed")
+            self._notify_change(added, removed)
+    
+    def _stored_ids(self) -> Set[str]:
+        return set(self.collection.get(include=[])["ids"])
+    
+    def _notify_change(self, added_ids: List[str], removed_ids: List[str]) -> None:
+        for listener in self._change_listeners:
+            try:
+                listener(added_ids, removed_ids)
+            except Exception as e:
+                logger.error(f"Chunk change listener failed: {str(e)}")
     
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the vector store."""
         count = self.collection.count()
         return {
             "total_chunks": count,
-            "collection_name": settings.chroma_collection_name
+            "collection_name": settings.chroma_collection_name,
+            "generation": self.generation
         }
     
     def delete_document(self, document_id: str) -> bool:
@@ -186,6 +451,7 @@ class VectorStore:
             
             if results["ids"]:
                 self.collection.delete(ids=results["ids"])
+                self._record_write([], results["ids"])
                 logger.info(f"Deleted {len(results['ids'])} chunks for document {document_id}")
                 return True
             
@@ -0,0 +1,296 @@
+"""Local grading of flash card answers before falling back to the LLM."""
+
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+# Canonical spellings for common anatomical abbreviations and synonyms.
+# Keys and values are normalized (lowercase, no punctuation).
+TERM_SYNONYMS: Dict[str, str] = {
+    "cns": "central nervous system",
+    "pns": "peripheral nervous system",
+    "ans": "autonomic nervous system",
+    "csf": "cerebrospinal fluid",
+    "bbb": "blood brain barrier",
+    "umn": "upper motor neuron",
+    "lmn": "lower motor neuron",
+    "ica": "internal carotid artery",
+    "eca": "external carotid artery",
+    "aca": "anterior cerebral artery",
+    "mca": "middle cerebral artery",
+    "pca": "posterior cerebral artery",
+    "acomm": "anterior communicating artery",
+    "pcomm": "posterior communicating artery",
+    "pica": "posterior inferior cerebellar artery",
+    "aica": "anterior inferior cerebellar artery",
+    "sca": "superior cerebellar artery",
+    "mlf": "medial longitudinal fasciculus",
+    "dcml": "dorsal column medial lemniscus",
+    "vpl": "ventral posterolateral nucleus",
+    "vpm": "ventral posteromedial nucleus",
+    "lgn": "lateral geniculate nucleus",
+    "mgn": "medial geniculate nucleus",
+    "snc": "substantia nigra pars compacta",
+    "snr": "substantia nigra pars reticulata",
+    "vta": "ventral tegmental area",
+    "gpi": "globus pallidus internus",
+    "gpe": "globus pallidus externus",
+    "stn": "subthalamic nucleus",
+    "ach": "acetylcholine",
+    "gaba": "gamma aminobutyric acid",
+    "grey": "gray",
+    "medulla oblongata": "medulla",
+    "hippocampal formation": "hippocampus",
+    "optic chiasma": "optic chiasm",
+    "anterior horn": "ventral horn",
+    "posterior horn": "dorsal horn",
+    "posterior column": "dorsal column",
+    "anterior root": "ventral root",
+    "posterior root": "dorsal root",
+    "cerebral hemispheres": "cerebrum",
+    "spinal chord": "spinal cord",
+    "neurone": "neuron",
+    "neurones": "neurons",
+}
+
+_CRANIAL_NERVES = [
+    "olfactory", "optic", "oculomotor", "trochlear", "trigeminal", "abducens",
+    "facial", "vestibulocochlear", "glossopharyngeal", "vagus", "accessory", "hypoglossal",
+]
+_ROMAN = ["i", "ii", "iii", "iv", "v", "vi", "vii", "viii", "ix", "x", "xi", "xii"]
+_ORDINALS = [
+    "first", "second", "third", "fourth", "fifth", "sixth",
+    "seventh", "eighth", "ninth", "tenth", "eleventh", "twelfth",
+]
+for _i, _name in enumerate(_CRANIAL_NERVES):
+    for _alias in (f"cn {_ROMAN[_i]}", f"cn{_ROMAN[_i]}", f"cn {_i + 1}", f"cranial nerve {_ROMAN[_i]}",
+                   f"cranial nerve {_i + 1}", f"{_ORDINALS[_i]} cranial nerve"):
+        TERM_SYNONYMS[_alias] = f"{_name} nerve"
+TERM_SYNONYMS["cn 8"] = TERM_SYNONYMS["auditory nerve"] = "vestibulocochlear nerve"
+TERM_SYNONYMS["spinal accessory nerve"] = "accessory nerve"
+
+# unit -> (dimension, factor to the base unit)
+UNITS: Dict[str, Tuple[str, float]] = {
+    "mg": ("mass", 0.001), "g": ("mass", 1.0), "gram": ("mass", 1.0), "grams": ("mass", 1.0),
+    "kg": ("mass", 1000.0),
+    "um": ("length", 1e-6), "µm": ("length", 1e-6), "mm": ("length", 0.001), "cm": ("length", 0.01),
+    "m": ("length", 1.0),
+    "ml": ("volume", 0.001), "l": ("volume", 1.0), "liter": ("volume", 1.0), "liters": ("volume", 1.0),
+    "ms": ("time", 0.001), "s": ("time", 1.0), "sec": ("time", 1.0), "seconds": ("time", 1.0),
+    "min": ("time", 60.0), "minutes": ("time", 60.0),
+    "hz": ("frequency", 1.0), "khz": ("frequency", 1000.0),
+    "mv": ("voltage", 0.001), "v": ("voltage", 1.0),
+    "%": ("percent", 1.0), "percent": ("percent", 1.0),
+}
+
+# Number words that scale a quantity ("86 billion")
+MAGNITUDES: Dict[str, float] = {"thousand": 1e3, "million": 1e6, "billion": 1e9, "trillion": 1e12}
+
+# Words that tell one structure from another; an answer adding any of them beyond the
+# expected terms may name a competing structure ("dorsal horn or ventral horn")
+DISTINGUISHING_TERMS = {
+    "dorsal", "ventral", "anterior", "posterior", "medial", "lateral", "superior", "inferior",
+    "rostral", "caudal", "left", "right", "internal", "external", "upper", "lower", "proximal", "distal",
+    "ipsilateral", "contralateral", "sensory", "motor", "afferent", "efferent", "sympathetic", "parasympathetic",
+}
+
+STOPWORDS = {
+    "the", "a", "an", "of", "and", "or", "is", "are", "was", "were", "in", "on", "at", "to", "for",
+    "it", "its", "by", "with", "as", "that", "which", "this", "be", "from", "into", "about",
+    "approximately", "around", "roughly", "composed", "consists", "includes", "made",
+}
+NEGATIONS = {"not", "no", "never", "without", "neither", "nor", "isnt", "arent", "doesnt", "dont"}
+NON_ANSWERS = {"", "idk", "i dont know", "dont know", "no idea", "not sure", "pass", "skip", "?"}
+
+_QUANTITY = re.compile(
+    r"((?:(?<![\w.])[-−])?(?<![\w.])\d+(?:,\d{3})*(?:\.\d+)?)"
+    r"(?:\s*(?:-|–|—|to)\s*(\d+(?:,\d{3})*(?:\.\d+)?))?"
+    r"(?:\s*(" + "|".join(MAGNITUDES) + r")\b)?"
+    r"\s*(%|[a-zµ]+)?"
+)
+# Alternatives or lists in an answer ("X or Y", "X, Y"), other than thousands separators
+_HEDGE = re.compile(r"\b(?:or|either)\b|[;/]|(?<!\d),|,(?!\d{3})")
+
+Quantity = Tuple[Optional[str], float, float]  # (dimension, low, high) in base units
+
+
+class LocalAnswerGrader:
+    """
+    Grades clear-cut flash card answers without the LLM.
+
+    Answers are normalized (abbreviations and synonyms mapped to one
+    spelling), numbers compared after unit conversion, and expected terms
+    checked for coverage. When the text comparison is inconclusive, an
+    embedding similarity decides clearly right or clearly unrelated
+    answers. Anything in between (partial lists, paraphrases, negations)
+    returns None so the caller can ask the LLM.
+    """
+
+    def __init__(self, embed: Optional[Callable[[List[str]], List[List[float]]]] = None):
+        self.embed = embed
+        # Longest aliases first so "cranial nerve 12" wins over "cranial nerve 1"
+        aliases = sorted(TERM_SYNONYMS, key=len, reverse=True)
+        self._synonym_pattern = re.compile(r"\b(" + "|".join(re.escape(a) for a in aliases) + r")\b")
+        # Structure names the grader knows, plus words that distinguish related structures
+        self._distinguishing_terms = set(DISTINGUISHING_TERMS)
+        generic = self._tokens("nerve artery nucleus system")
+        for term in TERM_SYNONYMS.values():
+            self._distinguishing_terms |= self._tokens(term) - generic
+        self._lock = threading.Lock()
+        self.local = 0
+        self.escalated = 0
+
+    def grade(self, question: str, correct_answer: str, user_answer: str) -> Optional[float]:
+        """Return 1.0 or 0.0 when the answer is clearly right or wrong, else None."""
+        score = self._grade(question, correct_answer, user_answer)
+        with self._lock:
+            if score is None:
+                self.escalated += 1
+            else:
+                self.local += 1
+        return score
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.local + self.escalated
+            return {
+                "graded_locally": self.local,
+                "escalated": self.escalated,
+                "escalation_rate": self.escalated / total if total else 0.0,
+            }
+
+    def _grade(self, question: str, correct_answer: str, user_answer: str) -> Optional[float]:
+        user = self.normalize(user_answer)
+        correct = self.normalize(correct_answer)
+        if user in NON_ANSWERS:
+            return 0.0
+        if user == correct:
+            return 1.0
+
+        user_tokens = self._tokens(user)
+        correct_tokens = self._tokens(correct)
+        if (user_tokens & NEGATIONS) != (correct_tokens & NEGATIONS):
+            return None  # "not the brain" must not match "brain"
+
+        decided, numeric = self._grade_numeric(correct, user, correct_tokens)
+        if decided:
+            return numeric
+
+        content = correct_tokens - self._unit_tokens(correct)
+        if content and content <= user_tokens:
+            extra = user_tokens - content
+            if extra & self._distinguishing_terms:
+                return None  # May also name a competing structure
+            if not _HEDGE.search(correct_answer.lower()) and self._hedged(user_answer, content):
+                return None  # Offers alternatives or lists several answers
+            # Everything expected is there and little else was added
+            if len(extra) <= max(2, len(content)):
+                return 1.0
+            return None
+        if content & user_tokens:
+            return None  # partial coverage: partial credit is a judgement call
+
+        similarity = self._similarity(correct_answer, user_answer)
+        if similarity is None:
+            return None
+        if similarity >= settings.flash_card_accept_similarity:
+            return 1.0
+        if similarity <= settings.flash_card_reject_similarity:
+            return 0.0
+        return None
+
+    def _hedged(self, user_answer: str, content: Set[str]) -> bool:
+        """True if the answer lists several parts and one of them says something besides the expected terms."""
+        parts = [self._tokens(self.normalize(part)) for part in _HEDGE.split(user_answer.lower())]
+        parts = [tokens for tokens in parts if tokens]
+        return len(parts) > 1 and any(tokens - content for tokens in parts)
+
+    def normalize(self, text: str) -> str:
+        """Lowercase, drop punctuation and map abbreviations/synonyms to one spelling."""
+        text = (text or "").lower().replace("’", "'")
+        text = re.sub(r"'s\b", "", text).replace("'", "")
+        text = re.sub(r"[^\w\s.,%µ\-−–—]", " ", text)
+        text = re.sub(r"(?<!\d)[.,]|[.,](?!\d)", " ", text)
+        text = " ".join(text.split())
+        return self._synonym_pattern.sub(lambda m: TERM_SYNONYMS[m.group(1)], text)
+
+    def _tokens(self, text: str) -> Set[str]:
+        tokens = set()
+        for word in re.split(r"[\s\-–—]+", text):
+            if not word or word in STOPWORDS:
+                continue
+            tokens.add(self._fold(word))
+        return tokens
+
+    @staticmethod
+    def _fold(word: str) -> str:
+        """Cheap plural folding, applied the same way on both sides."""
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            return word[:-1]
+        return word
+
+    def _unit_tokens(self, text: str) -> Set[str]:
+        """Tokens that are numbers or units (compared separately)."""
+        tokens = set()
+        for low, high, magnitude, unit in _QUANTITY.findall(text):
+            tokens.update(t for t in (low, high, magnitude) if t)
+            if unit in UNITS:
+                tokens.add(unit[:-1] if len(unit) > 3 and unit.endswith("s") else unit)
+        return tokens
+
+    def _quantities(self, text: str) -> List[Quantity]:
+        quantities = []
+        for low, high, magnitude, unit in _QUANTITY.findall(text):
+            if unit in UNITS:
+                dimension, factor = UNITS[unit]
+            else:
+                # Counted things only compare with the same word ("86 billion neurons")
+                dimension = f"count:{self._fold(unit)}" if unit else None
+                factor = 1.0
+            factor *= MAGNITUDES.get(magnitude, 1.0)
+            low_value = float(low.replace(",", "").replace("−", "-")) * factor
+            high_value = float(high.replace(",", "")) * factor if high else low_value
+            quantities.append((dimension, min(low_value, high_value), max(low_value, high_value)))
+        return quantities
+
+    def _grade_numeric(self, correct: str, user: str, correct_tokens: Set[str]) -> Tuple[bool, Optional[float]]:
+        """
+        Compare the quantities in an answer; returns (decided, score).
+
+        When the expected answer has a quantity, the words alone never make an
+        answer right: a wrong or missing number is 0.0 or escalated, and only
+        answers whose numbers all match go on to the term coverage check.
+        """
+        expected = self._quantities(correct)
+        if not expected:
+            return False, None
+        given = self._quantities(user)
+
+        def matches(e: Quantity, g: Quantity) -> bool:
+            if e[0] != g[0]:
+                return False
+            tolerance = 0.1 * max(abs(e[1]), abs(e[2]))
+            return g[1] <= e[2] + tolerance and g[2] >= e[1] - tolerance
+
+        if all(any(matches(e, g) for g in given) for e in expected):
+            if len(correct_tokens - self._unit_tokens(correct)) <= 2:
+                return True, 1.0
+            return False, None
+        comparable = any(e[0] == g[0] for e in expected for g in given)
+        if comparable and not any(matches(e, g) for e in expected for g in given):
+            return True, 0.0
+        return True, None
+
+    def _similarity(self, a: str, b: str) -> Optional[float]:
+        if self.embed is None:
+            return None
+        try:
+            first, second = (np.asarray(v, dtype=float) for v in self.embed([a, b]))
+        except Exception:
+            return None
+        denominator = float(np.linalg.norm(first) * np.linalg.norm(second))
+        return float(first @ second / denominator) if denominator else None
@@ -0,0 +1,161 @@
+"""Cache of generated study artifacts with several variants per request, refilled in the background."""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactCache:
+    """
+    Generated flash card sets, study notes and clinical cases keyed by request parameters.
+
+    Up to `variants` results are kept per key and served round-robin, so a
+    class asking for the same topic does not all receive one identical set.
+    A miss generates in the caller and stores the first variant; once a key
+    is requested again, the remaining variants are generated on a small
+    background executor. Variants expire after `ttl_seconds`, and whole keys
+    are evicted least-recently-used past `max_keys` or `max_bytes` (sizes
+    are measured on the JSON form of each result). Keys should include the
+    knowledge base generation so results never outlive the content they
+    were built from. Results marked "fallback" (e.g. generated without
+    knowledge base content) are returned but never stored, and stop a
+    refill.
+    """
+
+    def __init__(
+        self,
+        variants: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        max_keys: Optional[int] = None,
+        max_bytes: Optional[int] = None
+    ):
+        self.variants = variants or settings.artifact_cache_variants
+        self.ttl_seconds = ttl_seconds or settings.artifact_cache_ttl_seconds
+        self.max_keys = max_keys or settings.artifact_cache_max_keys
+        self.max_bytes = max_bytes or int(settings.artifact_cache_max_mb * 1024 * 1024)
+        # key -> {"variants": [(expires_at, size, value), ...], "next": round-robin index}
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._refilling: set = set()
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.artifact_cache_refill_concurrency,
+            thread_name_prefix="artifact-cache"
+        )
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.evicted = 0
+
+    def get(self, key: Hashable, generate: Callable[[], Any]) -> Any:
+        """Serve the next cached variant for key, or generate (and cache) one now."""
+        value = self._next_variant(key)
+        if value is None:
+            value = generate()
+            self._store(key, value)
+            return value
+        self._schedule_refill(key, generate)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "keys": len(self._entries),
+                "variants": sum(len(entry["variants"]) for entry in self._entries.values()),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "generated": self.generated,
+                "evicted": self.evicted,
+                "refilling": len(self._refilling)
+            }
+
+    def _next_variant(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._expire(key, entry, now)
+                entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            variants = entry["variants"]
+            index = entry["next"] % len(variants)
+            entry["next"] = index + 1
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return variants[index][2]
+
+    def _store(self, key: Hashable, value: Any) -> bool:
+        """Add a variant; returns False when the key already holds enough of them or the value is a fallback."""
+        if isinstance(value, dict) and value.get("fallback"):
+            return False
+        try:
+            size = len(json.dumps(value, default=str))
+        except (TypeError, ValueError):
+            return False
+        with self._lock:
+            entry = self._entries.setdefault(key, {"variants": [], "next": 0})
+            if len(entry["variants"]) >= self.variants:
+                return False
+            entry["variants"].append((time.monotonic() + self.ttl_seconds, size, value))
+            self._bytes += size
+            self.generated += 1
+            self._entries.move_to_end(key)
+            while self._entries and (len(self._entries) > self.max_keys or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= sum(size for _, size, _ in evicted["variants"])
+                self.evicted += 1
+            return True
+
+    def _expire(self, key: Hashable, entry: Dict[str, Any], now: float) -> None:
+        """Drop expired variants (and the key once none are left); caller holds the lock."""
+        live: List[tuple] = [v for v in entry["variants"] if v[0] >= now]
+        if len(live) == len(entry["variants"]):
+            return
+        self._bytes -= sum(v[1] for v in entry["variants"] if v[0] < now)
+        if live:
+            entry["variants"] = live
+        else:
+            del self._entries[key]
+
+    def _schedule_refill(self, key: Hashable, generate: Callable[[], Any]) -> None:
+        """Generate the missing variants of a key in the background (one refill per key at a time)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if key in self._refilling or entry is None or len(entry["variants"]) >= self.variants:
+                return
+            self._refilling.add(key)
+        self.executor.submit(self._refill, key, generate)
+
+    def _refill(self, key: Hashable, generate: Callable[[], Any]) -> None:
+        try:
+            while True:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    # Evicted keys are not regenerated; they come back on their next miss
+                    if entry is None or len(entry["variants"]) >= self.variants:
+                        break
+                if not self._store(key, generate()):
+                    break
+        except Exception as e:
+            logger.error(f"Artifact cache refill failed for {key}: {e}")
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
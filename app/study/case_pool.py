@@ -0,0 +1,135 @@
+"""Pool of pre-generated clinical case openings, refilled in the background."""
+
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.models.schemas import DifficultyLevel, SystemType
+
+logger = logging.getLogger(__name__)
+
+# Pool entry kinds
+SESSION_OPENING = "session_opening"  # Immersive presentation for start_clinical_session
+CASE_VIGNETTE = "case_vignette"  # Full vignette for generate_clinical_case
+
+PoolKey = Tuple[str, Optional[str], str]  # (kind, system or None, difficulty)
+EntryBuilder = Callable[[str, Optional[SystemType], DifficultyLevel], Optional[Dict[str, Any]]]
+
+
+class ClinicalCasePool:
+    """
+    Ready-made clinical cases per (kind, system, difficulty).
+
+    `build` produces one entry (a dict with at least "chunk_ids"); it is
+    called on a small background executor until each requested key holds
+    `target_size` entries. `pop` never blocks on generation: it returns
+    None on an empty pool and schedules a refill, so the caller generates
+    live once and later requests are served from the pool.
+    """
+
+    def __init__(self, build: EntryBuilder, target_size: Optional[int] = None):
+        self.build = build
+        self.target_size = target_size or settings.clinical_case_pool_size
+        self._pools: Dict[PoolKey, Deque[Dict[str, Any]]] = {}
+        self._refilling: set = set()
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.clinical_case_pool_build_concurrency,
+            thread_name_prefix="clinical-case-pool"
+        )
+        self.hits = 0
+        self.misses = 0
+        self.built = 0
+
+    def pop(
+        self,
+        kind: str,
+        system: Optional[SystemType],
+        difficulty: DifficultyLevel
+    ) -> Optional[Dict[str, Any]]:
+        """Take a ready entry, or None if the pool is empty; either way top the pool back up."""
+        key = self._key(kind, system, difficulty)
+        with self._lock:
+            pool = self._pools.get(key)
+            entry = pool.popleft() if pool else None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self.schedule_refill(kind, system, difficulty)
+        return entry
+
+    def schedule_refill(self, kind: str, system: Optional[SystemType], difficulty: DifficultyLevel) -> None:
+        """Fill the key up to target_size in the background (one refill per key at a time)."""
+        key = self._key(kind, system, difficulty)
+        with self._lock:
+            if key in self._refilling or len(self._pools.get(key, ())) >= self.target_size:
+                return
+            self._refilling.add(key)
+        self.executor.submit(self._refill, key, kind, system, difficulty)
+
+    def invalidate_chunks(self, removed_ids: List[str]) -> int:
+        """Drop entries built from chunks that left the knowledge base; returns how many."""
+        removed = set(removed_ids)
+        return self._drop(lambda entry: bool(removed.intersection(entry.get("chunk_ids", ()))))
+
+    def drop_ungrounded(self) -> int:
+        """Drop entries built without knowledge base chunks (e.g. once documents are ingested)."""
+        return self._drop(lambda entry: not entry.get("chunk_ids"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "depth": {
+                    f"{kind}/{system or 'any'}/{difficulty}": len(pool)
+                    for (kind, system, difficulty), pool in self._pools.items()
+                },
+                "target_size": self.target_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "built": self.built,
+                "refilling": len(self._refilling)
+            }
+
+    def _refill(self, key: PoolKey, kind: str, system: Optional[SystemType], difficulty: DifficultyLevel) -> None:
+        try:
+            while True:
+                with self._lock:
+                    # Checked and released under one lock so a concurrent pop can schedule the next refill
+                    if len(self._pools.get(key, ())) >= self.target_size:
+                        self._refilling.discard(key)
+                        return
+                entry = self.build(kind, system, difficulty)
+                if entry is None:
+                    break
+                with self._lock:
+                    self._pools.setdefault(key, deque()).append(entry)
+                    self.built += 1
+        except Exception as e:
+            logger.error(f"Clinical case pool refill failed for {key}: {e}")
+        with self._lock:
+            self._refilling.discard(key)
+
+    def _drop(self, stale: Callable[[Dict[str, Any]], bool]) -> int:
+        """Remove stale entries and refill the keys that lost some."""
+        dropped = 0
+        depleted = []
+        with self._lock:
+            for key, pool in self._pools.items():
+                kept = deque(entry for entry in pool if not stale(entry))
+                if len(kept) < len(pool):
+                    dropped += len(pool) - len(kept)
+                    depleted.append(key)
+                self._pools[key] = kept
+        for kind, system, difficulty in depleted:
+            self.schedule_refill(kind, SystemType(system) if system else None, DifficultyLevel(difficulty))
+        return dropped
+
+    @staticmethod
+    def _key(kind: str, system: Optional[SystemType], difficulty: DifficultyLevel) -> PoolKey:
+        return (kind, system.value if system else None, DifficultyLevel(difficulty).value)
@@ -0,0 +1,161 @@
+"""Bounded storage for interactive sessions (clinical cases and tutoring)."""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ClinicalSessionStore:
+    """
+    Clinical sessions with TTL expiry and LRU eviction.
+
+    Sessions hold plain JSON-serializable data (chunk IDs rather than chunk
+    text). Every save records the serialized size, which is reported as the
+    per-session footprint. When `db_path` is set, sessions are also written
+    through to SQLite so they survive restarts and evictions from memory and
+    can be picked up by another worker. Each save bumps a version column;
+    `get` compares it with the in-memory copy and reloads sessions another
+    worker saved since. Tutoring sessions use the same store with their own
+    `table`.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        max_sessions: Optional[int] = None,
+        db_path: Optional[str] = None,
+        table: str = "clinical_sessions"
+    ):
+        self.table = table
+        self.ttl_seconds = ttl_seconds or settings.clinical_session_ttl_seconds
+        self.max_sessions = max_sessions or settings.clinical_session_max_sessions
+        self.db_path = db_path or settings.clinical_session_store_path
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()  # session_id -> (expires_at, session, version)
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+        self._conn = None
+        if self.db_path:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            with self._lock, self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        session_id TEXT PRIMARY KEY,
+                        expires_at REAL NOT NULL,
+                        payload TEXT NOT NULL,
+                        version INTEGER NOT NULL DEFAULT 0
+                    )
+                """)
+                columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+                if "version" not in columns:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_expiry ON {table} (expires_at)")
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the live session (refreshing its TTL), loading it from SQLite if needed or newer there."""
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            if self._conn is None:
+                if entry is None:
+                    return None
+                self._sessions[session_id] = (now + self.ttl_seconds, entry[1], entry[2])
+                self._sessions.move_to_end(session_id)
+                return entry[1]
+            row = self._conn.execute(
+                f"SELECT version FROM {self.table} WHERE session_id = ? AND expires_at > ?",
+                (session_id, now)
+            ).fetchone()
+            if row is None:
+                # Expired or deleted by another worker
+                self._sessions.pop(session_id, None)
+                self._sizes.pop(session_id, None)
+                return None
+            if entry is not None and entry[2] >= row[0]:
+                self._sessions[session_id] = (now + self.ttl_seconds, entry[1], entry[2])
+                self._sessions.move_to_end(session_id)
+                return entry[1]
+            payload, version = self._conn.execute(
+                f"SELECT payload, version FROM {self.table} WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            session = json.loads(payload)
+            self._insert(session_id, session, len(payload), now, version)
+            return session
+
+    def save(self, session_id: str, session: Dict[str, Any]) -> None:
+        """Store or refresh a session after it changed."""
+        payload = json.dumps(session, separators=(",", ":"))
+        now = time.time()
+        with self._lock:
+            version = 0
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+                    self._conn.execute(
+                        f"INSERT INTO {self.table} (session_id, expires_at, payload, version) VALUES (?, ?, ?, 1) "
+                        "ON CONFLICT(session_id) DO UPDATE SET expires_at = excluded.expires_at, "
+                        "payload = excluded.payload, version = version + 1",
+                        (session_id, now + self.ttl_seconds, payload)
+                    )
+                    (version,) = self._conn.execute(
+                        f"SELECT version FROM {self.table} WHERE session_id = ?", (session_id,)
+                    ).fetchone()
+            self._insert(session_id, session, len(payload), now, version)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._sizes.pop(session_id, None)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE session_id = ?", (session_id,))
+
+    def footprint(self, session_id: str) -> Optional[int]:
+        """Serialized size in bytes of a session, as of its last save."""
+        with self._lock:
+            return self._sizes.get(session_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = list(self._sizes.values())
+            return {
+                "sessions": len(self._sessions),
+                "total_bytes": sum(sizes),
+                "avg_session_bytes": sum(sizes) / len(sizes) if sizes else 0,
+                "max_session_bytes": max(sizes, default=0),
+                "evictions": self.evictions,
+                "persistent": self._conn is not None
+            }
+
+    def _insert(self, session_id: str, session: Dict[str, Any], size: int, now: float, version: int = 0) -> None:
+        """Caller holds the lock."""
+        self._sessions[session_id] = (now + self.ttl_seconds, session, version)
+        self._sessions.move_to_end(session_id)
+        self._sizes[session_id] = size
+        while len(self._sessions) > self.max_sessions:
+            evicted, _ = self._sessions.popitem(last=False)
+            self._sizes.pop(evicted, None)
+            self.evictions += 1
+
+    def _evict(self, now: float) -> None:
+        """Drop expired sessions from memory; entries are in last-use order. Caller holds the lock."""
+        while self._sessions:
+            session_id, (expires_at, _, _) = next(iter(self._sessions.items()))
+            if expires_at > now:
+                break
+            self._sessions.popitem(last=False)
+            self._sizes.pop(session_id, None)
+            self.evictions += 1
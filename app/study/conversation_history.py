@@ -0,0 +1,146 @@
+"""Bounded conversation history for clinical sessions."""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from langchain.prompts import ChatPromptTemplate
+from langchain.chains import LLMChain
+
+from app.core.config import settings
+from app.study.clinical_session_store import ClinicalSessionStore
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationHistory:
+    """
+    Keeps what a clinical prompt sees about the conversation bounded.
+
+    The last `window_messages` messages stay verbatim in
+    session["conversation_history"]. Older messages move to
+    session["history_pending"], which is still rendered verbatim. Once
+    `fold_batch` of them have accumulated, `schedule_fold` folds them into
+    session["history_summary"] with one LLM call on a background executor,
+    off the turn that produced them, and saves the result with the session.
+    The summary is capped in length, so the rendered history has a fixed
+    upper size however long the case runs. All state lives in the session
+    dict, which stays JSON-serializable.
+    """
+
+    def __init__(self, llm: Any, sessions: ClinicalSessionStore):
+        self.llm = llm
+        self.sessions = sessions
+        self.window_messages = settings.clinical_history_window_messages
+        self.fold_batch = settings.clinical_history_fold_batch
+        self.summary_max_chars = settings.clinical_history_summary_max_chars
+        self.message_max_chars = settings.clinical_history_message_max_chars
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.clinical_history_fold_concurrency,
+            thread_name_prefix="clinical-history"
+        )
+        self._lock = threading.Lock()
+        self._folding: set = set()  # Session IDs with a fold in flight
+
+    def append(self, session: Dict[str, Any], role: str, message: str) -> None:
+        """Record a message, moving the oldest ones to the pending list when the window overflows."""
+        history = session.setdefault("conversation_history", [])
+        history.append({"role": role, "message": message})
+        overflow = len(history) - self.window_messages
+        if overflow > 0:
+            session.setdefault("history_pending", []).extend(history[:overflow])
+            del history[:overflow]
+
+    def schedule_fold(self, session_id: str, session: Dict[str, Any]) -> None:
+        """Fold the session's pending messages in the background once enough have accumulated."""
+        pending = list(session.get("history_pending", []))
+        if len(pending) < self.fold_batch:
+            return
+        with self._lock:
+            if session_id in self._folding:
+                return
+            self._folding.add(session_id)
+        self.executor.submit(self._fold, session_id, pending, session.get("history_summary") or "")
+
+    def render(self, session: Dict[str, Any], last: Optional[int] = None) -> str:
+        """Summary of earlier turns followed by the recent messages (optionally only the `last` few)."""
+        recent = list(session.get("history_pending", [])) + list(session.get("conversation_history", []))
+        if last is not None:
+            recent = recent[-last:]
+        lines = [f"{h['role']}: {self._clip(h['message'])}" for h in recent]
+        summary = session.get("history_summary")
+        if summary:
+            lines.insert(0, f"Summary of earlier conversation: {summary}")
+        return "\n".join(lines)
+
+    def gathered(self, session: Dict[str, Any]) -> str:
+        """The most recent student questions, for prompts that list gathered information."""
+        items = session.get("information_gathered", [])[-settings.clinical_gathered_max_items:]
+        return "\n".join(self._clip(item) for item in items)
+
+    def record_gathered(self, session: Dict[str, Any], item: str) -> None:
+        """Track a student question; older ones are covered by the summary."""
+        items = session.setdefault("information_gathered", [])
+        items.append(item)
+        del items[:-settings.clinical_gathered_max_items]
+
+    def decisions(self, items: List[str], limit: int = 5) -> str:
+        """The most recent decisions, clipped, for the completion prompt."""
+        return str([self._clip(item) for item in items[-limit:]])
+
+    def _fold(self, session_id: str, pending: List[Dict[str, str]], previous: str) -> None:
+        try:
+            summary = self._summarize(pending, previous)
+            session = self.sessions.get(session_id)
+            if session is None:
+                return
+            current = session.get("history_pending", [])
+            # Another fold (e.g. in another worker) already took these messages
+            if (session.get("history_summary") or "") != previous or current[:len(pending)] != pending:
+                return
+            del current[:len(pending)]
+            session["history_summary"] = summary
+            self.sessions.save(session_id, session)
+        except Exception as e:
+            logger.error(f"Error folding clinical history for session {session_id}: {e}")
+        finally:
+            with self._lock:
+                self._folding.discard(session_id)
+
+    def _summarize(self, pending: List[Dict[str, str]], previous: str) -> str:
+        """The previous summary updated with the pending messages, capped at summary_max_chars."""
+        transcript = "\n".join(f"{h['role']}: {self._clip(h['message'])}" for h in pending)
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", """You maintain a running summary of a clinical simulation between a student and the clinical team.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+
+Update the summary with the new messages. Keep every clinical finding revealed (history, exam, vitals,
+labs, imaging), the student's hypotheses and decisions, and feedback they received. Drop pleasantries.
+Reply with the updated summary only, in under {max_words} words."""),
+            ("human", "Update the summary.")
+        ])
+        try:
+            summary = LLMChain(llm=self.llm, prompt=prompt).run(
+                summary=previous or "(none yet)",
+                transcript=transcript,
+                max_words=self.summary_max_chars // 6
+            ).strip()
+        except Exception as e:
+            logger.error(f"Error summarizing clinical history: {e}")
+            # Keep the facts without the LLM: append clipped lines and keep the newest part
+            summary = " ".join(filter(None, [previous, transcript.replace("\n", " | ")]))
+        if len(summary) > self.summary_max_chars:
+            summary = "..." + summary[-(self.summary_max_chars - 3):]
+        return summary
+
+    def _clip(self, text: str) -> str:
+        text = str(text)
+        if len(text) <= self.message_max_chars:
+            return text
+        return text[:self.message_max_chars - 3] + "..."
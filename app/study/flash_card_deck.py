@@ -0,0 +1,151 @@
+"""Persistent per-user flash card decks with SM-2 spaced repetition."""
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.request_keys import content_hash, normalize_text
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400.0
+CARD_COLUMNS = "card_id, topic, front, back, repetitions, interval_days, ease, due_at"
+
+
+def quality_from_score(score: float) -> int:
+    """Map an evaluation score (0.0 wrong, 0.5 partial, 1.0 correct) to SM-2 quality 1-5."""
+    return int(round(1 + 4 * min(max(score, 0.0), 1.0)))
+
+
+def sm2_schedule(repetitions: int, interval_days: float, ease: float, quality: int) -> Tuple[int, float, float]:
+    """One SM-2 step: returns (repetitions, interval_days, ease) after a review of the given quality."""
+    if quality < 3:
+        repetitions = 0
+        interval_days = 1.0
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval_days = 1.0
+        elif repetitions == 2:
+            interval_days = 6.0
+        else:
+            interval_days = round(interval_days * ease, 1)
+    ease = max(1.3, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return repetitions, interval_days, ease
+
+
+class FlashCardDeck:
+    """
+    Flash cards saved per user and scheduled with SM-2.
+
+    Cards persist in SQLite and every read goes to the database, so all
+    workers sharing the file see the same schedule. The (user_id, due_at)
+    index finds the next due cards without scanning the deck.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.flash_card_deck_path
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cards (
+                    card_id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    front TEXT NOT NULL,
+                    back TEXT NOT NULL,
+                    repetitions INTEGER NOT NULL DEFAULT 0,
+                    interval_days REAL NOT NULL DEFAULT 0,
+                    ease REAL NOT NULL DEFAULT 2.5,
+                    due_at REAL NOT NULL,
+                    last_score REAL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cards_user ON cards (user_id, due_at)")
+
+    def add_cards(self, user_id: str, topic: str, cards: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Add cards to a user's deck (due immediately); returns them with their card_id."""
+        now = time.time()
+        saved = []
+        with self._lock, self._conn:
+            for card in cards:
+                # Same question for the same user is the same card
+                card_id = content_hash(f"{user_id}\n{normalize_text(card['front'])}")
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO cards (card_id, user_id, topic, front, back, due_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (card_id, user_id, topic, card["front"], card["back"], now, now)
+                )
+                saved.append({**card, "card_id": card_id})
+        return saved
+
+    def get_due_cards(
+        self,
+        user_id: str,
+        limit: int = 20,
+        topic: Optional[str] = None,
+        now: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """Return up to `limit` cards due for review, most overdue first."""
+        now = now or time.time()
+        query = f"SELECT {CARD_COLUMNS} FROM cards WHERE user_id = ? AND due_at <= ?"
+        params: List[Any] = [user_id, now]
+        if topic is not None:
+            query += " AND topic = ?"
+            params.append(topic)
+        query += " ORDER BY due_at LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._card(row) for row in rows]
+
+    def review(self, user_id: str, card_id: str, score: float) -> Optional[Dict[str, Any]]:
+        """Reschedule a card from an evaluation score; returns the updated card or None if unknown."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT repetitions, interval_days, ease FROM cards WHERE card_id = ? AND user_id = ?",
+                (card_id, user_id)
+            ).fetchone()
+            if row is None:
+                return None
+            repetitions, interval_days, ease = sm2_schedule(*row, quality_from_score(score))
+            due_at = now + interval_days * DAY_SECONDS
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE cards SET repetitions = ?, interval_days = ?, ease = ?, due_at = ?, last_score = ? "
+                    "WHERE card_id = ?",
+                    (repetitions, interval_days, ease, due_at, score, card_id)
+                )
+            row = self._conn.execute(
+                f"SELECT {CARD_COLUMNS} FROM cards WHERE card_id = ?", (card_id,)
+            ).fetchone()
+        return self._card(row)
+
+    def deck_size(self, user_id: str) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM cards WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return count
+
+    @staticmethod
+    def _card(row: Tuple) -> Dict[str, Any]:
+        return {
+            "card_id": row[0],
+            "topic": row[1],
+            "front": row[2],
+            "back": row[3],
+            "repetitions": row[4],
+            "interval_days": row[5],
+            "ease": row[6],
+            "due_at": row[7]
+        }
@@ -0,0 +1,82 @@
+"""Persistent per-chunk partial study notes for map-reduce note generation."""
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump when the map prompt changes so older partials are regenerated
+PARTIAL_NOTES_VERSION = 1
+
+
+class PartialNotesStore:
+    """
+    SQLite-backed study notes for single chunks, keyed by (chunk content hash, difficulty).
+
+    Partials do not depend on the requested topic, so any notes request that
+    retrieves an already-seen chunk reuses its partial. Rows written with an
+    older PARTIAL_NOTES_VERSION are ignored.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.study_notes_partials_path
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS partial_notes (
+                    chunk_hash TEXT NOT NULL,
+                    difficulty_level TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    notes TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (chunk_hash, difficulty_level)
+                )
+            """)
+
+    def add(self, chunk_hash: str, difficulty_level: str, notes: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO partial_notes VALUES (?, ?, ?, ?, ?)",
+                (chunk_hash, difficulty_level, PARTIAL_NOTES_VERSION, notes, time.time())
+            )
+
+    def get_many(self, chunk_hashes: List[str], difficulty_level: str) -> Dict[str, str]:
+        """Current-version partial notes by content hash."""
+        if not chunk_hashes:
+            return {}
+        unique = sorted(set(chunk_hashes))
+        placeholders = ",".join("?" * len(unique))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_hash, notes FROM partial_notes "
+                f"WHERE difficulty_level = ? AND version = ? AND chunk_hash IN ({placeholders})",
+                [difficulty_level, PARTIAL_NOTES_VERSION] + unique
+            ).fetchall()
+        found = dict(rows)
+        self.hits += len(found)
+        self.misses += len(unique) - len(found)
+        return found
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM partial_notes WHERE version = ?", (PARTIAL_NOTES_VERSION,)
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "partials": count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
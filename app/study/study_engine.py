@@ -1,32 +1,81 @@
 """Study engine for flash cards, clinical cases, and study notes."""
 
+import random
+import re
 import uuid
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.chains import LLMChain
+from pydantic import ValidationError
 
 from app.core.config import settings
+from app.core.prefetch import SpeculativePrefetcher
+from app.core.request_keys import content_hash
+from app.core.token_stream import DeltaCallback, JsonFieldStreamer
+from app.core.ttl_cache import TTLCache
+from app.ingestion.chunk_summaries import ChunkSummarizer
 from app.rag.vector_store import VectorStore
-from app.models.schemas import DifficultyLevel, SystemType
+from app.study.answer_grader import LocalAnswerGrader
+from app.study.case_pool import ClinicalCasePool, SESSION_OPENING, CASE_VIGNETTE
+from app.study.clinical_session_store import ClinicalSessionStore
+from app.study.conversation_history import ConversationHistory
+from app.study.flash_card_deck import FlashCardDeck
+from app.study.partial_notes import PartialNotesStore
+from app.progress.event_log import LearningEventLog, FLASH_CARD_SESSION, CLINICAL_SESSION
+from app.models.schemas import DifficultyLevel, SystemType, ClinicalTurnResult
 
 logger = logging.getLogger(__name__)
 
+# Posed when a clinical turn moves to diagnosis without a generated question
+DEFAULT_DIAGNOSIS_QUESTION = (
+    "Based on the findings so far, what is your working diagnosis, and where is the lesion? "
+    "Name the vascular territory or structure involved."
+)
+
 
 class StudyEngine:
     """Generates flash cards, clinical cases, and study notes from the knowledge base."""
 
-    def __init__(self, vector_store: VectorStore):
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        event_log: Optional[LearningEventLog] = None,
+        prefetcher: Optional[SpeculativePrefetcher] = None,
+        summaries: Optional[ChunkSummarizer] = None
+    ):
         self.vector_store = vector_store
+        self.event_log = event_log
+        self.prefetcher = prefetcher
+        # Generation prompts send per-chunk summaries instead of raw text when configured
+        self.summaries = summaries if settings.study_prompt_context == "summary" else None
         self.llm = ChatOpenAI(
             model=settings.openai_model,
             temperature=0.7,
             openai_api_key=settings.openai_api_key
         )
-        # Active clinical sessions
-        self.clinical_sessions: Dict[str, Dict[str, Any]] = {}
+        self.use_mmr = settings.study_use_mmr
+        # Saved flash cards scheduled for spaced repetition
+        self.deck = FlashCardDeck()
+        # Clear-cut flash card answers are graded without the LLM
+        self.grader = LocalAnswerGrader(embed=self.vector_store.embed_queries)
+        # Active clinical sessions; they keep chunk IDs and rehydrate text through the chunk cache
+        self.clinical_sessions = ClinicalSessionStore()
+        self.chunk_cache = TTLCache(settings.chunk_cache_ttl_seconds, settings.chunk_cache_max_entries)
+        # Recent clinical turns verbatim, older ones folded into a summary
+        self.history = ConversationHistory(self.llm, self.clinical_sessions)
+        # Ready-made openings for topic-less clinical sessions and cases
+        self.case_pool = ClinicalCasePool(self._build_pool_entry) if settings.clinical_case_pool_enabled else None
+        # Map-reduce study notes: per-chunk partials generated concurrently and cached by content hash
+        self.partial_notes = PartialNotesStore() if settings.study_notes_mode == "map_reduce" else None
+        self.notes_executor = ThreadPoolExecutor(
+            max_workers=settings.study_notes_map_concurrency,
+            thread_name_prefix="study-notes-map"
+        )
+        self.vector_store.add_change_listener(self._on_chunks_changed)
 
     def _search_chunks(self, query: str, top_k: int, filter_dict: Optional[Dict] = None):
         """Search with optional fallback when filters return no results."""
@@ -34,17 +83,25 @@ class StudyEngine:
             query=query,
             top_k=top_k,
             filter_dict=filter_dict,
-            min_score=0.3
+            min_score=0.3,
+            use_mmr=self.use_mmr
         )
         if not chunks and filter_dict:
             chunks = self.vector_store.search(
                 query=query,
                 top_k=top_k,
                 filter_dict=None,
-                min_score=0.3
+                min_score=0.3,
+                use_mmr=self.use_mmr
             )
         return chunks
 
+    def _prompt_context(self, chunks: List[Dict[str, Any]]) -> str:
+        """Context for generation prompts: chunk summaries in summary mode, raw chunk text otherwise."""
+        if self.summaries is not None:
+            return self.summaries.context_for(chunks)
+        return "\n\n".join([c["content"] for c in chunks])
+
     def generate_flash_cards(
         self,
         topic: Optional[str] = None,
@@ -66,13 +123,14 @@ class StudyEngine:
                 query=query,
                 top_k=max(10, num_cards * 2),
                 filter_dict=None,
-                min_score=0.2
+                min_score=0.2,
+                use_mmr=self.use_mmr
             )
 
         if not chunks:
             return self._generate_flash_cards_from_general_knowledge(topic, num_cards)
 
-        context = "\n\n".join([c["content"] for c in chunks[:num_cards * 2]])
+        context = self._prompt_context(chunks[:num_cards * 2])
 
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a neuroanatomy educator. Generate flash cards from the given content.
@@ -141,7 +199,11 @@ Generate exactly {num_cards} flash cards. Output ONLY valid JSON, no markdown.""
         return []
 
     def _generate_flash_cards_from_general_knowledge(self, topic: Optional[str], num_cards: int) -> Dict[str, Any]:
-        """Generate flash cards from LLM general knowledge when KB is empty."""
+        """
+        Generate flash cards from LLM general knowledge when KB is empty.
+        
+        Results are marked "fallback" so they are served but never cached.
+        """
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a neuroanatomy educator. Generate exactly {num_cards} flash cards about neuroanatomy.
 Each card MUST have "front" (question or term) and "back" (answer or definition).
@@ -153,14 +215,14 @@ Topic: {topic}"""),
         result = chain.run(num_cards=num_cards, topic=topic or "general neuroanatomy")
         cards = self._parse_flash_cards_json(result, num_cards)
         if cards:
-            return {"flash_cards": cards, "topic": topic or "neuroanatomy"}
+            return {"flash_cards": cards, "topic": topic or "neuroanatomy", "fallback": True}
         # Ultimate fallback
         fallback = [
             {"front": "What structure is responsible for memory formation?", "back": "The hippocampus, located in the medial temporal lobe."},
             {"front": "How many cranial nerves are there?", "back": "12 pairs (24 total cranial nerves)."},
             {"front": "What is the blood supply to the brain?", "back": "Internal carotid and vertebral arteries form the Circle of Willis."},
         ]
-        return {"flash_cards": fallback[:num_cards], "topic": topic or "neuroanatomy"}
+        return {"flash_cards": fallback[:num_cards], "topic": topic or "neuroanatomy", "fallback": True}
 
     def generate_clinical_case(
         self,
@@ -169,6 +231,11 @@ Topic: {topic}"""),
         system_filter: Optional[SystemType] = None
     ) -> Dict[str, Any]:
         """Generate a clinical case/vignette from the knowledge base."""
+        if topic is None and self.case_pool is not None:
+            entry = self.case_pool.pop(CASE_VIGNETTE, system_filter, difficulty_level)
+            if entry is not None:
+                return entry["case"]
+
         query = topic or "clinical neuroanatomy presentation"
         filter_dict = {"difficulty_level": difficulty_level.value}
         if system_filter:
@@ -176,12 +243,16 @@ Topic: {topic}"""),
 
         chunks = self._search_chunks(query, 8, filter_dict)
         if not chunks:
-            chunks = self.vector_store.search(query=query or "neuroanatomy", top_k=8, filter_dict=None, min_score=0.2)
+            chunks = self.vector_store.search(query=query or "neuroanatomy", top_k=8, filter_dict=None, min_score=0.2, use_mmr=self.use_mmr)
 
         if not chunks:
             return self._generate_clinical_case_from_general(topic, difficulty_level)
 
-        context = "\n\n".join([c["content"] for c in chunks])
+        return self._write_clinical_case(chunks, topic, difficulty_level)
+
+    def _write_clinical_case(self, chunks: List[Dict[str, Any]], topic: Optional[str], difficulty_level) -> Dict[str, Any]:
+        """Generate the vignette text for retrieved chunks."""
+        context = self._prompt_context(chunks)
 
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a medical educator. Create a clinical case vignette for neuroanatomy learning.
@@ -206,7 +277,7 @@ Base this on the provided anatomical content. Make it realistic and educational.
         }
 
     def _generate_clinical_case_from_general(self, topic: Optional[str], difficulty_level) -> Dict[str, Any]:
-        """Generate clinical case from general knowledge when KB is empty."""
+        """Generate clinical case from general knowledge when KB is empty (marked "fallback", never cached)."""
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a medical educator. Create a clinical case vignette for neuroanatomy learning.
 Use markdown formatting. Include:
@@ -221,7 +292,12 @@ Topic: {topic}"""),
         ])
         chain = LLMChain(llm=self.llm, prompt=prompt)
         case_text = chain.run(topic=topic or "neuroanatomy")
-        return {"case": case_text, "topic": topic or "clinical neuroanatomy", "difficulty": difficulty_level.value}
+        return {
+            "case": case_text,
+            "topic": topic or "clinical neuroanatomy",
+            "difficulty": difficulty_level.value,
+            "fallback": True
+        }
 
     def generate_study_notes(
         self,
@@ -237,12 +313,15 @@ Topic: {topic}"""),
 
         chunks = self._search_chunks(topic, 10, filter_dict)
         if not chunks:
-            chunks = self.vector_store.search(query=topic, top_k=10, filter_dict=None, min_score=0.2)
+            chunks = self.vector_store.search(query=topic, top_k=10, filter_dict=None, min_score=0.2, use_mmr=self.use_mmr)
 
         if not chunks:
             return self._generate_study_notes_from_general(topic, difficulty_level, include_summary)
 
-        context = "\n\n".join([c["content"] for c in chunks])
+        if self.partial_notes is not None:
+            context = self._map_study_notes(chunks, difficulty_level)
+        else:
+            context = self._prompt_context(chunks)
 
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a neuroanatomy educator. Create BEAUTIFULLY FORMATTED study notes from the content.
@@ -295,8 +374,70 @@ Memory aids."""),
             "difficulty": difficulty_level.value
         }
 
+    def _map_study_notes(self, chunks: List[Dict[str, Any]], difficulty_level: DifficultyLevel) -> str:
+        """
+        Notes for each retrieved chunk, taken from the partial notes store or generated concurrently.
+        
+        Partials still generating after the map timeout are stored when they finish, and the chunk's
+        prompt context stands in for them in this request.
+        """
+        hashes = [content_hash(c["content"]) for c in chunks]
+        partials = self.partial_notes.get_many(hashes, difficulty_level.value)
+        futures = {}
+        for chunk, chunk_hash in zip(chunks, hashes):
+            if chunk_hash not in partials and chunk_hash not in futures:
+                futures[chunk_hash] = self.notes_executor.submit(
+                    self._write_partial_notes, chunk, chunk_hash, difficulty_level
+                )
+        if futures:
+            wait(futures.values(), timeout=settings.study_notes_map_timeout_seconds)
+            for chunk_hash, future in futures.items():
+                if future.done() and future.result():
+                    partials[chunk_hash] = future.result()
+
+        parts = []
+        seen = set()
+        for chunk, chunk_hash in zip(chunks, hashes):
+            if chunk_hash in seen:
+                continue
+            seen.add(chunk_hash)
+            parts.append(partials.get(chunk_hash) or self._prompt_context([chunk]))
+        return "\n\n---\n\n".join(parts)
+
+    def _write_partial_notes(
+        self,
+        chunk: Dict[str, Any],
+        chunk_hash: str,
+        difficulty_level: DifficultyLevel
+    ) -> Optional[str]:
+        """Generate and store topic-independent notes for one chunk; None on failure."""
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", """You are a neuroanatomy educator writing notes on one source passage for {difficulty} students.
+Cover every structure, relationship, pathway, blood supply and clinical correlation in the passage.
+Use markdown bullets with **bold** key terms; use a small table only for comparisons. No title, no intro.
+Stay under {max_words} words and do not add facts that are not in the passage."""),
+            ("human", "Passage ({structure}):\n{content}")
+        ])
+        try:
+            notes = LLMChain(llm=self.llm, prompt=prompt).run(
+                difficulty=difficulty_level.value,
+                max_words=settings.study_notes_partial_max_words,
+                structure=chunk["metadata"].get("structure_name") or "neuroanatomy",
+                content=chunk["content"]
+            ).strip()
+        except Exception as e:
+            logger.error(f"Error generating partial study notes: {e}")
+            return None
+        if not notes:
+            return None
+        try:
+            self.partial_notes.add(chunk_hash, difficulty_level.value, notes)
+        except Exception as e:
+            logger.warning(f"Could not store partial study notes: {e}")
+        return notes
+
     def _generate_study_notes_from_general(self, topic: str, difficulty_level, include_summary: bool) -> Dict[str, Any]:
-        """Generate study notes from general knowledge when KB is empty."""
+        """Generate study notes from general knowledge when KB is empty (marked "fallback", never cached)."""
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a neuroanatomy educator. Create BEAUTIFULLY FORMATTED study notes about {topic}.
 
@@ -320,7 +461,7 @@ Include: Overview, Key Concepts, Detailed Content with tables where helpful, Cli
             topic=topic,
             summary_instruction="Add a Summary section at the end." if include_summary else "Do not include a summary."
         )
-        return {"notes": notes, "topic": topic, "difficulty": difficulty_level.value}
+        return {"notes": notes, "topic": topic, "difficulty": difficulty_level.value, "fallback": True}
 
     def evaluate_flash_card_answer(
         self,
@@ -328,7 +469,14 @@ Include: Overview, Key Concepts, Detailed Content with tables where helpful, Cli
         correct_answer: str,
         question: str
     ) -> Dict[str, Any]:
-        """Evaluate user's answer to a flash card using AI."""
+        """Evaluate user's answer to a flash card, using the LLM only for ambiguous answers."""
+        if settings.flash_card_local_grading:
+            score = self.grader.grade(question, correct_answer, user_answer)
+            if score == 1.0:
+                return {"score": 1.0, "feedback": "Excellent! You understand the concept well.", "is_correct": True, "is_partial": False}
+            if score == 0.0:
+                return {"score": 0.0, "feedback": f"Not quite. The expected answer is: {correct_answer}", "is_correct": False, "is_partial": False}
+        
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are evaluating a student's neuroanatomy answer. Be VERY LENIENT and focus on CONCEPTUAL UNDERSTANDING.
 
@@ -388,6 +536,84 @@ Format as JSON:
         except Exception as e:
             logger.error(f"Error parsing evaluation: {e}")
         
+        return self._keyword_evaluation(user_answer, correct_answer, question)
+
+    def evaluate_flash_card_answers(self, answers: List[Dict[str, str]]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Evaluate a whole session's answers.
+        
+        Clear-cut answers are graded locally; the rest go to the LLM in a
+        single structured call. Returns the results in input order and the
+        number graded locally.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(answers)
+        for i, a in enumerate(answers):
+            if not settings.flash_card_local_grading:
+                break
+            score = self.grader.grade(a["question"], a["correct_answer"], a["user_answer"])
+            if score == 1.0:
+                results[i] = {"score": 1.0, "feedback": "Excellent! You understand the concept well.", "is_correct": True, "is_partial": False}
+            elif score == 0.0:
+                results[i] = {"score": 0.0, "feedback": f"Not quite. The expected answer is: {a['correct_answer']}", "is_correct": False, "is_partial": False}
+        graded_locally = sum(1 for r in results if r is not None)
+        
+        pending = [i for i, r in enumerate(results) if r is None]
+        if pending:
+            items = "\n\n".join(
+                f"[{n}] Question: {answers[i]['question']}\n"
+                f"Expected Answer: {answers[i]['correct_answer']}\n"
+                f"Student Answer: {answers[i]['user_answer']}"
+                for n, i in enumerate(pending, 1)
+            )
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", """You are evaluating a student's neuroanatomy flash card answers. Be VERY LENIENT and focus on CONCEPTUAL UNDERSTANDING.
+
+Scoring:
+- 1.0: complete answer (synonyms, paraphrases and equivalent values/units count)
+- 0.5: partial - some correct components, or a partial list
+- 0.0: wrong, irrelevant, or no correct concepts
+
+Answers:
+{items}
+
+Return ONLY a JSON array with one object per numbered answer, in order:
+[{{"index": 1, "score": 0.0 or 0.5 or 1.0, "feedback": "brief encouraging feedback"}}, ...]"""),
+                ("human", "Evaluate all {count} answers.")
+            ])
+            graded = {}
+            try:
+                result = LLMChain(llm=self.llm, prompt=prompt).run(items=items, count=len(pending))
+                import json
+                import re
+                match = re.search(r'\[[\s\S]*\]', result)
+                for item in (json.loads(match.group()) if match else []):
+                    if isinstance(item, dict) and "index" in item:
+                        graded[int(item["index"])] = item
+            except Exception as e:
+                logger.error(f"Error in batch flash card evaluation: {e}")
+            
+            for n, i in enumerate(pending, 1):
+                try:
+                    score = max(0.0, min(1.0, float(graded[n].get("score", 0.0))))
+                except (KeyError, TypeError, ValueError):
+                    # Missing or malformed in the LLM output
+                    a = answers[i]
+                    results[i] = self._keyword_evaluation(a["user_answer"], a["correct_answer"], a["question"])
+                    continue
+                item = graded[n]
+                results[i] = {
+                    "score": score,
+                    "feedback": item.get("feedback", ""),
+                    "is_correct": score == 1.0,
+                    "is_partial": 0.0 < score < 1.0
+                }
+        
+        return results, graded_locally
+
+    def _keyword_evaluation(self, user_answer: str, correct_answer: str, question: str) -> Dict[str, Any]:
+        """Lenient keyword and number matching, used when the LLM output cannot be parsed."""
+        import re
+        
         # Fallback: lenient keyword + numerical comparison
         user_lower = user_answer.lower().strip()
         correct_lower = correct_answer.lower().strip()
@@ -457,169 +683,221 @@ Format as JSON:
         topic: str,
         total_score: float,
         max_score: float,
-        card_results: List[Dict[str, Any]]
+        card_results: List[Dict[str, Any]],
+        user_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """Analyze completed flash card session and recommend next topics."""
         performance_pct = (total_score / max_score * 100) if max_score > 0 else 0
         
-        # Prepare detailed results for personalized analysis
-        correct_count = sum(1 for r in card_results if r.get("score", 0) == 1.0)
-        partial_count = sum(1 for r in card_results if r.get("score", 0) == 0.5)
-        incorrect_count = len(card_results) - correct_count - partial_count
-
-        correct_items = [r for r in card_results if r.get("score", 0) == 1.0]
-        partial_items = [r for r in card_results if r.get("score", 0) == 0.5]
-        incorrect_items = [r for r in card_results if r.get("score", 0) < 0.5]
-
-        results_text = f"Topic: {topic}\nScore: {total_score}/{max_score} ({performance_pct:.1f}%)\n"
-        results_text += f"Correct (1.0): {correct_count}, Partial (0.5): {partial_count}, Incorrect (0.0): {incorrect_count}\n\n"
-
-        results_text += "--- DETAILED CARD RESULTS ---\n\n"
-        for i, r in enumerate(card_results, 1):
-            results_text += f"Card {i} [Score: {r.get('score', 0)}]\n"
-            results_text += f"Question: {r.get('question', '?')}\n"
-            results_text += f"Student's answer: {r.get('user_answer', '')}\n"
-            results_text += f"Correct answer: {r.get('correct_answer', '')}\n"
-            if r.get("feedback"):
-                results_text += f"Feedback given: {r.get('feedback')}\n"
-            results_text += "\n"
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a neuroanatomy learning coach. Analyze this student's flash card session and provide PERSONALIZED feedback.
-
-{results}
-
-CRITICAL: Base your analysis on the ACTUAL questions and answers above. Do NOT give generic advice.
-
-1. **Performance summary**: 2-3 sentences that reference the topic and their actual score. Mention what they did well and what needs work based on the cards.
-
-2. **Strengths**: List 2-3 SPECIFIC concepts they got right. Name the actual topics/questions they answered correctly (e.g. "Brain weight and volume", "Broca's area function"). NOT generic items like "Completed the session".
-
-3. **Areas to improve**: List 2-3 SPECIFIC concepts they got wrong or partially wrong. Reference the actual questions and what they missed (e.g. "Six lobes of the cerebrum—you listed 3; review occipital, insular, limbic lobes"). NOT generic items like "Review incorrect answers".
-
-4. **Recommended topics**: 3-4 neuroanatomy topics to study next, prioritizing topics related to their weak areas from this session.
-
-5. **next_difficulty**: "undergrad", "med", or "advanced" based on performance.
-
-Format as JSON:
-{{{{
-    "performance_summary": "...",
-    "strengths": ["strength 1", "strength 2", ...],
-    "areas_to_improve": ["area 1", "area 2", ...],
-    "recommended_topics": ["topic 1", "topic 2", "topic 3"],
-    "next_difficulty": "undergrad" or "med" or "advanced"
-}}}}"""),
-            ("human", "Analyze this session and recommend next topics.")
-        ])
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        result = chain.run(results=results_text)
+        if user_id and self.event_log is not None:
+            try:
+                self.event_log.record(
+                    user_id=user_id,
+                    topic=topic,
+                    kind=FLASH_CARD_SESSION,
+                    score=total_score,
+                    max_score=max_score,
+                    details={"cards": len(card_results)}
+                )
+            except Exception as e:
+                logger.error(f"Error recording flash card session: {e}")
         
-        import json
-        import re
-        try:
-            match = re.search(r'\{{[\s\S]*\}}', result)
-            if match:
-                data = json.loads(match.group())
-                return {
-                    "performance_summary": data.get("performance_summary", ""),
-                    "strengths": data.get("strengths", []),
-                    "areas_to_improve": data.get("areas_to_improve", []),
-                    "recommended_topics": data.get("recommended_topics", []),
-                    "next_difficulty": data.get("next_difficulty", "undergrad")
-                }
-        except Exception as e:
-            logger.error(f"Error parsing analysis: {e}")
+        # Numbers are computed here; the LLM only writes the narrative summary
+        stats = self._flash_card_session_stats(card_results)
         
-        # Fallback: build personalized analysis from card_results
-        strengths = []
-        areas_to_improve = []
-        for r in correct_items[:3]:
-            q = (r.get("question") or "?")[:100]
-            strengths.append(f"Got it right: {q}..." if len(str(r.get("question", ""))) > 100 else f"Got it right: {q}")
-        for r in incorrect_items[:3]:
-            q = (r.get("question") or "?")[:80]
-            correct_ans = (str(r.get("correct_answer") or ""))[:80]
-            areas_to_improve.append(f"Review: {q} — key point: {correct_ans}")
-        for r in partial_items[:2]:
-            q = (r.get("question") or "?")[:80]
-            areas_to_improve.append(f"Partial: {q} — review the complete answer")
-
+        strengths = [f"{name} ({score:.0%})" for name, score in stats["strong_structures"][:3]]
+        areas_to_improve = [f"{name} ({score:.0%})" for name, score in stats["weak_structures"][:3]]
+        if stats["partial_pattern"]:
+            areas_to_improve.append(stats["partial_pattern"])
+        if not strengths:
+            strengths = [f"Got it right: {(r.get('question') or '?')[:80]}" for r in card_results if r.get("score", 0) == 1.0][:3]
+        if not areas_to_improve:
+            areas_to_improve = [
+                f"Review: {(r.get('question') or '?')[:80]} — key point: {str(r.get('correct_answer') or '')[:80]}"
+                for r in card_results if r.get("score", 0) < 1.0
+            ][:3]
         if not strengths:
             strengths = ["You completed the session", "Keep building on the concepts you attempted"]
         if not areas_to_improve:
             areas_to_improve = ["Review any partial answers to strengthen recall", "Try related topics to deepen understanding"]
-
+        
         if performance_pct >= 80:
-            summary = f"Strong performance on {topic}! You scored {total_score}/{max_score}. Focus on the few weak spots below."
             next_diff = "advanced"
         elif performance_pct >= 60:
-            summary = f"Good effort on {topic} ({total_score}/{max_score}). You have a solid base—here’s what to sharpen."
             next_diff = "med"
         else:
-            summary = f"On {topic} you scored {total_score}/{max_score}. Review the concepts below and try again."
             next_diff = "undergrad"
-
-        return {
-            "performance_summary": summary,
+        
+        recommended = stats["recommended_topics"]
+        for fallback in [topic, "cranial nerves", "brain anatomy", "spinal cord"]:
+            if len(recommended) >= 4:
+                break
+            if fallback and fallback not in recommended:
+                recommended.append(fallback)
+        
+        analysis = {
+            "performance_summary": self._flash_card_session_summary(topic, total_score, max_score, performance_pct, stats),
             "strengths": strengths,
             "areas_to_improve": areas_to_improve,
-            "recommended_topics": [topic, "cranial nerves", "brain anatomy", "spinal cord"][:4] if topic else ["cranial nerves", "brain anatomy", "spinal cord"],
+            "recommended_topics": recommended[:4],
             "next_difficulty": next_diff
         }
+        self._prefetch_follow_ups({"completion_data": analysis}, next_diff)
+        return analysis
+
+    def _prefetch_follow_ups(self, result: Dict[str, Any], difficulty: str) -> None:
+        """Warm retrieval for recommended follow-up topics, as study notes would search for them."""
+        if self.prefetcher is None:
+            return
+        topics = (result.get("completion_data") or {}).get("recommended_topics") or []
+        try:
+            filter_dict = {"difficulty_level": DifficultyLevel(difficulty).value}
+        except ValueError:
+            return
+        for topic in topics[:settings.prefetch_max_pending]:
+            if isinstance(topic, str) and topic.strip():
+                self.prefetcher.submit(
+                    ("study_notes", topic.strip().lower(), filter_dict["difficulty_level"]),
+                    lambda topic=topic: self._search_chunks(topic, 10, filter_dict)
+                )
+
+    def _flash_card_session_stats(self, card_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Per-structure scores, partial-credit pattern and recommended topics.
+        
+        Cards are mapped to structures through the metadata of the best
+        matching chunk for each question (one embedding call, one search).
+        """
+        counts = {"correct": 0, "partial": 0, "incorrect": 0}
+        for r in card_results:
+            score = r.get("score", 0)
+            counts["correct" if score == 1.0 else "partial" if score > 0 else "incorrect"] += 1
+        
+        metadata = [{} for _ in card_results]
+        questions = [str(r.get("question") or "") for r in card_results]
+        try:
+            embeddings = self.vector_store.embed_queries(questions)
+            matches = self.vector_store.search_batch(embeddings, top_k=1, min_score=0.3)
+            metadata = [m[0]["metadata"] if m else {} for m in matches]
+        except Exception as e:
+            logger.warning(f"Could not map flash cards to structures: {e}")
+        
+        by_structure: Dict[str, List[float]] = {}
+        weak_systems: List[str] = []
+        for r, meta in zip(card_results, metadata):
+            name = r.get("structure") or meta.get("structure_name")
+            if name:
+                by_structure.setdefault(name, []).append(float(r.get("score", 0)))
+            if r.get("score", 0) < 1.0 and meta.get("system") not in (None, "other", *weak_systems):
+                weak_systems.append(meta["system"])
+        structure_scores = {name: sum(v) / len(v) for name, v in by_structure.items()}
+        weak = sorted(((n, s) for n, s in structure_scores.items() if s < 0.6), key=lambda x: x[1])
+        strong = sorted(((n, s) for n, s in structure_scores.items() if s >= 0.9), key=lambda x: -x[1])
+        
+        # Partial credit on enumeration questions usually means incomplete lists
+        list_indicators = ['six', 'seven', 'eight', 'nine', 'ten', 'eleven', 'twelve', 'all ', 'list ', 'name all', 'enumerate', 'composed', 'components']
+        partial_questions = [q.lower() for q, r in zip(questions, card_results) if 0 < r.get("score", 0) < 1.0]
+        partial_pattern = None
+        if partial_questions:
+            list_partials = sum(1 for q in partial_questions if any(x in q for x in list_indicators))
+            if list_partials * 2 >= len(partial_questions):
+                partial_pattern = f"Incomplete lists: {list_partials} of {len(partial_questions)} partial answers missed items from an enumeration"
+            else:
+                partial_pattern = f"{len(partial_questions)} partially correct answers — review the complete definitions"
+        
+        recommended = [name for name, _ in weak] + [f"{system.replace('_', ' ')} system" for system in weak_systems]
+        return {
+            "counts": counts,
+            "weak_structures": weak,
+            "strong_structures": strong,
+            "partial_pattern": partial_pattern,
+            "recommended_topics": list(dict.fromkeys(recommended)),
+            "missed_questions": [q for q, r in zip(questions, card_results) if r.get("score", 0) < 1.0]
+        }
+
+    def _flash_card_session_summary(
+        self,
+        topic: str,
+        total_score: float,
+        max_score: float,
+        performance_pct: float,
+        stats: Dict[str, Any]
+    ) -> str:
+        """Narrative summary from a compact, fixed-size digest of the session."""
+        counts = stats["counts"]
+        digest = (
+            f"Topic: {topic}\n"
+            f"Score: {total_score}/{max_score} ({performance_pct:.0f}%) — "
+            f"{counts['correct']} correct, {counts['partial']} partial, {counts['incorrect']} incorrect\n"
+            f"Weak structures: {', '.join(n for n, _ in stats['weak_structures'][:3]) or 'none'}\n"
+            f"Strong structures: {', '.join(n for n, _ in stats['strong_structures'][:3]) or 'none'}\n"
+            f"Partial-credit pattern: {stats['partial_pattern'] or 'none'}\n"
+            f"Examples missed: {'; '.join(q[:80] for q in stats['missed_questions'][:3]) or 'none'}"
+        )
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", """You are a neuroanatomy learning coach. Write a 2-3 sentence performance summary for this flash card session.
+Reference the topic, the score and the specific weak and strong areas. Be encouraging and specific. Output only the summary.
+
+{digest}"""),
+            ("human", "Summarize this session.")
+        ])
+        try:
+            summary = LLMChain(llm=self.llm, prompt=prompt).run(digest=digest).strip()
+            if summary:
+                return summary
+        except Exception as e:
+            logger.error(f"Error generating session summary: {e}")
+        
+        if performance_pct >= 80:
+            return f"Strong performance on {topic}! You scored {total_score}/{max_score}. Focus on the few weak spots below."
+        if performance_pct >= 60:
+            return f"Good effort on {topic} ({total_score}/{max_score}). You have a solid base—here’s what to sharpen."
+        return f"On {topic} you scored {total_score}/{max_score}. Review the concepts below and try again."
 
     def start_clinical_session(
         self,
         topic: Optional[str] = None,
         difficulty_level: DifficultyLevel = DifficultyLevel.MED,
-        system_filter: Optional[SystemType] = None
+        system_filter: Optional[SystemType] = None,
+        user_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """Start an interactive clinical case simulation."""
         session_id = str(uuid.uuid4())
-        query = topic or "clinical neuroanatomy case presentation emergency"
-        
-        # Get clinical context
-        filter_dict = {"clinical_relevance": True}
-        if system_filter:
-            filter_dict["system"] = system_filter.value
-        
-        chunks = self._search_chunks(query, 5, filter_dict)
-        if not chunks:
-            chunks = self.vector_store.search(query=query or "neuroanatomy", top_k=5, filter_dict=None, min_score=0.2)
-        
-        context = "\n\n".join([c["content"] for c in chunks]) if chunks else "General neuroanatomy clinical knowledge"
         
-        # Generate initial presentation
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are creating an IMMERSIVE clinical simulation. The student is now in the OR/emergency room.
-
-Context: {context}
-
-Create a realistic patient presentation. Include:
-1. Brief initial presentation (age, chief complaint, how they arrived)
-2. What the student can see RIGHT NOW (patient appearance, vital signs)
-3. The clinical scenario context (why this case matters)
-
-Make it feel REAL and urgent. Use present tense. Keep it concise - just the initial scene.
-Format with **bold** for key vitals/findings."""),
-            ("human", "Create an immersive clinical scenario about {topic}")
-        ])
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        initial_presentation = chain.run(context=context, topic=topic or "neuroanatomy emergency")
+        entry = None
+        if topic is None and self.case_pool is not None:
+            entry = self.case_pool.pop(SESSION_OPENING, system_filter, difficulty_level)
+        if entry is not None:
+            chunks = entry["chunks"]
+            initial_presentation = entry["initial_presentation"]
+        else:
+            query = topic or "clinical neuroanatomy case presentation emergency"
+            
+            # Get clinical context
+            filter_dict = {"clinical_relevance": True}
+            if system_filter:
+                filter_dict["system"] = system_filter.value
+            
+            chunks = self._search_chunks(query, 5, filter_dict)
+            if not chunks:
+                chunks = self.vector_store.search(query=query or "neuroanatomy", top_k=5, filter_dict=None, min_score=0.2, use_mmr=self.use_mmr)
+            initial_presentation = self._write_clinical_opening(chunks, topic)
         
         # Generate patient name
-        import random
         first_names = ["Alex", "Jordan", "Sam", "Taylor", "Morgan", "Casey", "Riley", "Avery"]
         last_names = ["Chen", "Patel", "Johnson", "Garcia", "Kim", "Williams", "Brown", "Martinez"]
         patient_name = f"{random.choice(first_names)} {random.choice(last_names)}"
         
         # Store session
-        self.clinical_sessions[session_id] = {
+        for chunk in chunks:
+            self.chunk_cache.set(chunk["chunk_id"], chunk["content"])
+        self.clinical_sessions.save(session_id, {
+            "user_id": user_id,
             "patient_name": patient_name,
             "topic": topic or "neuroanatomy",
             "difficulty": difficulty_level.value,
             "stage": "initial",
-            "context": context,
-            "chunks": chunks,
+            "chunk_ids": [c["chunk_id"] for c in chunks],
             "initial_presentation": initial_presentation,
             "conversation_history": [],
             "information_gathered": [],
@@ -628,7 +906,7 @@ Format with **bold** for key vitals/findings."""),
             "incorrect_decisions": [],
             "hints_used": 0,
             "max_hints": 3
-        }
+        })
         
         return {
             "session_id": session_id,
@@ -639,21 +917,137 @@ Format with **bold** for key vitals/findings."""),
             "available_hints": 3
         }
 
+    def _write_clinical_opening(self, chunks: List[Dict[str, Any]], topic: Optional[str]) -> str:
+        """Generate the immersive initial presentation for a clinical session."""
+        context = self._prompt_context(chunks) if chunks else "General neuroanatomy clinical knowledge"
+        
+        # Generate initial presentation
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", """You are creating an IMMERSIVE clinical simulation. The student is now in the OR/emergency room.
+
+Context: {context}
+
+Create a realistic patient presentation. Include:
+1. Brief initial presentation (age, chief complaint, how they arrived)
+2. What the student can see RIGHT NOW (patient appearance, vital signs)
+3. The clinical scenario context (why this case matters)
+
+Make it feel REAL and urgent. Use present tense. Keep it concise - just the initial scene.
+Format with **bold** for key vitals/findings."""),
+            ("human", "Create an immersive clinical scenario about {topic}")
+        ])
+        chain = LLMChain(llm=self.llm, prompt=prompt)
+        return chain.run(context=context, topic=topic or "neuroanatomy emergency")
+
+    def _build_pool_entry(
+        self,
+        kind: str,
+        system_filter: Optional[SystemType],
+        difficulty_level: DifficultyLevel
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Generate one case for the clinical case pool from clinical-relevance chunks.
+        
+        Chunks are sampled from a wider candidate set so pooled cases for the same key differ.
+        """
+        filter_dict = {"clinical_relevance": True}
+        if system_filter:
+            filter_dict["system"] = system_filter.value
+        if kind == CASE_VIGNETTE:
+            filter_dict["difficulty_level"] = difficulty_level.value
+        size = 8 if kind == CASE_VIGNETTE else 5
+        
+        query = "clinical neuroanatomy case presentation emergency"
+        candidates = self._search_chunks(query, size * settings.clinical_case_pool_sample_factor, filter_dict)
+        chunks = random.sample(candidates, min(size, len(candidates)))
+        
+        if kind == SESSION_OPENING:
+            return {
+                "chunk_ids": [c["chunk_id"] for c in chunks],
+                "chunks": [{"chunk_id": c["chunk_id"], "content": c["content"]} for c in chunks],
+                "initial_presentation": self._write_clinical_opening(chunks, None)
+            }
+        if not chunks:
+            return None  # General-knowledge fallbacks are generated per request, never pooled
+        case = self._write_clinical_case(chunks, None, difficulty_level)
+        return {"chunk_ids": [c["chunk_id"] for c in chunks], "case": case}
+
+    def warm_case_pool(self) -> None:
+        """Start filling the pool with topic-less session openings for every difficulty."""
+        if self.case_pool is None:
+            return
+        for difficulty_level in DifficultyLevel:
+            self.case_pool.schedule_refill(SESSION_OPENING, None, difficulty_level)
+
+    def _on_chunks_changed(self, added_ids: List[str], removed_ids: List[str]) -> None:
+        """Drop pooled cases that no longer match the knowledge base."""
+        if self.case_pool is None:
+            return
+        if removed_ids:
+            self.case_pool.invalidate_chunks(removed_ids)
+        if added_ids:
+            self.case_pool.drop_ungrounded()
+
     def interact_clinical_session(
         self,
         session_id: str,
         user_message: str,
-        request_hint: bool = False
+        request_hint: bool = False,
+        on_delta: Optional[DeltaCallback] = None
     ) -> Dict[str, Any]:
-        """Handle interaction in clinical session."""
-        if session_id not in self.clinical_sessions:
+        """
+        Handle interaction in clinical session.
+        
+        With `on_delta`, the reply ("ai_response") or hint ("hint_given") is reported as
+        (field, text) pieces while it is generated.
+        """
+        session = self.clinical_sessions.get(session_id)
+        if session is None:
             raise ValueError("Session not found")
         
-        session = self.clinical_sessions[session_id]
+        try:
+            return self._interact(session, user_message, request_hint, on_delta)
+        finally:
+            self.clinical_sessions.save(session_id, session)
+            self.history.schedule_fold(session_id, session)
+
+    def _session_context(self, session: Dict, max_chars: Optional[int] = None) -> str:
+        """
+        Rehydrate the session's context from its chunk IDs (chunk cache, then vector store).
+        
+        Per-turn prompts pass `max_chars`; chunks are kept in retrieval order until the budget runs out.
+        """
+        chunk_ids = session.get("chunk_ids") or []
+        if not chunk_ids:
+            return "General neuroanatomy clinical knowledge"
         
+        contents = {chunk_id: self.chunk_cache.get(chunk_id) for chunk_id in chunk_ids}
+        missing = [chunk_id for chunk_id, content in contents.items() if content is None]
+        if missing:
+            try:
+                for chunk in self.vector_store.get_chunks(missing):
+                    self.chunk_cache.set(chunk["chunk_id"], chunk["content"])
+                    contents[chunk["chunk_id"]] = chunk["content"]
+            except Exception as e:
+                logger.warning(f"Could not rehydrate session chunks: {e}")
+        
+        context = "\n\n".join(contents[chunk_id] for chunk_id in chunk_ids if contents.get(chunk_id))
+        if max_chars is not None and len(context) > max_chars:
+            cut = context.rfind("\n\n", 0, max_chars)
+            context = context[:cut] if cut > max_chars // 2 else context[:max_chars]
+        return context or "General neuroanatomy clinical knowledge"
+
+    def _interact(
+        self,
+        session: Dict,
+        user_message: str,
+        request_hint: bool,
+        on_delta: Optional[DeltaCallback] = None
+    ) -> Dict[str, Any]:
+        """Advance a clinical session by one student message."""
         # Handle hint request
         if request_hint and session["hints_used"] < session["max_hints"]:
-            hint = self._generate_clinical_hint(session, user_message)
+            hint = self._generate_clinical_hint(session, user_message, on_delta)
             session["hints_used"] += 1
             return {
                 "ai_response": "Here's a hint to guide you:",
@@ -669,10 +1063,7 @@ Format with **bold** for key vitals/findings."""),
             }
         
         # Add to conversation history
-        session["conversation_history"].append({
-            "role": "student",
-            "message": user_message
-        })
+        self.history.append(session, "student", user_message)
         session["questions_asked"] += 1
         
         # Check if student wants to end the case (e.g. "im done", "I'm done", "done", "that's all")
@@ -683,7 +1074,9 @@ Format with **bold** for key vitals/findings."""),
         if session["stage"] in ("diagnosis", "gathering_info") and wants_to_end:
             session["stage"] = "complete"
             completion = self._complete_session(session)
-            session["conversation_history"].append({"role": "ai", "message": "Clinical simulation complete!"})
+            self.history.append(session, "ai", "Clinical simulation complete!")
+            self._record_session_outcome(session, completion)
+            self._prefetch_follow_ups(completion, session["difficulty"])
             return completion
         
         # Determine stage and generate response
@@ -691,31 +1084,51 @@ Format with **bold** for key vitals/findings."""),
         
         if stage == "initial":
             # Student is asking questions to gather information
-            response_data = self._handle_information_gathering(session, user_message)
+            response_data = self._handle_information_gathering(session, user_message, on_delta=on_delta)
         elif stage == "gathering_info":
-            # Continue gathering OR transition to diagnosis
-            if session["questions_asked"] >= 3:
-                # Evaluate if enough info gathered
-                response_data = self._transition_to_diagnosis(session, user_message)
-            else:
-                response_data = self._handle_information_gathering(session, user_message)
+            # Continue gathering; after enough questions the same turn can move on to diagnosis
+            response_data = self._handle_information_gathering(
+                session, user_message, may_advance=session["questions_asked"] >= 3, on_delta=on_delta
+            )
         elif stage == "diagnosis":
             # Student is making clinical decisions
-            response_data = self._handle_diagnosis_phase(session, user_message)
+            response_data = self._handle_diagnosis_phase(session, user_message, on_delta)
         else:
             response_data = self._complete_session(session)
         
         # Update session
-        session["conversation_history"].append({
-            "role": "ai",
-            "message": response_data["ai_response"]
-        })
+        self.history.append(session, "ai", response_data["ai_response"])
+        if response_data.get("session_complete"):
+            self._record_session_outcome(session, response_data)
+            self._prefetch_follow_ups(response_data, session["difficulty"])
         
         return response_data
 
-    def _generate_clinical_hint(self, session: Dict, user_context: str) -> str:
+    def _record_session_outcome(self, session: Dict, completion: Dict[str, Any]) -> None:
+        """Log a finished clinical session to the user's learning history."""
+        if not session.get("user_id") or self.event_log is None or session.get("outcome_recorded"):
+            return
+        session["outcome_recorded"] = True
+        data = completion.get("completion_data") or {}
+        try:
+            score = float(data.get("clinical_reasoning_score", 0.0))
+        except (TypeError, ValueError):
+            score = 0.0
+        try:
+            self.event_log.record(
+                user_id=session["user_id"],
+                topic=session["topic"],
+                kind=CLINICAL_SESSION,
+                score=min(max(score, 0.0), 1.0),
+                difficulty_level=session["difficulty"],
+                details={"final_diagnosis_correct": bool(data.get("final_diagnosis_correct"))}
+            )
+        except Exception as e:
+            logger.error(f"Error recording clinical session: {e}")
+
+    def _generate_clinical_hint(self, session: Dict, user_context: str, on_delta: Optional[DeltaCallback] = None) -> str:
         """Generate a hint based on current stage."""
-        conversation = "\n".join([f"{h['role']}: {h['message']}" for h in session["conversation_history"][-5:]])
+        conversation = self.history.render(session, last=5)
         
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are providing a SUBTLE HINT (not the answer!) for a clinical case.
@@ -729,46 +1142,146 @@ Provide a gentle hint that guides thinking without giving away the answer.
 Make it Socratic - ask a leading question or point to what they should consider."""),
             ("human", "Provide a helpful hint.")
         ])
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        return chain.run(stage=session["stage"], conversation=conversation, user_context=user_context)
+        inputs = {"stage": session["stage"], "conversation": conversation, "user_context": user_context}
+        if on_delta is None:
+            chain = LLMChain(llm=self.llm, prompt=prompt)
+            return chain.run(**inputs)
+        parts = []
+        for chunk in (prompt | self.llm).stream(inputs):
+            parts.append(chunk.content)
+            on_delta("hint_given", chunk.content)
+        return "".join(parts)
+
+    def _structured_turn(
+        self,
+        prompt: ChatPromptTemplate,
+        on_delta: Optional[DeltaCallback] = None,
+        **inputs
+    ) -> Tuple[Optional[ClinicalTurnResult], str]:
+        """
+        Run one JSON-mode generation for a clinical turn and validate it.
+        
+        Returns (result, raw text); result is None when the output does not validate. Callers fall
+        back deterministically instead of issuing another call. With `on_delta`, the "response"
+        field is reported as "ai_response" text while the JSON is still being generated.
+        """
+        chain = prompt | self.llm.bind(response_format={"type": "json_object"})
+        try:
+            if on_delta is None:
+                raw = chain.invoke(inputs).content
+            else:
+                streamer = JsonFieldStreamer(("response",), lambda _, text: on_delta("ai_response", text))
+                parts = []
+                for chunk in chain.stream(inputs):
+                    parts.append(chunk.content)
+                    streamer.feed(chunk.content)
+                raw = "".join(parts)
+        except Exception as e:
+            logger.error(f"Error generating clinical turn: {e}")
+            return None, ""
+        match = re.search(r'\{[\s\S]*\}', raw)
+        try:
+            return ClinicalTurnResult.model_validate_json(match.group() if match else raw), raw
+        except ValidationError as e:
+            logger.warning(f"Clinical turn output failed validation: {e}")
+            return None, raw
 
-    def _handle_information_gathering(self, session: Dict, user_message: str) -> Dict[str, Any]:
-        """Handle student asking questions to gather patient information."""
-        conversation = "\n".join([f"{h['role']}: {h['message']}" for h in session["conversation_history"][-8:]])
+    def _handle_information_gathering(
+        self,
+        session: Dict,
+        user_message: str,
+        may_advance: bool = False,
+        on_delta: Optional[DeltaCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Answer the student's question as the clinical team.
+        
+        With `may_advance`, the same generation also decides whether the student has enough
+        information and, if so, poses the diagnostic question.
+        """
+        if may_advance:
+            advance_instruction = """The student has already asked several questions. If they now have the key information
+(history, exam findings, etc.), set "next_stage" to "diagnosis", end your reply with a short transition, and put
+ONE diagnostic question in "question_posed" (diagnosis, localization, next step, or intervention; challenging but
+fair and specific). If critical information is still missing, keep "next_stage" null and end your reply with ONE
+guiding question that leads them to it."""
+        else:
+            advance_instruction = 'Keep "next_stage" and "question_posed" null.'
         
         prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are the clinical team in an OR/ER scenario. The student asked: {user_message}
+            ("system", """You are the clinical team in an OR/ER scenario.
 
 Context: {context}
 Patient: {patient_name}
 Conversation so far:
 {conversation}
+Information the student has asked about:
+{gathered}
 
 If the question is relevant (history, exam, vitals, labs, imaging), provide the information in a realistic way.
 If the question is good clinical reasoning, acknowledge it.
 If the question is off-track, gently redirect.
+Respond naturally as medical staff would. Use **bold** for key findings. Keep responses concise.
+
+{advance_instruction}
 
-Respond naturally as medical staff would. Use **bold** for key findings. Keep responses concise."""),
+Output ONLY a JSON object:
+{{
+    "response": "your reply to the student",
+    "revealed_information": "the findings you revealed in this reply, or null",
+    "next_stage": "diagnosis" or null,
+    "question_posed": "the diagnostic question, or null"
+}}"""),
             ("human", "The student asked: {user_message}")
         ])
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        ai_response = chain.run(
+        result, raw = self._structured_turn(
+            prompt,
+            on_delta,
             user_message=user_message,
-            context=session["context"],
+            context=self._session_context(session, settings.clinical_context_max_chars),
             patient_name=session["patient_name"],
-            conversation=conversation
+            conversation=self.history.render(session),
+            gathered=self.history.gathered(session) or "(nothing yet)",
+            advance_instruction=advance_instruction
         )
         
         # Track what information was gathered
-        session["information_gathered"].append(user_message)
+        self.history.record_gathered(session, user_message)
+        
+        if result is not None:
+            ai_response = result.response
+            revealed = result.revealed_information
+            advance = may_advance and result.next_stage == "diagnosis"
+            question = result.question_posed
+        else:
+            # Plain text is still a usable reply; with may_advance, move on after enough questions
+            ai_response = raw.strip() if raw.strip() and not raw.lstrip().startswith("{") else None
+            revealed = None
+            advance = may_advance
+            question = None
+        
+        if advance:
+            session["stage"] = "diagnosis"
+            return {
+                "ai_response": ai_response or "Based on what you've gathered, let's proceed to diagnosis.",
+                "revealed_information": revealed,
+                "stage": "diagnosis",
+                "requires_answer": True,
+                "question_posed": question or DEFAULT_DIAGNOSIS_QUESTION,
+                "is_correct_path": None,
+                "guidance": None,
+                "hint_given": None,
+                "available_hints": session["max_hints"] - session["hints_used"],
+                "session_complete": False
+            }
         
         # Update stage if enough questions asked
         if session["questions_asked"] >= 2:
             session["stage"] = "gathering_info"
         
         return {
-            "ai_response": ai_response,
-            "revealed_information": None,
+            "ai_response": ai_response or "What else would you like to know?",
+            "revealed_information": revealed,
             "stage": session["stage"],
             "requires_answer": False,
             "question_posed": None,
@@ -779,109 +1292,13 @@ Respond naturally as medical staff would. Use **bold** for key findings. Keep re
             "session_complete": False
         }
 
-    def _transition_to_diagnosis(self, session: Dict, user_message: str) -> Dict[str, Any]:
-        """Transition from info gathering to diagnosis phase."""
-        conversation = "\n".join([f"{h['role']}: {h['message']}" for h in session["conversation_history"]])
-        gathered = "\n".join(session["information_gathered"])
-        
-        # Evaluate if student has enough information
-        eval_prompt = ChatPromptTemplate.from_messages([
-            ("system", """The student has gathered information. Evaluate if they have ENOUGH to proceed to diagnosis.
-
-Information gathered:
-{gathered}
-
-Context: {context}
-
-If they have key information (history, exam findings, etc.), transition them to diagnosis phase.
-If critical information is missing, ask them ONE guiding question to get that information first.
-
-Format as JSON:
-{{{{
-    "ready_for_diagnosis": true/false,
-    "transition_message": "message to student",
-    "missing_info_question": "question to ask" or null
-}}}}"""),
-            ("human", "Evaluate readiness")
-        ])
-        chain = LLMChain(llm=self.llm, prompt=eval_prompt)
-        result = chain.run(gathered=gathered, context=session["context"])
-        
-        import json
-        import re
-        try:
-            match = re.search(r'\{{[\s\S]*\}}', result)
-            if match:
-                data = json.loads(match.group())
-                if data.get("ready_for_diagnosis"):
-                    # Transition to diagnosis
-                    session["stage"] = "diagnosis"
-                    question = self._generate_diagnosis_question(session)
-                    return {
-                        "ai_response": data.get("transition_message", "You've gathered good information. Now let's proceed."),
-                        "revealed_information": None,
-                        "stage": "diagnosis",
-                        "requires_answer": True,
-                        "question_posed": question,
-                        "is_correct_path": None,
-                        "guidance": None,
-                        "hint_given": None,
-                        "available_hints": session["max_hints"] - session["hints_used"],
-                        "session_complete": False
-                    }
-                else:
-                    # Need more info
-                    return {
-                        "ai_response": data.get("missing_info_question", "What else would you like to know?"),
-                        "revealed_information": None,
-                        "stage": "gathering_info",
-                        "requires_answer": False,
-                        "question_posed": None,
-                        "is_correct_path": None,
-                        "guidance": None,
-                        "hint_given": None,
-                        "available_hints": session["max_hints"] - session["hints_used"],
-                        "session_complete": False
-                    }
-        except Exception:
-            pass
-        
-        # Fallback: transition after 3+ questions
-        session["stage"] = "diagnosis"
-        question = self._generate_diagnosis_question(session)
-        return {
-            "ai_response": "Based on what you've gathered, let's proceed to diagnosis.",
-            "revealed_information": None,
-            "stage": "diagnosis",
-            "requires_answer": True,
-            "question_posed": question,
-            "is_correct_path": None,
-            "guidance": None,
-            "hint_given": None,
-            "available_hints": session["max_hints"] - session["hints_used"],
-            "session_complete": False
-        }
-
-    def _generate_diagnosis_question(self, session: Dict) -> str:
-        """Generate a diagnostic question based on the case."""
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """Based on this clinical scenario, generate a diagnostic question.
-
-Context: {context}
-Information student gathered: {gathered}
-
-Ask them to make a clinical decision: diagnosis, localization, next step, or intervention.
-Make it challenging but fair. Be specific."""),
-            ("human", "Generate diagnostic question")
-        ])
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        gathered = "\n".join(session["information_gathered"])
-        return chain.run(context=session["context"], gathered=gathered)
-
-    def _handle_diagnosis_phase(self, session: Dict, user_message: str) -> Dict[str, Any]:
+    def _handle_diagnosis_phase(
+        self,
+        session: Dict,
+        user_message: str,
+        on_delta: Optional[DeltaCallback] = None
+    ) -> Dict[str, Any]:
         """Handle student's diagnostic reasoning and decisions."""
-        conversation = "\n".join([f"{h['role']}: {h['message']}" for h in session["conversation_history"]])
-        
         # Heuristic: detect obviously correct answers (localization with MCA, Broca, Wernicke, etc.)
         msg_lower = user_message.lower()
         correct_signals = [
@@ -906,58 +1323,64 @@ CRITICAL: Be LENIENT. If the student correctly identifies:
 - Vascular territory (e.g. left MCA, MCA stroke)
 - Anatomical localization (Broca's, Wernicke's, motor cortex, frontal eye fields, internal capsule)
 - The correct diagnosis (stroke, infarct) with reasonable localization
-...then is_correct MUST be true and should_complete should be true if their answer is thorough.
+...then is_correct MUST be true, and next_stage should be "complete" if their answer is thorough.
 
 Only mark is_correct=false if they are WRONG (wrong vessel, wrong hemisphere, wrong diagnosis).
-If correct: give enthusiastic feedback, set should_complete=true.
-If wrong: provide 1-2 GUIDING QUESTIONS (Socratic), set should_complete=false.
+If correct: give enthusiastic feedback in "response".
+If wrong: provide 1-2 GUIDING QUESTIONS (Socratic), keep next_stage null.
 
-Output ONLY valid JSON, no other text:
-{{{{
+When next_stage is "complete", the case ends with this reply: also fill "completion" with an analysis
+of the whole simulation. Earlier correct decisions: {correct}. Earlier incorrect decisions: {incorrect}.
+Hints used: {hints}. Otherwise keep "completion" null.
+
+Output ONLY a JSON object:
+{{
+    "response": "your response to the student",
     "is_correct": true or false,
-    "feedback": "your response to the student",
     "guiding_questions": ["q1", "q2"] or null,
-    "should_complete": true or false
-}}}}"""),
+    "next_stage": "complete" or null,
+    "completion": {{
+        "performance_summary": "overall assessment",
+        "correct_decisions": ["decision 1", "decision 2"],
+        "missed_points": ["point 1", "point 2"],
+        "clinical_reasoning_score": 0.0-1.0,
+        "final_diagnosis_correct": true/false,
+        "learning_points": ["point 1", "point 2", "point 3"],
+        "recommended_topics": ["topic 1", "topic 2", "topic 3"]
+    }} or null
+}}"""),
             ("human", "Evaluate. Reply with JSON only.")
         ])
-        chain = LLMChain(llm=self.llm, prompt=eval_prompt)
-        result = chain.run(
-            context=session["context"],
-            conversation=conversation,
-            user_message=user_message
+        parsed, _ = self._structured_turn(
+            eval_prompt,
+            on_delta,
+            context=self._session_context(session, settings.clinical_context_max_chars),
+            conversation=self.history.render(session),
+            user_message=user_message,
+            correct=self.history.decisions(session["correct_decisions"]),
+            incorrect=self.history.decisions(session["incorrect_decisions"]),
+            hints=session["hints_used"]
         )
         
-        import json
-        import re
-        parsed = None
-        try:
-            match = re.search(r'\{[\s\S]*\}', result)
-            if match:
-                parsed = json.loads(match.group())
-        except Exception as e:
-            logger.warning(f"Diagnosis eval JSON parse failed: {e}")
-        
-        if parsed is not None:
-            is_correct = parsed.get("is_correct", False)
+        if parsed is not None and parsed.is_correct is not None:
+            is_correct = parsed.is_correct
             
             if is_correct:
                 session["correct_decisions"].append(user_message)
             else:
                 session["incorrect_decisions"].append(user_message)
             
-            if parsed.get("should_complete"):
+            if parsed.next_stage == "complete":
+                # The evaluation was already shown (and streamed); the analysis came with it
                 session["stage"] = "complete"
-                completion = self._complete_session(session)
-                return completion
+                return self._completion_response(session, parsed.completion, parsed.response)
             
             guidance = None
-            if not is_correct and parsed.get("guiding_questions"):
-                gq = parsed["guiding_questions"]
-                guidance = "\n\n".join(gq) if isinstance(gq, list) else str(gq)
+            if not is_correct and parsed.guiding_questions:
+                guidance = "\n\n".join(parsed.guiding_questions)
             
             return {
-                "ai_response": parsed.get("feedback", "Good reasoning."),
+                "ai_response": parsed.response,
                 "revealed_information": None,
                 "stage": "diagnosis",
                 "requires_answer": True if not is_correct else False,
@@ -969,28 +1392,11 @@ Output ONLY valid JSON, no other text:
                 "session_complete": False
             }
         
-        # Fallback when JSON parsing fails: use heuristic + simple LLM
+        # Fallback when the output does not validate: use the heuristic, no second call
         if likely_correct_heuristic:
             session["correct_decisions"].append(user_message)
             session["stage"] = "complete"
-            completion = self._complete_session(session)
-            return completion
-        
-        # Last resort: ask simple yes/no, then complete if yes
-        try:
-            simple_prompt = ChatPromptTemplate.from_messages([
-                ("system", """Answer ONLY with a single word: YES or NO.
-Given the clinical case and student's answer, is their localization/diagnosis correct?"""),
-                ("human", "Case summary: {context}\nStudent: {user_message}")
-            ])
-            simple_chain = LLMChain(llm=self.llm, prompt=simple_prompt)
-            simple_result = simple_chain.run(context=session["context"][:1500], user_message=user_message)
-            if "yes" in simple_result.strip().lower():
-                session["correct_decisions"].append(user_message)
-                session["stage"] = "complete"
-                return self._complete_session(session)
-        except Exception:
-            pass
+            return self._completion_response(session, None, "Session complete!")
         
         # Final fallback: do NOT repeat the same generic message; vary it
         return {
@@ -1008,7 +1414,7 @@ Given the clinical case and student's answer, is their localization/diagnosis co
 
     def _complete_session(self, session: Dict) -> Dict[str, Any]:
         """Complete the clinical session and provide analysis."""
-        conversation = "\n".join([f"{h['role']}: {h['message']}" for h in session["conversation_history"]])
+        conversation = self.history.render(session)
         
         prompt = ChatPromptTemplate.from_messages([
             ("system", """Analyze this completed clinical simulation.
@@ -1035,37 +1441,45 @@ Provide comprehensive analysis. Format as JSON:
         chain = LLMChain(llm=self.llm, prompt=prompt)
         result = chain.run(
             conversation=conversation,
-            correct=str(session["correct_decisions"]),
-            incorrect=str(session["incorrect_decisions"]),
+            correct=self.history.decisions(session["correct_decisions"]),
+            incorrect=self.history.decisions(session["incorrect_decisions"]),
             hints=session["hints_used"]
         )
         
         import json
         import re
+        data = None
         try:
             match = re.search(r'\{{[\s\S]*\}}', result)
             if match:
                 data = json.loads(match.group())
-                return {
-                    "ai_response": "Clinical simulation complete!",
-                    "revealed_information": None,
-                    "stage": "complete",
-                    "requires_answer": False,
-                    "question_posed": None,
-                    "is_correct_path": None,
-                    "guidance": None,
-                    "hint_given": None,
-                    "available_hints": 0,
-                    "session_complete": True,
-                    "completion_data": data
-                }
         except Exception:
             pass
-        
-        # Fallback completion
+        return self._completion_response(
+            session, data, "Clinical simulation complete!" if data else "Session complete!"
+        )
+
+    def _completion_response(
+        self,
+        session: Dict,
+        data: Optional[Dict[str, Any]],
+        ai_response: str
+    ) -> Dict[str, Any]:
+        """The final turn of a session; analysis fields the model left out are filled from the recorded decisions."""
         score = len(session["correct_decisions"]) / max(len(session["correct_decisions"]) + len(session["incorrect_decisions"]), 1)
+        completion_data = {
+            "performance_summary": f"You made {len(session['correct_decisions'])} correct decisions.",
+            "correct_decisions": session["correct_decisions"],
+            "missed_points": session["incorrect_decisions"],
+            "clinical_reasoning_score": score,
+            "final_diagnosis_correct": score > 0.7,
+            "learning_points": ["Review the case", "Study related anatomy", "Practice clinical reasoning"],
+            "recommended_topics": ["cranial nerves", "stroke syndromes", "spinal cord injury"]
+        }
+        if isinstance(data, dict):
+            completion_data.update({key: value for key, value in data.items() if value is not None})
         return {
-            "ai_response": "Session complete!",
+            "ai_response": ai_response,
             "revealed_information": None,
             "stage": "complete",
             "requires_answer": False,
@@ -1075,13 +1489,5 @@ Provide comprehensive analysis. Format as JSON:
             "hint_given": None,
             "available_hints": 0,
             "session_complete": True,
-            "completion_data": {
-                "performance_summary": f"You made {len(session['correct_decisions'])} correct decisions.",
-                "correct_decisions": session["correct_decisions"],
-                "missed_points": session["incorrect_decisions"],
-                "clinical_reasoning_score": score,
-                "final_diagnosis_correct": score > 0.7,
-                "learning_points": ["Review the case", "Study related anatomy", "Practice clinical reasoning"],
-                "recommended_topics": ["cranial nerves", "stroke syndromes", "spinal cord injury"]
-            }
+            "completion_data": completion_data
         }
@@ -1,15 +1,26 @@
 """Socratic teaching method implementation with adaptive difficulty."""
 
+import re
+import threading
+import uuid
 from typing import List, Dict, Any, Optional
 import logging
 
+import numpy as np
+
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.chains import LLMChain
 
 from app.core.config import settings
+from app.core.prefetch import SpeculativePrefetcher
+from app.core.request_keys import normalize_text, request_key
+from app.core.token_stream import DeltaCallback, JsonFieldStreamer
+from app.core.ttl_cache import TTLCache
+from app.ingestion.chunk_summaries import ChunkSummarizer
 from app.rag.vector_store import VectorStore
 from app.models.schemas import DifficultyLevel
+from app.study.clinical_session_store import ClinicalSessionStore
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +28,16 @@ logger = logging.getLogger(__name__)
 class SocraticTutor:
     """Implements Socratic teaching method with progressive revelation."""
     
-    def __init__(self, vector_store: VectorStore):
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        prefetcher: Optional[SpeculativePrefetcher] = None,
+        summaries: Optional[ChunkSummarizer] = None
+    ):
         self.vector_store = vector_store
+        self.prefetcher = prefetcher
+        # Teaching context is built from per-chunk summaries when configured
+        self.summaries = summaries if settings.study_prompt_context == "summary" else None
         self.llm = ChatOpenAI(
             model=settings.openai_model,
             temperature=0.3,  # Slightly higher for more engaging questions
@@ -68,13 +87,163 @@ Format your response as JSON:
         ])
         
         self.teaching_chain = LLMChain(llm=self.llm, prompt=self.teaching_prompt)
+        
+        # Tutoring sessions: student responses and the chunk IDs pinned for the session, shared through SQLite
+        self.sessions = ClinicalSessionStore(
+            ttl_seconds=settings.tutor_session_ttl_seconds,
+            max_sessions=settings.tutor_session_max_sessions,
+            db_path=settings.tutor_session_store_path,
+            table="tutor_sessions"
+        )
+        self._lock = threading.Lock()
+        self.context_retrievals = 0
+        self.context_reuses = 0
+        # Opening turns (no answers yet) depend only on topic and difficulty
+        self.response_cache = TTLCache(settings.tutor_response_cache_ttl_seconds, settings.tutor_response_cache_max_entries)
+    
+    def teach_in_session(
+        self,
+        topic: str,
+        user_id: str,
+        difficulty_level: DifficultyLevel,
+        session_id: Optional[str] = None,
+        student_response: Optional[str] = None,
+        previous_responses: Optional[List[str]] = None,
+        on_delta: Optional[DeltaCallback] = None,
+        follow_next_step: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Run one turn of a server-side tutoring session.
+        
+        Unknown or missing session IDs start a new session (seeded with
+        `previous_responses`). The student's answers are kept on the server, and
+        the retrieved context is reused until the topic drifts, so a turn
+        normally costs one generation. With `follow_next_step`, the session
+        moves on to the next_step its last turn announced and starts that topic
+        afresh; this is the turn the prefetcher prepares. The response carries
+        the session_id and the topic taught. Sessions are only changed under
+        the tutor's lock, and the generation works on a copy of the responses.
+        """
+        with self._lock:
+            session = self.sessions.get(session_id) if session_id else None
+            if session is None or session["user_id"] != user_id:
+                session = {
+                    "session_id": str(uuid.uuid4()),
+                    "user_id": user_id,
+                    "responses": list(previous_responses or []),
+                    "topic": None,
+                    "difficulty": None,
+                    "chunk_ids": None,
+                    "topic_embedding": None
+                }
+            elif follow_next_step and session.get("next_step"):
+                topic = session["next_step"]
+                session["responses"] = []
+            elif previous_responses and len(previous_responses) > len(session["responses"]):
+                # Clients that still resend the full history
+                session["responses"] = list(previous_responses)
+            if student_response:
+                session["responses"].append(student_response)
+            self.sessions.save(session["session_id"], session)
+            responses = list(session["responses"])
+            pinned = {key: session[key] for key in ("topic", "difficulty", "chunk_ids", "topic_embedding")}
+        
+        before = dict(pinned)
+        chunks = self._pinned_context(pinned, topic, difficulty_level)
+        if pinned != before:
+            with self._lock:
+                session = self.sessions.get(session["session_id"]) or session
+                session.update(pinned)
+                self.sessions.save(session["session_id"], session)
+        result = self.teach(
+            topic=topic,
+            user_id=user_id,
+            difficulty_level=difficulty_level,
+            previous_responses=responses,
+            retrieved_chunks=chunks,
+            on_delta=on_delta
+        )
+        result["session_id"] = session["session_id"]
+        result["topic"] = topic
+        
+        next_step = result.get("next_step")
+        with self._lock:
+            session = self.sessions.get(session["session_id"]) or session
+            session["next_step"] = next_step
+            self.sessions.save(session["session_id"], session)
+        # While the student answers, prepare the opening turn a follow_next_step request will ask for
+        if self.prefetcher is not None and next_step and normalize_text(next_step) != normalize_text(topic):
+            self.prefetcher.submit(
+                ("tutor", normalize_text(next_step), difficulty_level),
+                lambda: self._prefetch_topic(next_step, difficulty_level)
+            )
+        return result
+    
+    def _prefetch_topic(self, topic: str, difficulty_level: DifficultyLevel) -> None:
+        """Warm the embedding and retrieval caches for a topic and, within budget, its opening turn."""
+        chunks = self.retrieve_context(topic, difficulty_level)
+        if not chunks:
+            return
+        if self.response_cache.get(request_key(topic, difficulty_level, self.vector_store.generation)) is not None:
+            return
+        if self.prefetcher.allow_generation():
+            self.teach(topic=topic, user_id="prefetch", difficulty_level=difficulty_level, retrieved_chunks=chunks)
+    
+    def _pinned_context(self, pinned: Dict[str, Any], topic: str, difficulty_level: DifficultyLevel) -> List[Dict[str, Any]]:
+        """
+        Reuse the session's chunks unless the topic (or difficulty) moved away from the pinned one.
+        
+        `pinned` holds the session's topic, difficulty, chunk_ids and topic_embedding and is
+        updated in place when the context is re-retrieved or the topic embedding is computed.
+        """
+        difficulty = difficulty_level.value if difficulty_level else None
+        drifted = pinned["chunk_ids"] is None or pinned["difficulty"] != difficulty
+        if not drifted and normalize_text(topic) != normalize_text(pinned["topic"]):
+            try:
+                if pinned["topic_embedding"] is None:
+                    anchor, current = self.vector_store.embed_queries([pinned["topic"], topic])
+                    pinned["topic_embedding"] = [float(x) for x in anchor]
+                else:
+                    current = self.vector_store.embed_queries([topic])[0]
+                current = np.asarray(current, dtype=np.float32)
+                anchor = np.asarray(pinned["topic_embedding"], dtype=np.float32)
+                denominator = float(np.linalg.norm(anchor) * np.linalg.norm(current))
+                similarity = float(anchor @ current / denominator) if denominator else 0.0
+                drifted = similarity < settings.tutor_topic_drift_similarity
+            except Exception as e:
+                logger.warning(f"Topic drift check failed, re-retrieving: {e}")
+                drifted = True
+        
+        if not drifted:
+            chunks = self.vector_store.get_chunks(pinned["chunk_ids"])
+            # Pinned chunks removed from the knowledge base since are re-retrieved
+            if len(chunks) == len(pinned["chunk_ids"]):
+                self.context_reuses += 1
+                return chunks
+        chunks = self.retrieve_context(topic, difficulty_level)
+        pinned["chunk_ids"] = [chunk["chunk_id"] for chunk in chunks]
+        pinned["topic"] = topic
+        pinned["difficulty"] = difficulty
+        pinned["topic_embedding"] = None
+        self.context_retrievals += 1
+        return chunks
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": self.sessions.get_stats()["sessions"],
+            "context_retrievals": self.context_retrievals,
+            "context_reuses": self.context_reuses,
+            "response_cache": self.response_cache.get_stats()
+        }
     
     def teach(
         self,
         topic: str,
         user_id: str,
         difficulty_level: DifficultyLevel,
-        previous_responses: List[str] = None
+        previous_responses: List[str] = None,
+        retrieved_chunks: Optional[List[Dict[str, Any]]] = None,
+        on_delta: Optional[DeltaCallback] = None
     ) -> Dict[str, Any]:
         """
         Conduct a Socratic teaching session.
@@ -84,6 +253,8 @@ Format your response as JSON:
             user_id: User identifier
             difficulty_level: Current difficulty level
             previous_responses: List of user's previous answers
+            retrieved_chunks: Context already retrieved for this session (skips retrieval)
+            on_delta: Called with (field, text) as the question, explanation and hint are generated
         
         Returns:
             Teaching response with question, explanation, hints, etc.
@@ -91,20 +262,8 @@ Format your response as JSON:
         previous_responses = previous_responses or []
         
         # Retrieve relevant context
-        filter_dict = {"difficulty_level": difficulty_level.value} if difficulty_level else None
-        retrieved_chunks = self.vector_store.search(
-            query=topic,
-            top_k=5,
-            filter_dict=filter_dict,
-            min_score=0.3
-        )
-        if not retrieved_chunks:
-            retrieved_chunks = self.vector_store.search(
-                query=topic,
-                top_k=5,
-                filter_dict=None,
-                min_score=0.2
-            )
+        if retrieved_chunks is None:
+            retrieved_chunks = self.retrieve_context(topic, difficulty_level)
 
         if not retrieved_chunks:
             return {
@@ -124,13 +283,34 @@ Format your response as JSON:
         
         # Generate teaching response
         try:
-            response_text = self.teaching_chain.run(
-                context=context,
-                topic=topic,
-                difficulty=difficulty_level.value,
-                previous_responses="\n".join([f"- {r}" for r in previous_responses]) if previous_responses else "None",
-                stage=stage
-            )
+            inputs = {
+                "context": context,
+                "topic": topic,
+                "difficulty": difficulty_level.value,
+                "previous_responses": "\n".join([f"- {r}" for r in previous_responses]) if previous_responses else "None",
+                "stage": stage
+            }
+            
+            cache_key = None
+            if not previous_responses:
+                cache_key = request_key(topic, difficulty_level, self.vector_store.generation)
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    if on_delta is not None:
+                        for field in ("question", "explanation", "hint"):
+                            if cached.get(field):
+                                on_delta(field, cached[field])
+                    return dict(cached)
+            
+            if on_delta is None:
+                response_text = self.teaching_chain.run(**inputs)
+            else:
+                streamer = JsonFieldStreamer(("question", "explanation", "hint"), on_delta)
+                parts = []
+                for chunk in (self.teaching_prompt | self.llm).stream(inputs):
+                    parts.append(chunk.content)
+                    streamer.feed(chunk.content)
+                response_text = "".join(parts)
             
             # Parse JSON response (LLM should return JSON)
             import json
@@ -145,6 +325,8 @@ Format your response as JSON:
                     f"Or what anatomical structure might be involved?"
                 )
             
+            if cache_key is not None and re.search(r'\{[^{}]*\}', response_text):
+                self.response_cache.set(cache_key, dict(response))
             return response
         except Exception as e:
             logger.error(f"Error in teaching: {str(e)}")
@@ -158,6 +340,24 @@ Format your response as JSON:
                 "concepts_covered": [topic]
             }
     
+    def retrieve_context(self, topic: str, difficulty_level: Optional[DifficultyLevel]) -> List[Dict[str, Any]]:
+        """Retrieve teaching context for a topic, relaxing the difficulty filter if nothing matches."""
+        filter_dict = {"difficulty_level": difficulty_level.value} if difficulty_level else None
+        retrieved_chunks = self.vector_store.search(
+            query=topic,
+            top_k=5,
+            filter_dict=filter_dict,
+            min_score=0.3
+        )
+        if not retrieved_chunks:
+            retrieved_chunks = self.vector_store.search(
+                query=topic,
+                top_k=5,
+                filter_dict=None,
+                min_score=0.2
+            )
+        return retrieved_chunks
+    
     def _determine_stage(self, num_responses: int, chunks: List[Dict[str, Any]]) -> str:
         """Determine the current teaching stage."""
         if num_responses == 0:
@@ -171,10 +371,17 @@ Format your response as JSON:
     
     def _format_context(self, chunks: List[Dict[str, Any]]) -> str:
         """Format chunks for teaching context."""
+        summaries = self.summaries.lookup(chunks) if self.summaries is not None else {}
         context_parts = []
         for chunk in chunks:
             context_parts.append(f"Structure: {chunk['metadata'].get('structure_name', 'N/A')}")
-            context_parts.append(f"Content: {chunk['content'][:500]}...")
+            summary = summaries.get(chunk["chunk_id"])
+            if summary:
+                context_parts.append(f"Summary: {summary.summary}")
+                if summary.key_terms:
+                    context_parts.append(f"Key terms: {', '.join(summary.key_terms)}")
+            else:
+                context_parts.append(f"Content: {chunk['content'][:500]}...")
             context_parts.append("---")
         return "\n".join(context_parts)
     
@@ -1,13 +1,14 @@
 """NeuraBuddy FastAPI application entry point."""
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 import logging
 import os
+import threading
 
-from app.api.routes import router
+from app.api.routes import router, study_engine, prefetcher, vector_store
 from app.core.config import settings
 from app.core.logging_config import logger
 
@@ -27,6 +28,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def track_foreground_requests(request: Request, call_next):
+    """Speculative prefetch waits while API requests are being handled."""
+    if not request.url.path.startswith("/api/"):
+        return await call_next(request)
+    with prefetcher.foreground():
+        return await call_next(request)
+
+
 # Include routers
 app.include_router(router, prefix="/api/v1", tags=["neurabuddy"])
 
@@ -62,6 +72,12 @@ async def startup_event():
     logger.info(f"OpenAI Model: {settings.openai_model}")
     logger.info(f"Embedding Model: {settings.openai_embedding_model}")
     logger.info(f"Vector Store: {settings.chroma_collection_name}")
+    if settings.clinical_case_pool_prefill:
+        study_engine.warm_case_pool()
+    if settings.kb_announce_on_startup:
+        # Chunks ingested while the server was down (e.g. by scripts/ingest_documents.py);
+        # chunks ingested by another process while it runs are picked up per request
+        threading.Thread(target=vector_store.announce_existing_chunks, name="kb-announce", daemon=True).start()
 
 
 @app.on_event("shutdown")